@@ -2,17 +2,106 @@ import requests
 import json
 import socket
 import logging
+import threading
+import time
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 
 #TODO: Dont hard code these, need to see how sugar as a whole manages API Keys
 API_URL = "https://ai.sugarlabs.org/ask-llm-prompted"
-with open("API_KEY.txt", "r") as f:
-    API_KEY = f.read().strip()
+API_KEY_FILE = "API_KEY.txt"
+# read from API_KEY_FILE the first time a question is asked
+API_KEY = None
 
 DEFAULT_PROMPT = "You are a friendly teacher named Jane who is 28 years old. You teach 10 year old children. Always give helpful, educational responses in simple words that children can understand. Keep your answers between 20-40 words. Be encouraging and enthusiastic but never use emojis(ever). If you notice spelling mistakes, gently correct them. Stay focused on the topic and give relevant answers."
 
+# Questions are asked from worker threads; they share one session, whose
+# connections to the server are kept alive between questions, so that only
+# the first question pays for the DNS lookup and the TCP and TLS handshakes.
+POOL_SIZE = 4
+
+_session = None
+_session_lock = threading.Lock()
+# the time the current thread spent opening connections in its last request
+_timing = threading.local()
+
+
+class _TimedConnection:
+    def connect(self):
+        start = time.monotonic()
+        try:
+            super().connect()
+        finally:
+            _timing.connect = getattr(_timing, "connect", 0.0) + time.monotonic() - start
+
+
+class _TimedHTTPConnection(_TimedConnection, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnection, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedAdapter(HTTPAdapter):
+    """HTTPAdapter timing the connections it opens (see _timing)."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+def _get_session():
+    """Return the session shared by all questions, creating it first."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = _TimedAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def close():
+    """Close the connections kept alive to the server."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def _get_api_key():
+    """Return the API key, reading it from API_KEY_FILE the first time,
+    or None if it can't be read."""
+    global API_KEY
+    if API_KEY is None:
+        try:
+            with open(API_KEY_FILE, "r") as f:
+                API_KEY = f.read().strip()
+        except OSError as e:
+            logging.error(f"Could not read the LLM API key: {e}")
+    return API_KEY
+
+
 def is_connected():
     try:
-        socket.create_connection(("8.8.8.8", 53), timeout=5)
+        socket.create_connection(("8.8.8.8", 53), timeout=5).close()
         logging.debug("Connection to 8.8.8.8 successful")
         return True
     except OSError:
@@ -23,8 +112,12 @@ def ask_llm_prompted(question, custom_prompt = DEFAULT_PROMPT, timeout=120, max_
     if not is_connected():
         return False
 
+    api_key = _get_api_key()
+    if api_key is None:
+        return False
+
     headers = {
-        "X-API-Key": API_KEY,
+        "X-API-Key": api_key,
         "Content-Type": "application/json"
     }
     
@@ -40,12 +133,24 @@ def ask_llm_prompted(question, custom_prompt = DEFAULT_PROMPT, timeout=120, max_
     }
     
     try:
-        response = requests.post(
+        _timing.connect = 0.0
+        start = time.monotonic()
+        response = _get_session().post(
             API_URL,
             headers=headers,
             data=json.dumps(payload),
             timeout=(10, timeout),
         )
+        # response.elapsed runs from sending the request, connecting
+        # included, until the headers of the response are in; post() also
+        # reads the body.
+        connect = _timing.connect
+        logging.info(
+            f"LLM request: connect {connect:.3f}s"
+            f"{'' if connect else ' (kept alive)'}, "
+            f"server {response.elapsed.total_seconds() - connect:.3f}s, "
+            f"total {time.monotonic() - start:.3f}s"
+        )
 
         if 500 <= response.status_code < 600:
             logging.error(f"Server error: {response.status_code}")
@@ -342,6 +342,11 @@ class SpeakActivity(activity.Activity):
         self._first_time = True
         self._new_instance()
 
+        if USING_BRAIN:
+            # load the likely brain in the background, so that the robot
+            # is ready to answer as soon as it is chosen
+            brain.preload()
+
         self._configure_cb()
         self._poll_accelerometer()
 
@@ -1349,11 +1354,12 @@ class SpeakActivity(activity.Activity):
                             if not response:
                                 response = self._try_slm_response(text)
                             
-                            if not response:
-                                response = brain.respond(text)
-
                             def safe_face_say():
-                                self.face.say(response)
+                                if response:
+                                    self.face.say(response)
+                                else:
+                                    # on the main loop, queued while a brain is loading
+                                    brain.respond(text, self.face.say)
                                 return False
                             GLib.idle_add(safe_face_say)
                         
@@ -1365,20 +1371,23 @@ class SpeakActivity(activity.Activity):
                     else:
                         # No internet, try SLM -> Brain
                         response = self._try_slm_response(text)
-                        if not response:
-                            response = brain.respond(text)
-                        self.face.say(response)
+                        if response:
+                            self.face.say(response)
+                        else:
+                            brain.respond(text, self.face.say)
                 else:
-                    # Use traditional brain chatbot
-                    brain_response = brain.respond(text)
+                    # Use traditional brain chatbot.  Questions asked while
+                    # the brain is loading are answered once it is ready.
+                    def say_brain_response(brain_response):
+                        if not is_profane(text):
+                            brain_response = "Sorry, looks like you have entered a blacklisted word. Please try typing something else."
+
+                        if not is_profane(brain_response):
+                            brain_response = "Sorry, I was not able to generate this response. Profanity intercept."
 
-                    if not is_profane(text):
-                        brain_response = "Sorry, looks like you have entered a blacklisted word. Please try typing something else."
-                    
-                    if not is_profane(brain_response):
-                        brain_response = "Sorry, I was not able to generate this response. Profanity intercept."
+                        self.face.say(brain_response)
 
-                    self.face.say(brain_response)
+                    brain.respond(text, say_brain_response)
             else:
                 if not is_profane(text):
                     text = "Sorry, looks like you have entered a blacklisted word. Please try typing something else."
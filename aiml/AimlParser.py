@@ -36,6 +36,9 @@ class AimlHandler(ContentHandler):
 
     def __init__(self, encoding=None):
         self.categories = {}
+        # called with the key and template of each category as soon as
+        # it is parsed; see setCategorySink()
+        self._sink = self.categories.__setitem__
         self._encoding = encoding
         self._state = self._STATE_OutsideAiml
         self._version = ""
@@ -87,6 +90,16 @@ class AimlHandler(ContentHandler):
         """
         self._encoding = encoding
 
+    def setCategorySink(self, sink):
+        """
+        Hand each category to sink(key, template) as soon as its end tag
+        is read, instead of storing it in self.categories.  key is the
+        category's (pattern, that, topic) tuple.  This way the categories
+        of a file can be learned, written out or checked without ever
+        holding all of them in memory.
+        """
+        self._sink = sink
+
     def _location(self):
         "Return a string describing the current location in the source file."
         line = self._locator.getLineNumber()
@@ -376,10 +389,10 @@ class AimlHandler(ContentHandler):
             if self._state != self._STATE_AfterTemplate:
                 raise AimlParserError( "Unexpected </category> tag "+self._location() )
             self._state = self._STATE_InsideAiml
-            # End the current category.  Store the current pattern/that/topic and
-            # element in the categories dictionary.
+            # End the current category.  Hand the current pattern/that/topic
+            # and element to the sink (by default, the categories dictionary).
             key = (self._currentPattern.strip(), self._currentThat.strip(),self._currentTopic.strip())
-            self.categories[key] = self._elemStack[-1]
+            self._sink(key, self._elemStack[-1])
             self._whitespaceBehaviorStack.pop()
         elif name == "pattern":
             # </pattern> tags are only legal in the InsidePattern state
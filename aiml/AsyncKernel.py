@@ -0,0 +1,101 @@
+"""This module implements the AsyncKernel class, a Kernel with an asyncio
+front-end.
+
+    kernel = AsyncKernel()
+    kernel.bootstrap(brainFile="bot.brn")
+    response = await kernel.arespond("Hello", "some session")
+
+arespond() runs Kernel.respond() in a bounded pool of worker threads, so
+the event loop (and every other conversation) goes on while a reply is
+being worked out.  Replies to the same session are worked out one after
+the other, in the order arespond() was called; replies to different
+sessions run side by side (see Kernel.respond()).
+
+Cancelling an arespond() that hasn't started yet withdraws the input, as
+if it had never been sent.  A reply that is already running is finished
+in the background (the Kernel can't be interrupted mid-template), and the
+replies queued after it in the same session still wait for it.
+
+At most maxPending calls to arespond() are queued or running at a time;
+beyond that, arespond() waits for a slot to free up before queueing its
+input, which slows down callers sending more than the Kernel can answer.
+
+This module requires Python 3.7 or later.
+
+"""
+
+from __future__ import print_function
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from .Kernel import Kernel
+
+
+class AsyncKernel(Kernel):
+    _maxWorkers = 4     # default number of worker threads
+    _maxPending = 64    # default number of queued or running replies
+
+    def __init__(self, maxWorkers=None, maxPending=None):
+        Kernel.__init__(self)
+        self._executor = ThreadPoolExecutor(maxWorkers or self._maxWorkers)
+        self._maxPendingReplies = maxPending or self._maxPending
+        # bounds the pending replies; created in the event loop of the
+        # first call to arespond()
+        self._slots = None
+        self._slotsLoop = None
+        self._pendingReplies = 0
+        # maps each session ID to a future resolved once the last reply
+        # queued for it is over
+        self._tails = {}
+
+    async def arespond(self, input_, sessionID=Kernel._globalSessionID):
+        """Return the Kernel's response to the input string, like
+        respond(), without blocking the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        if self._slotsLoop is not loop and self._pendingReplies == 0:
+            self._slots = asyncio.Semaphore(self._maxPendingReplies)
+            self._slotsLoop = loop
+        await self._slots.acquire()
+        self._pendingReplies += 1
+
+        previous = self._tails.get(sessionID)
+        done = loop.create_future()
+        self._tails[sessionID] = done
+        reply = None
+        try:
+            if previous is not None:
+                # shielded, so that cancelling this reply leaves the
+                # previous one alone
+                await asyncio.shield(previous)
+            reply = self._executor.submit(self.respond, input_, sessionID)
+            return await asyncio.wrap_future(reply)
+        finally:
+            # The next reply in this session may start once this one is
+            # really over: after the previous one if it never started,
+            # or once the worker thread has finished it.
+            if reply is not None:
+                reply.add_done_callback(lambda f: loop.call_soon_threadsafe(
+                    self._finish, sessionID, done))
+            elif previous is not None and not previous.done():
+                previous.add_done_callback(lambda f: self._finish(sessionID, done))
+            else:
+                self._finish(sessionID, done)
+
+    def _finish(self, sessionID, done):
+        """Mark a reply queued by arespond() as over."""
+        done.set_result(None)
+        if self._tails.get(sessionID) is done:
+            del self._tails[sessionID]
+        self._pendingReplies -= 1
+        self._slots.release()
+
+    def pending(self):
+        """Return the number of replies queued or running."""
+        return self._pendingReplies
+
+    def close(self):
+        """Wait for the running replies to finish, and stop the worker
+        threads."""
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,208 @@
+"""This module implements the BrainBuilder class, which builds compact
+brain files from AIML files incrementally.
+
+Next to the brain, a BrainBuilder keeps a manifest (a JSON file) listing
+every AIML file the brain was built from, the SHA-1 hash of its contents
+and the [pattern/that/topic] keys of the categories it contributed.  The
+brain file also holds the bot predicates and word substitutions of the
+Kernel given to the BrainBuilder (see Kernel.saveBrain()), and is written
+again when they change.  When
+the brain is built again, only the files whose hash changed are parsed,
+and their categories are patched into the stored trie (see
+CompactPatternMgr.patch()) instead of learning every file from scratch.
+
+As with Kernel.learn(), when several files define the same category the
+last one wins, so the result is the same as a full build from the same
+files in the same order.
+
+A full build streams each file straight into the trie, category by
+category (see Kernel._streamFile()), so that memory holds the trie and
+nothing more, however many files there are.  A file with malformed XML
+contributes the categories before the error, in full builds and patches
+alike.
+
+"""
+
+from __future__ import print_function
+
+import hashlib
+import json
+import os
+import time
+
+from .CompactPatternMgr import CompactPatternMgr, isCompactBrain
+from .Kernel import Kernel
+from .PatternMgr import PatternMgr
+
+MANIFEST_VERSION = 1
+
+
+class BrainBuilder:
+    # Patched brains waste the space of the categories they replace.  Once
+    # a brain has grown by this factor since its last full build, it is
+    # built from scratch again.
+    _maxGrowth = 1.5
+
+    def __init__(self, brainFile, manifestFile=None, kernel=None):
+        self._brainFile = brainFile
+        self._manifestFile = manifestFile or brainFile + ".manifest"
+        # the Kernel used to parse AIML files, whose bot predicates and
+        # subbers are saved with the brain
+        self._kernel = kernel
+        if self._kernel is None:
+            self._kernel = Kernel()
+            self._kernel.verbose(False)
+        self._verboseMode = True
+
+    def verbose(self, isVerbose=True):
+        """Enable/disable verbose output mode."""
+        self._verboseMode = isVerbose
+
+    def build(self, filenames, full=False, processes=1):
+        """Bring the brain up to date with the AIML files in filenames,
+        learned in that order.  If full is True, or there is no usable
+        manifest, the brain is built from scratch.
+
+        The files to patch in are parsed in a pool of that many worker
+        processes (see Kernel.learn_many()); None means one per CPU.  A
+        full build parses them one at a time, as it learns them.
+
+        Returns the list of files that were parsed.
+
+        """
+        start = time.time()
+        self._processes = processes
+        files = []
+        for f in filenames:
+            with open(f, "rb") as inFile:
+                files.append((f, hashlib.sha1(inFile.read()).hexdigest()))
+
+        manifest = None if full else self._loadManifest()
+        if manifest is not None:
+            oldNames = [entry["name"] for entry in manifest["files"]]
+            newNames = [f for f, digest in files]
+            # A file moving relative to the others can change which one
+            # wins a category.
+            if [f for f in newNames if f in oldNames] != [f for f in oldNames if f in newNames]:
+                manifest = None
+            elif os.path.getsize(self._brainFile) > self._maxGrowth * manifest["fullSize"]:
+                manifest = None
+        if manifest is None:
+            parsed = self._fullBuild(files)
+        else:
+            parsed = self._patch(files, manifest)
+        if self._verboseMode:
+            print("%s: parsed %d of %d files in %.2f seconds" % (
+                self._brainFile, len(parsed), len(files), time.time() - start))
+        return parsed
+
+    def _loadManifest(self):
+        """Return the manifest of the brain, or None if there is no brain
+        or no manifest matching it.
+        """
+        if not (os.path.exists(self._manifestFile) and
+                os.path.exists(self._brainFile) and
+                isCompactBrain(self._brainFile)):
+            return None
+        try:
+            with open(self._manifestFile) as inFile:
+                manifest = json.load(inFile)
+        except ValueError:
+            return None
+        if manifest.get("version") != MANIFEST_VERSION:
+            return None
+        return manifest
+
+    def _parse(self, filenames):
+        """Return a dictionary mapping each of filenames to its categories
+        (none if it can't be parsed).
+        """
+        results = self._kernel._parseFiles(filenames, self._processes,
+                                           partial=True)
+        return dict((f, categories or {})
+                    for f, categories in zip(filenames, results))
+
+    def _fullBuild(self, files):
+        """Learn every file from scratch."""
+        brain = PatternMgr()
+        entries = []
+        for f, digest in files:
+            # the keys of the file, in order, once each
+            keys = {}
+            def learn(key, tem):
+                brain.add(key, tem)
+                keys[key] = None
+            self._kernel._streamFile(f, learn)
+            entries.append((f, digest, list(keys)))
+        self._save(CompactPatternMgr.fromPatternMgr(brain), entries, None)
+        return [f for f, digest in files]
+
+    def _patch(self, files, manifest):
+        """Parse the files that changed since the manifest was written,
+        and patch their categories into the brain.
+        """
+        old = dict((entry["name"], entry) for entry in manifest["files"])
+        changed = set(f for f, digest in files
+                      if f not in old or old[f]["sha1"] != digest)
+        gone = set(old) - set(f for f, digest in files)
+        if not changed and not gone and \
+                manifest.get("state") == self._kernel.stateDigest():
+            return []
+
+        # the categories that may end up with a different template: those
+        # of the changed and deleted files, before and after the change.
+        removed = set()
+        for f in changed | gone:
+            if f in old:
+                removed.update(tuple(key) for key in old[f]["categories"])
+        categories = self._parse([f for f, digest in files if f in changed])
+        affected = set(removed)
+        for f in changed:
+            affected.update(categories[f])
+        # Unchanged files defining any of them must be parsed again, so
+        # that the last file defining a category still wins.
+        keys = {}
+        conflicting = []
+        for f, digest in files:
+            if f in changed:
+                keys[f] = list(categories[f])
+            else:
+                keys[f] = [tuple(key) for key in old[f]["categories"]]
+                if not affected.isdisjoint(keys[f]):
+                    conflicting.append(f)
+        categories.update(self._parse(conflicting))
+
+        added = []
+        for f, digest in files:
+            if f in categories:
+                added.extend((key, tem) for key, tem in categories[f].items()
+                             if key in affected)
+        brain = CompactPatternMgr()
+        brain.restore(self._brainFile)
+        brain.patch(removed, added)
+        entries = [(f, digest, keys[f]) for f, digest in files]
+        self._save(brain, entries, manifest["fullSize"])
+        return [f for f, digest in files if f in categories]
+
+    def _save(self, brain, entries, fullSize):
+        """Write the brain and its manifest.  fullSize is the size of the
+        brain after its last full build, or None if this is one.
+        """
+        # The brain may be a map of the file being replaced; never write
+        # into it.
+        tmpFile = self._brainFile + ".tmp"
+        brain.save(tmpFile)
+        self._kernel.saveState(tmpFile)
+        os.replace(tmpFile, self._brainFile)
+        if fullSize is None:
+            fullSize = os.path.getsize(self._brainFile)
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "fullSize": fullSize,
+            "state": self._kernel.stateDigest(),
+            "files": [{"name": f, "sha1": digest,
+                       "categories": [list(key) for key in keys]}
+                      for f, digest, keys in entries],
+        }
+        with open(self._manifestFile, "w") as outFile:
+            json.dump(manifest, outFile)
@@ -0,0 +1,493 @@
+'''
+A read-only, array-backed alternative to the dictionary trie used by
+PatternMgr.
+
+Every distinct pattern word is interned once and given an integer ID.  The
+node tree is flattened into a handful of arrays: the children of node N are
+the slice childStart[N]:childEnd[N] of the childKey/childNode arrays
+(sorted by word ID, so lookups are a binary search), and templateIndex[N]
+is the index of the node's template, or -1.  Templates are marshalled one
+after another into a single byte string and decoded when they are matched;
+each distinct template is stored once, and the nodes sharing it have the
+same index.
+
+A CompactPatternMgr is built from an ordinary PatternMgr (usually one just
+restored from a .brn file) with fromPatternMgr().  It matches exactly like
+the PatternMgr it was built from, but needs a fraction of the memory.
+It can't learn new categories with add(), but patch() can change a
+handful of categories in place, which is how brains are rebuilt
+incrementally (see BrainBuilder).
+
+Compact brains are saved in a versioned file format laid out exactly like
+the arrays above, every section aligned to 8 bytes.  restore() does not
+read the file: it maps it into memory and uses the sections in place.
+Words are looked up with a binary search over the sorted word table (and
+remembered once found), and templates are unmarshalled when matched, so
+restoring costs almost nothing and only the pages of the brain that are
+actually used are ever read.
+'''
+
+from __future__ import print_function
+
+import marshal
+import mmap
+import pprint
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+
+from .constants import *
+from .PatternMgr import PatternMgr
+
+# File signature and format version of a saved CompactPatternMgr
+MAGIC = b"PYAIMLCB"
+FORMAT_VERSION = 3
+
+# magic, version, byte order (0 = little, 1 = big), template count
+_HEADER = struct.Struct("<8sIII")
+# offset and length of each section
+_SECTION = struct.Struct("<QQ")
+_ALIGN = 8
+
+
+def isCompactBrain(filename):
+    """Return True if filename was written by CompactPatternMgr.save()."""
+    with open(filename, "rb") as inFile:
+        return inFile.read(len(MAGIC)) == MAGIC
+
+
+class CompactPatternMgr(PatternMgr):
+    # Word IDs below this value are the special keys inherited from
+    # PatternMgr (_UNDERSCORE, _STAR, ... _BOT_NAME).
+    _FIRST_WORD_ID = 6
+    _NO_TEMPLATE = -1
+    _readOnly = True
+
+    # The sections of a brain file, in file order.  Each one but the first
+    # (the bot name) is an array of C ints or a byte string.
+    _SECTIONS = ("_botNameData", "_wordOffsets", "_wordData", "_childStart",
+                 "_childEnd", "_childKey", "_childNode", "_templateIndex",
+                 "_templateOffsets", "_templateData")
+    _BYTE_SECTIONS = ("_botNameData", "_wordData", "_templateData")
+
+    def __init__(self):
+        PatternMgr.__init__(self)
+        self._root = 0
+        # Maps words to IDs.  For a mapped brain this is only a cache of
+        # the words looked up so far.
+        self._wordIds = {}
+        self._lazyWords = False
+        self._wordOffsets = array("i", [0])
+        self._wordData = b""
+        self._childStart = array("i", [0])
+        self._childEnd = array("i", [0])
+        self._childKey = array("i")
+        self._childNode = array("i")
+        self._templateIndex = array("i", [self._NO_TEMPLATE])
+        self._templateOffsets = array("i", [0])
+        self._templateData = b""
+        # maps the marshalled form of each template to its index; built
+        # when first needed by patch()
+        self._templateIds = None
+        self._map = None
+
+    @classmethod
+    def fromPatternMgr(cls, mgr):
+        """Build a CompactPatternMgr holding the same patterns as mgr."""
+        compact = cls()
+        compact._build(mgr._root)
+        compact._templateCount = mgr._templateCount
+        compact._botName = mgr._botName
+        return compact
+
+    def _build(self, root):
+        """Flatten the dictionary trie rooted at root."""
+        # Intern the words in sorted order, so that word IDs sort the same
+        # way as the words themselves (and as their UTF-8 encodings).
+        words = set()
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            for key, child in node.items():
+                if key == self._TEMPLATE:
+                    continue
+                if not isinstance(key, int):
+                    words.add(key)
+                stack.append(child)
+        words = sorted(words)
+        self._wordIds = dict((w, i + self._FIRST_WORD_ID)
+                             for i, w in enumerate(words))
+        wordOffsets = array("i", [0])
+        wordData = []
+        size = 0
+        for w in words:
+            data = w.encode("utf-8")
+            size += len(data)
+            wordOffsets.append(size)
+            wordData.append(data)
+        self._wordOffsets = wordOffsets
+        self._wordData = b"".join(wordData)
+
+        # Number the nodes breadth-first, so that the children of each
+        # node follow those of the previous one.
+        childStart = array("i")
+        childEnd = array("i")
+        childKey = array("i")
+        childNode = array("i")
+        templateIndex = array("i")
+        templateOffsets = array("i", [0])
+        templateData = []
+        templateIds = {}
+        size = 0
+        queue = [root]
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            edges = []
+            for key, child in node.items():
+                if key == self._TEMPLATE:
+                    continue
+                keyId = key if isinstance(key, int) else self._wordIds[key]
+                edges.append((keyId, child))
+            edges.sort(key=lambda edge: edge[0])
+            childStart.append(len(childKey))
+            for keyId, child in edges:
+                childKey.append(keyId)
+                childNode.append(len(queue))
+                queue.append(child)
+            childEnd.append(len(childKey))
+            if self._TEMPLATE in node:
+                data = marshal.dumps(node[self._TEMPLATE])
+                index = templateIds.get(data)
+                if index is None:
+                    index = templateIds[data] = len(templateOffsets) - 1
+                    size += len(data)
+                    templateOffsets.append(size)
+                    templateData.append(data)
+                templateIndex.append(index)
+            else:
+                templateIndex.append(self._NO_TEMPLATE)
+        self._childStart = childStart
+        self._childEnd = childEnd
+        self._childKey = childKey
+        self._childNode = childNode
+        self._templateIndex = templateIndex
+        self._templateOffsets = templateOffsets
+        self._templateData = b"".join(templateData)
+
+    def numNodes(self):
+        """Return the number of nodes in the trie."""
+        return len(self._templateIndex)
+
+    def numWords(self):
+        """Return the number of distinct pattern words."""
+        return len(self._wordOffsets) - 1
+
+    def add(self, data, template):
+        """CompactPatternMgr is read-only.  Use thaw() to get a PatternMgr
+        that can learn new categories.
+        """
+        raise TypeError("CompactPatternMgr is read-only; use thaw() first")
+
+    def patch(self, removed=(), added=()):
+        """Change a few categories in place.  The [pattern/that/topic]
+        tuples in removed are deleted first, then the (tuple, template)
+        pairs in added are added, later pairs replacing the templates of
+        earlier ones.
+
+        Existing nodes and templates are never moved: changed child lists
+        and new templates are appended to the arrays, and the space taken
+        by the ones they replace is only reclaimed by building the brain
+        from scratch.  A mapped brain is first copied into memory.
+        """
+        self._makeWritable()
+        added = list(added)
+        self._addWords(key for data, template in added
+                       for key in self._path(data) if not isinstance(key, int))
+        for data in removed:
+            self._remove(data)
+        for data, template in added:
+            self._add(data, template)
+
+    def _makeWritable(self):
+        """Replace the sections that are views of a mapped file with
+        writable copies.
+        """
+        if self._map is None:
+            return
+        for name in self._SECTIONS:
+            data = getattr(self, name)
+            if name in self._BYTE_SECTIONS:
+                setattr(self, name, bytes(data))
+            elif not isinstance(data, array):
+                a = array("i")
+                a.frombytes(data.tobytes())
+                setattr(self, name, a)
+        self._map = None
+
+    def _addWords(self, words):
+        """Intern the words that are not known yet, renumbering the others
+        so that word IDs keep the order of the words.
+        """
+        new = sorted(set(w for w in words if self._wordId(w) is None))
+        if len(new) == 0:
+            return
+        old = [self._word(i + self._FIRST_WORD_ID) for i in range(self.numWords())]
+        # the new ID of every old word
+        renumber = [i + self._FIRST_WORD_ID + bisect_left(new, w)
+                    for i, w in enumerate(old)]
+        first = self._FIRST_WORD_ID
+        self._childKey = array("i", [k if k < first else renumber[k - first]
+                                     for k in self._childKey])
+        wordOffsets = array("i", [0])
+        wordData = []
+        size = 0
+        for w in sorted(old + new):
+            data = w.encode("utf-8")
+            size += len(data)
+            wordOffsets.append(size)
+            wordData.append(data)
+        self._wordOffsets = wordOffsets
+        self._wordData = b"".join(wordData)
+        self._wordIds = {}
+        self._lazyWords = True
+
+    def _add(self, data, template):
+        """Add a category to a writable CompactPatternMgr."""
+        node = self._root
+        for key in self._path(data):
+            child = self._child(node, key)
+            if child is None:
+                child = len(self._templateIndex)
+                self._childStart.append(len(self._childKey))
+                self._childEnd.append(len(self._childKey))
+                self._templateIndex.append(self._NO_TEMPLATE)
+                if not isinstance(key, int):
+                    key = self._wordId(key)
+                self._addEdge(node, key, child)
+            node = child
+        if self._templateIndex[node] == self._NO_TEMPLATE:
+            self._templateCount += 1
+        self._templateIndex[node] = self._addTemplate(template)
+
+    def _addTemplate(self, template):
+        """Return the index of template in a writable CompactPatternMgr,
+        appending it to the templates if it isn't there yet.
+        """
+        if self._templateIds is None:
+            self._templateIds = {}
+            for index in range(len(self._templateOffsets) - 2, -1, -1):
+                start = self._templateOffsets[index]
+                end = self._templateOffsets[index+1]
+                self._templateIds[bytes(self._templateData[start:end])] = index
+        data = marshal.dumps(self._internTemplate(template))
+        index = self._templateIds.get(data)
+        if index is None:
+            index = self._templateIds[data] = len(self._templateOffsets) - 1
+            self._templateData += data
+            self._templateOffsets.append(len(self._templateData))
+        return index
+
+    def _addEdge(self, node, keyId, child):
+        """Add the edge keyId -> child to the children of node."""
+        start = self._childStart[node]
+        end = self._childEnd[node]
+        i = bisect_left(self._childKey, keyId, start, end)
+        if end == len(self._childKey):
+            # the last child list can grow where it is
+            self._childKey.insert(i, keyId)
+            self._childNode.insert(i, child)
+        else:
+            keys = self._childKey[start:end]
+            nodes = self._childNode[start:end]
+            keys.insert(i - start, keyId)
+            nodes.insert(i - start, child)
+            self._childStart[node] = len(self._childKey)
+            self._childKey.extend(keys)
+            self._childNode.extend(nodes)
+        self._childEnd[node] = len(self._childKey)
+
+    def _remove(self, data):
+        """Remove a category from a writable CompactPatternMgr, along with
+        the nodes that lead to nothing else.  Returns False if there was no
+        such category.
+        """
+        node = self._root
+        path = []
+        for key in self._path(data):
+            child = self._child(node, key)
+            if child is None:
+                return False
+            path.append((node, child))
+            node = child
+        if self._templateIndex[node] == self._NO_TEMPLATE:
+            return False
+        self._templateIndex[node] = self._NO_TEMPLATE
+        self._templateCount -= 1
+        for parent, child in reversed(path):
+            if (self._templateIndex[child] != self._NO_TEMPLATE or
+                    self._childStart[child] != self._childEnd[child]):
+                break
+            # unlink the empty child, shifting the rest of the list
+            start = self._childStart[parent]
+            end = self._childEnd[parent]
+            i = self._childNode.index(child, start, end)
+            self._childKey[i:end-1] = self._childKey[i+1:end]
+            self._childNode[i:end-1] = self._childNode[i+1:end]
+            self._childEnd[parent] = end - 1
+        return True
+
+    def thaw(self):
+        """Return an ordinary, writable PatternMgr with the same patterns."""
+        mgr = PatternMgr()
+        mgr._root = self._thawNode(self._root)
+        mgr._templateCount = self._templateCount
+        mgr._botName = self._botName
+        return mgr
+
+    def _thawNode(self, node):
+        """Rebuild the dictionary subtree rooted at node."""
+        result = {}
+        for i in range(self._childStart[node], self._childEnd[node]):
+            key = self._childKey[i]
+            if key >= self._FIRST_WORD_ID:
+                key = self._word(key)
+            result[key] = self._thawNode(self._childNode[i])
+        template = self._nodeTemplate(node)
+        if template is not None:
+            result[self._TEMPLATE] = template
+        return result
+
+    def dump(self):
+        """Print all learned patterns, for debugging purposes."""
+        pprint.pprint(self._thawNode(self._root))
+
+    def save(self, filename):
+        """Dump the current patterns to the file specified by filename.  To
+        restore later, use restore().
+        """
+        self._botNameData = self._botName.encode("utf-8")
+        try:
+            with open(filename, "wb") as outFile:
+                outFile.write(_HEADER.pack(MAGIC, FORMAT_VERSION,
+                                           sys.byteorder == "big",
+                                           self._templateCount))
+                offset = _HEADER.size + len(self._SECTIONS) * _SECTION.size
+                sections = []
+                for name in self._SECTIONS:
+                    offset += -offset % _ALIGN
+                    data = memoryview(getattr(self, name)).cast("B")
+                    outFile.write(_SECTION.pack(offset, len(data)))
+                    sections.append((offset, data))
+                    offset += len(data)
+                for offset, data in sections:
+                    outFile.write(b"\0" * (offset - outFile.tell()))
+                    outFile.write(data)
+        except Exception as e:
+            print( "Error saving PatternMgr to file %s:" % filename )
+            raise
+
+    def restore(self, filename):
+        """Restore a previously save()d collection of patterns.
+
+        The file is mapped into memory rather than read, and must not be
+        modified for as long as this object is in use.
+        """
+        try:
+            with open(filename, "rb") as inFile:
+                header = inFile.read(_HEADER.size)
+                magic, version, bigEndian, templateCount = _HEADER.unpack(header)
+                if magic != MAGIC:
+                    raise ValueError("%s is not a compact brain file" % filename)
+                if version != FORMAT_VERSION:
+                    raise ValueError("%s has unsupported brain format version %d"
+                                     % (filename, version))
+                brainMap = mmap.mmap(inFile.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception as e:
+            print( "Error restoring PatternMgr from file %s:" % filename )
+            raise
+        view = memoryview(brainMap)
+        swap = bool(bigEndian) != (sys.byteorder == "big")
+        for i, name in enumerate(self._SECTIONS):
+            offset, length = _SECTION.unpack_from(
+                view, _HEADER.size + i * _SECTION.size)
+            data = view[offset:offset+length]
+            if name in self._BYTE_SECTIONS:
+                setattr(self, name, data)
+            elif swap:
+                # Brains written on a machine of the other byte order can't
+                # be used in place.
+                a = array("i", data.tobytes())
+                a.byteswap()
+                setattr(self, name, a)
+            else:
+                setattr(self, name, data.cast("i"))
+        # The sections are views of the map; keep it open while they live.
+        self._map = brainMap
+        self._templateCount = templateCount
+        self._botName = unicode(self._botNameData.tobytes().decode("utf-8"))
+        self._wordIds = {}
+        self._lazyWords = True
+        self._templateIds = None
+
+    def _word(self, wordId):
+        """Return the word with the given ID."""
+        i = wordId - self._FIRST_WORD_ID
+        start = self._wordOffsets[i]
+        end = self._wordOffsets[i+1]
+        return unicode(bytes(self._wordData[start:end]).decode("utf-8"))
+
+    def _wordId(self, word):
+        """Return the ID of word, or None if it appears in no pattern."""
+        wordId = self._wordIds.get(word)
+        if wordId is not None or not self._lazyWords:
+            return wordId
+        # Binary search over the sorted word table.
+        key = word.encode("utf-8")
+        lo = 0
+        hi = self.numWords()
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = self._wordOffsets[mid]
+            end = self._wordOffsets[mid+1]
+            if bytes(self._wordData[start:end]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.numWords():
+            start = self._wordOffsets[lo]
+            end = self._wordOffsets[lo+1]
+            if bytes(self._wordData[start:end]) == key:
+                wordId = lo + self._FIRST_WORD_ID
+                self._wordIds[word] = wordId
+        return wordId
+
+    def _nodeId(self, node):
+        """Nodes are identified by their integer IDs."""
+        return node
+
+    def _child(self, node, key):
+        """Return the ID of the child of node reached through key, or
+        None if there is no such child.
+        """
+        if not isinstance(key, int):
+            key = self._wordId(key)
+            if key is None:
+                return None
+        lo = self._childStart[node]
+        hi = self._childEnd[node]
+        i = bisect_left(self._childKey, key, lo, hi)
+        if i < hi and self._childKey[i] == key:
+            return self._childNode[i]
+        return None
+
+    def _nodeTemplate(self, node):
+        """Decode and return the template stored at node, or None."""
+        index = self._templateIndex[node]
+        if index == self._NO_TEMPLATE:
+            return None
+        start = self._templateOffsets[index]
+        end = self._templateOffsets[index+1]
+        return marshal.loads(self._templateData[start:end])
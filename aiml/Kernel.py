@@ -3,17 +3,20 @@
 
 from __future__ import print_function
 
-import copy
 import glob
+import hashlib
+import multiprocessing
 import os
 import random
+import marshal
 import re
 import string
+import struct
 import sys
 import time
 import threading
 import xml.sax
-from collections import namedtuple
+from collections import namedtuple, deque
 try:
     from ConfigParser import ConfigParser
 except ImportError:
@@ -23,9 +26,46 @@ from .constants import *
 from . import DefaultSubs
 from . import Utils
 from .AimlParser import create_parser
+from .CompactPatternMgr import CompactPatternMgr, isCompactBrain
+from .OverlayPatternMgr import OverlayPatternMgr
 from .PatternMgr import PatternMgr
+from .SessionStore import SessionStore
+from .ShardedPatternMgr import ShardedPatternMgr, isShardedBrain
+from .Stats import StatsCollector, timer
+from .TemplateCompiler import TemplateCompiler
 from .WordSub import WordSub
 
+# Brain files may end with the state of the Kernel that saved them (see
+# Kernel.saveBrain()): the marshalled state, then this trailer holding its
+# length and a signature.
+_STATE_MAGIC = b"PYAIMLKS"
+_STATE_VERSION = 1
+_STATE_TRAILER = struct.Struct("<Q8s")
+
+
+def _streamAimlFile(filename, encoding, sink):
+    """Parse an AIML file, handing each category to sink(key, template)
+    as soon as it is read (see AimlHandler.setCategorySink()).  Returns
+    None, or the parse error as a string, in which case the categories
+    before the error have been handed to sink already.
+    """
+    parser = create_parser()
+    handler = parser.getContentHandler()
+    handler.setEncoding(encoding)
+    handler.setCategorySink(sink)
+    try: parser.parse(filename)
+    except xml.sax.SAXParseException as msg:
+        return str(msg)
+    return None
+
+
+def _parseAimlFile(args):
+    """Parse an AIML file in a worker process of Kernel._parseFiles().
+    Returns the categories and the parse error as a string (or None).
+    """
+    filename, encoding = args
+    categories = {}
+    return categories, _streamAimlFile(filename, encoding, categories.__setitem__)
 
 
 def msg_encoder(encoding=None):
@@ -49,20 +89,65 @@ class Kernel:
     _globalSessionID = "_global" # key of the global session (duh)
     _maxHistorySize = 10 # maximum length of the _inputs and _responses lists
     _maxRecursionDepth = 100 # maximum number of recursive <srai>/<sr> tags before the response is aborted.
+    _responseCacheSize = 1000 # default number of responses to side-effect-free templates to remember
+    _impurityCacheSize = 10000 # number of categories whose template impurities are remembered
+    _sessionLockCount = 64 # number of locks shared out among the sessions; see respond()
     # special predicate keys
-    _inputHistory = "_inputHistory"     # keys to a queue (list) of recent user input
-    _outputHistory = "_outputHistory"   # keys to a queue (list) of recent responses.
+    _inputHistory = "_inputHistory"     # keys to a queue (deque) of recent user input
+    _outputHistory = "_outputHistory"   # keys to a queue (deque) of recent responses.
     _inputStack = "_inputStack"         # Should always be empty in between calls to respond()
+    _matchStack = "_matchStack"         # The Match of each input on the _inputStack
+
+    # Elements whose value depends on more than the input, that and topic
+    # being matched (or the bot's brain, predicates and substitutions), or
+    # which change the state of the Kernel.  Responses to templates
+    # containing any of them are never cached.
+    _impureElements = frozenset(["condition", "date", "get", "id", "input",
+                                 "learn", "random", "set", "system", "that"])
+    # Impure elements whose value may differ even within a single sentence
+    # of a reply, whatever the predicates.  Responses to templates
+    # containing any of them are never memoized; see _respond().
+    _unmemoizableElements = frozenset(["date", "learn", "random", "system"])
 
     def __init__(self):
         self._verboseMode = True
         self._version = "python-aiml {}".format(VERSION)
         self._brain = PatternMgr()
-        self._respondLock = threading.RLock()
+        # Each session is served by one thread at a time, holding the
+        # lock its ID hashes to.  The brain is never modified in place:
+        # learning replaces it with a copy (see PatternMgr.copyWith()),
+        # or with an overlay over it (see _learnCategories()), one thread
+        # at a time.
+        self._sessionLocks = [threading.RLock() for i in range(self._sessionLockCount)]
+        self._learnLock = threading.Lock()
+        # per-session caches of normalized input, valid for a single call
+        # to respond()
+        self._normalized = {}
+        # per-session memos of the responses worked out while answering
+        # a single sentence, keyed by the normalized input, that and topic
+        self._sraiMemo = {}
+        # the number of responses so far that could not be memoized
+        self._unmemoizableResponses = 0
+        # responses to side-effect-free templates, keyed by the normalized
+        # input, that and topic
+        self._responseCache = Utils.LRUCache(self._responseCacheSize)
+        # the number of responses so far that could not be cached
+        self._impureResponses = 0
+        # counts the changes to the brain; along with Match.key, it
+        # identifies a category for the caches below
+        self._brainGeneration = 0
+        # the templates of recently matched categories and their
+        # _templateImpurities(), keyed by brain generation and Match.key
+        self._impurities = Utils.LRUCache(self._impurityCacheSize)
+        # compiles templates into closures; see compileTemplates()
+        self._templateCompiler = None
+        # records what respond() does; see collectStats()
+        self._stats = None
         self.setTextEncoding(None if PY3 else "utf-8")
 
         # set up the sessions
-        self._sessions = {}
+        self._sessions = SessionStore(self._newSession,
+                                      pinned=[self._globalSessionID])
         self._addSession(self._globalSessionID)
 
         # Set up the bot predicates
@@ -112,7 +197,7 @@ class Kernel:
         }
 
     def bootstrap(self, brainFile=None, learnFiles=[], commands=[],
-                  chdir=None):
+                  chdir=None, processes=None):
         """Prepare a Kernel object for use.
 
         If a `brainFile` argument is provided, the Kernel attempts to
@@ -128,6 +213,9 @@ class Kernel:
         performing any learn or command execution (but after loadBrain
         processing). Upon returning the current directory is moved back to
         where it was before.
+
+        If `processes` is given, the `learnFiles` are parsed in a pool of
+        that many processes (see learn_many()).
         """
         start = time.time()
         if brainFile:
@@ -142,8 +230,11 @@ class Kernel:
             # turned into a single-element list.
             if isinstance(learnFiles, (str, unicode)):
                 learnFiles = (learnFiles,)
-            for file in learnFiles:
-                self.learn(file)
+            if processes:
+                self.learn_many(learnFiles, processes)
+            else:
+                for file in learnFiles:
+                    self.learn(file)
 
             # ditto for commands
             if isinstance(commands, (str, unicode)):
@@ -182,28 +273,160 @@ class Kernel:
         del(self._brain)
         self.__init__()
 
-    def loadBrain(self, filename):
+    def loadBrain(self, filename, shardBudget=None):
         """Attempt to load a previously-saved 'brain' from the
         specified filename.
 
         NOTE: the current contents of the 'brain' will be discarded!
 
+        Ordinary, compact (see CompactPatternMgr) and sharded (see
+        ShardedPatternMgr) brain files are accepted; the file format is
+        detected automatically.  shardBudget is the number of bytes of a
+        sharded brain to keep in memory.
+
+        If the file was written by saveBrain(), the bot predicates and
+        word substitutions it holds replace the current ones (other bot
+        predicates are kept).
+
         """
         if self._verboseMode: print( "Loading brain from %s..." % filename, end="" )
         start = time.time()
+        if isCompactBrain(filename):
+            self._brain = CompactPatternMgr()
+        elif isShardedBrain(filename):
+            self._brain = ShardedPatternMgr(shardBudget)
+        else:
+            self._brain = PatternMgr()
         self._brain.restore(filename)
+        self._loadState(filename)
+        self._brainChanged()
         if self._verboseMode:
             end = time.time() - start
             print( "done (%d categories in %.2f seconds)" % (self._brain.numTemplates(), end) )
 
-    def saveBrain(self, filename):
-        """Dump the contents of the bot's brain to a file on disk."""
+    def saveState(self, filename):
+        """Append the bot predicates and the word substitutions, with
+        their lookup tables, to the brain file filename.
+
+        saveBrain() does this already; brains written by other means
+        (see BrainBuilder) can hold them too.  loadBrain() restores
+        them.
+
+        """
+        state = {
+            "version": _STATE_VERSION,
+            "botPredicates": self._botPredicates,
+            "subbers": dict((name, subber.getState())
+                            for name, subber in self._subbers.items()),
+        }
+        data = marshal.dumps(state)
+        with open(filename, "ab") as outFile:
+            outFile.write(data)
+            outFile.write(_STATE_TRAILER.pack(len(data), _STATE_MAGIC))
+
+    def stateDigest(self):
+        """Return a hash of the state saved by saveState(), which
+        changes whenever any of it does.
+
+        """
+        state = (sorted(self._botPredicates.items()),
+                 sorted((name, list(subber.items()))
+                        for name, subber in self._subbers.items()))
+        return hashlib.sha1(repr(state).encode("utf-8")).hexdigest()
+
+    def _loadState(self, filename):
+        """Restore the bot predicates and subbers saved by saveState(),
+        if filename holds any."""
+        with open(filename, "rb") as inFile:
+            inFile.seek(0, os.SEEK_END)
+            size = inFile.tell()
+            if size < _STATE_TRAILER.size:
+                return
+            inFile.seek(size - _STATE_TRAILER.size)
+            length, magic = _STATE_TRAILER.unpack(inFile.read(_STATE_TRAILER.size))
+            if magic != _STATE_MAGIC or length > size - _STATE_TRAILER.size:
+                return
+            inFile.seek(size - _STATE_TRAILER.size - length)
+            state = marshal.loads(inFile.read(length))
+        if state.get("version") != _STATE_VERSION:
+            return
+        self._botPredicates.update(state["botPredicates"])
+        self._brain.setBotName(self.getBotPredicate("name"))
+        self._subbers = {}
+        for name, subberState in state["subbers"].items():
+            self._subbers[name] = WordSub()
+            self._subbers[name].setState(subberState)
+
+    def compactBrain(self):
+        """Convert the bot's brain to a read-only CompactPatternMgr.
+
+        The compact brain matches exactly like the original one but
+        needs much less memory.  Categories learned afterwards go to an
+        overlay over it (see OverlayPatternMgr); calling compactBrain()
+        again merges them into a new compact brain.
+
+        """
+        if not isinstance(self._brain, CompactPatternMgr):
+            self._brain = CompactPatternMgr.fromPatternMgr(self._brain.thaw())
+            self._brainChanged()
+
+    def saveBrain(self, filename, compact=False):
+        """Dump the contents of the bot's brain to a file on disk.
+
+        If compact is True, or the brain already is a compact one, the
+        file is written in the compact format, which loadBrain() maps
+        into memory instead of reading it.  Categories learned into an
+        overlay are saved along with the rest of the brain; see
+        saveOverlay() to save them alone.
+
+        The bot predicates and the word substitutions, with their lookup
+        tables, are saved along with the brain, and restored by
+        loadBrain().
+
+        """
         if self._verboseMode: print( "Saving brain to %s..." % filename, end="")
         start = time.time()
+        if compact:
+            self.compactBrain()
         self._brain.save(filename)
+        self.saveState(filename)
         if self._verboseMode:
             print("done (%.2f seconds)" % (time.time() - start))
 
+    def saveOverlay(self, filename):
+        """Save the categories learned into the overlay over the brain
+        (see _learnCategories()) to a file, which loadOverlay() can layer
+        over this brain or another one later.
+        """
+        brain = self._brain
+        if isinstance(brain, OverlayPatternMgr):
+            brain.overlay().save(filename)
+        else:
+            PatternMgr().save(filename)
+
+    def loadOverlay(self, filename):
+        """Layer the categories saved by saveOverlay() over the brain,
+        replacing those of any current overlay.  The brain underneath is
+        left untouched.
+        """
+        overlay = PatternMgr()
+        overlay.restore(filename)
+        with self._learnLock:
+            brain = self._brain
+            if isinstance(brain, OverlayPatternMgr):
+                brain = brain.base()
+            self._brain = OverlayPatternMgr(brain, overlay)
+            self._brainChanged()
+
+    def discardOverlay(self):
+        """Forget the categories learned into the overlay over the brain,
+        going back to the brain underneath.
+        """
+        with self._learnLock:
+            if isinstance(self._brain, OverlayPatternMgr):
+                self._brain = self._brain.base()
+                self._brainChanged()
+
     def getPredicate(self, name, sessionID=_globalSessionID):
         """Retrieve the current value of the predicate 'name' from the
         specified session.
@@ -225,7 +448,14 @@ class Kernel:
 
         """
         self._addSession(sessionID)  # add the session, if it doesn't already exist.
-        self._sessions[sessionID][name] = value
+        session = self._sessions[sessionID]
+        # the responses memoized so far in this sentence may depend on
+        # the old value; see _respond()
+        if sessionID in self._sraiMemo:
+            old = session.get(name, "")
+            if old is not value and old != value:
+                self._sraiMemo[sessionID] = {}
+        session[name] = value
 
     def getBotPredicate(self, name):
         """Retrieve the value of the specified bot predicate.
@@ -243,6 +473,7 @@ class Kernel:
 
         """
         self._botPredicates[name] = value
+        self._responseCache.clear()
         # Clumsy hack: if updating the bot name, we must update the
         # name in the brain as well
         if name == "name":
@@ -282,39 +513,143 @@ class Kernel:
             # iterate over the key,value pairs and add them to the subber
             for k, v in parser.items(s):
                 self._subbers[s][k] = v
+        self._responseCache.clear()
 
-    def _addSession(self, sessionID):
-        """Create a new session with the specified ID string."""
-        if sessionID in self._sessions:
-            return
-        # Create the session.
-        self._sessions[sessionID] = {
+    def _newSession(self):
+        """Return a new, empty session dictionary."""
+        return {
             # Initialize the special reserved predicates
-            self._inputHistory: [],
-            self._outputHistory: [],
-            self._inputStack: []
+            self._inputHistory: deque(maxlen=self._maxHistorySize),
+            self._outputHistory: deque(maxlen=self._maxHistorySize),
+            self._inputStack: [],
+            self._matchStack: []
         }
 
+    def _addSession(self, sessionID):
+        """Create a new session with the specified ID string, or mark
+        the existing one as just used."""
+        self._sessions.touch(sessionID)
+
     def _deleteSession(self, sessionID):
         """Delete the specified session."""
-        if sessionID in self._sessions:
-            self._sessions.pop(sessionID)
+        self._sessions.pop(sessionID)
+
+    def setSessionLimits(self, maxSessions=None, ttl=None, spillDir=None):
+        """Bound the sessions kept in memory.
 
-    def getSessionData(self, sessionID=None):
+        Beyond maxSessions sessions, or once a session has been idle
+        for more than ttl seconds, the least recently used sessions are
+        evicted.  If spillDir is a directory name, evicted sessions are
+        saved there and brought back when used again; otherwise they
+        are forgotten.  The global session, and sessions in the middle
+        of a response, are never evicted.  None means no limit.
+
+        """
+        self._sessions.setLimits(maxSessions, ttl, spillDir)
+
+    def getSessionData(self, sessionID=None, memory=False):
         """Return a copy of the session data dictionary for the
         specified session.
 
         If no sessionID is specified, return a dictionary containing
         *all* of the individual session dictionaries.
 
+        If memory is True, each session dictionary also has a "_memory"
+        key, the approximate number of bytes the session takes up in
+        memory (0 if it is spilled to disk).
+
         """
-        s = None
         if sessionID is not None:
-            try: s = self._sessions[sessionID]
-            except KeyError: s = {}
+            ids = [sessionID]
         else:
-            s = self._sessions
-        return copy.deepcopy(s)
+            ids = self._sessions.keys()
+        sessions = {}
+        for i in ids:
+            try: sessions[i] = self._sessions.copy(i)
+            except KeyError: sessions[i] = {}
+            if memory:
+                sessions[i]["_memory"] = self._sessions.memoryUsage(i)
+        if sessionID is not None:
+            return sessions[sessionID]
+        return sessions
+
+    def _brainChanged(self):
+        """Forget everything derived from the contents of the brain."""
+        self._brainGeneration += 1
+        self._responseCache.clear()
+        self._impurities.clear()
+        # The sentences being answered start new memos (a <learn> changes
+        # the brain halfway through one); see _respond().
+        for sessionID in list(self._sraiMemo):
+            self._sraiMemo[sessionID] = {}
+        if self._templateCompiler is not None:
+            self._templateCompiler.clear()
+        if self._stats is not None:
+            self._stats.brainChanged()
+
+    def compileTemplates(self, enabled=True):
+        """Enable/disable the template compiler.
+
+        When enabled, each template is compiled into a tree of Python
+        functions the first time it is used (see TemplateCompiler), and
+        the compiled form is run instead of interpreting the template
+        element by element.  The responses are exactly the same.
+
+        """
+        if not enabled:
+            self._templateCompiler = None
+        elif self._templateCompiler is None:
+            self._templateCompiler = TemplateCompiler(self)
+
+    def collectStats(self, enabled=True):
+        """Enable/disable the statistics collector.
+
+        When enabled, respond() records how often each category is
+        matched, histograms of the time spent matching, processing
+        templates and answering each sentence, the depth of the <srai>
+        chains, and the inputs that matched nothing (see aiml.Stats).
+        Enabling it again starts from scratch.  When disabled, nothing
+        is recorded.
+
+        """
+        self._stats = StatsCollector() if enabled else None
+        # the cached responses carry no record of their matches
+        # for the new collector; see _respond()
+        self._responseCache.clear()
+
+    def getStats(self):
+        """Return the statistics recorded since collectStats() was
+        called, as a dictionary, or None if the collector is disabled.
+
+        """
+        if self._stats is None:
+            return None
+        return self._stats.asDict()
+
+    def saveStats(self, filename):
+        """Write the statistics returned by getStats() to a JSON file."""
+        with open(filename, "w") as outFile:
+            outFile.write(self._stats.toJSON(indent=1))
+
+    def setResponseCacheSize(self, size):
+        """Set the maximum number of responses kept in the response cache.
+
+        Responses to templates without side effects (see
+        _isPureTemplate()) are remembered, keyed by the normalized input,
+        that and topic, and returned without matching or processing the
+        template again.  A size of 0 disables the cache.
+
+        """
+        self._responseCache.resize(size)
+
+    def getResponseCacheStats(self):
+        """Return a dictionary with the number of hits and misses of the
+        response cache, and its current and maximum size.
+
+        """
+        cache = self._responseCache
+        return {"hits": cache.hits, "misses": cache.misses,
+                "size": len(cache), "maxSize": cache.maxSize}
 
     def learn(self, filename):
         """Load and learn the contents of the specified AIML file.
@@ -323,25 +658,131 @@ class Kernel:
         will be loaded and learned.
 
         """
+        self._learn(filename)
+
+    def _learn(self, filename, overlay=False):
+        """Learn the AIML files matching filename, into an overlay over
+        the brain if overlay is True (see _learnCategories())."""
         for f in glob.glob(filename):
             if self._verboseMode: print( "Loading %s..." % f, end="")
             start = time.time()
-            # Load and parse the AIML file.
-            parser = create_parser()
-            handler = parser.getContentHandler()
-            handler.setEncoding(self._textEncoding)
-            try: parser.parse(f)
-            except xml.sax.SAXParseException as msg:
-                err = "\nFATAL PARSE ERROR in file %s:\n%s\n" % (f,msg)
-                sys.stderr.write(err)
+            categories = self._parseFile(f)
+            if categories is None:
                 continue
-            # store the pattern/template pairs in the PatternMgr.
-            for key, tem in handler.categories.items():
-                self._brain.add(key, tem)
+            # store the pattern/template pairs in a new PatternMgr.
+            self._learnCategories(categories.items(), overlay)
             # Parsing was successful.
             if self._verboseMode:
                 print("done (%.2f seconds)" % (time.time() - start))
 
+    def learn_many(self, filenames, processes=None):
+        """Load and learn the contents of a list of AIML files.
+
+        Wildcards are expanded as in learn().  The files are parsed in a
+        pool of worker processes (as many as there are CPUs if processes
+        is None), and their categories are learned in the order of the
+        list, so a category defined in several files ends up with the
+        template of the last one, exactly as with learn().
+
+        """
+        start = time.time()
+        files = []
+        for filename in filenames:
+            files.extend(glob.glob(filename))
+        results = self._parseFiles(files, processes)
+        self._learnCategories(item for categories in results
+                              if categories is not None
+                              for item in categories.items())
+        if self._verboseMode:
+            print("Learned %d files in %.2f seconds" % (len(files), time.time() - start))
+
+    def _learnCategories(self, categories, overlay=False):
+        """Replace the brain with a copy holding categories too, a
+        sequence of ([pattern/that/topic], template) pairs.
+
+        The categories go to an overlay over the brain (see
+        OverlayPatternMgr) if overlay is True, if the brain is read-only
+        (compact or sharded) or if it already has one.  The brain
+        underneath then stays as it is, mapped into memory or loaded
+        lazily, and the overlay can be saved and restored on its own.
+
+        """
+        with self._learnLock:
+            brain = self._brain
+            if (overlay or brain._readOnly) and \
+                   not isinstance(brain, OverlayPatternMgr):
+                brain = OverlayPatternMgr(brain)
+            self._brain = brain.copyWith(categories)
+            self._brainChanged()
+
+    def _parseFile(self, filename):
+        """Parse the AIML file filename and return its categories, a
+        dictionary mapping [pattern/that/topic] tuples to templates, or
+        None if the file could not be parsed.
+
+        """
+        return self._parseFiles([filename], 1)[0]
+
+    def _parseFiles(self, filenames, processes=None, partial=False):
+        """Parse a list of AIML files, in a pool of worker processes if
+        processes is not 1, and return the list of their categories (see
+        _parseFile()).  If partial is True, a file that could not be
+        parsed gives the categories before the error instead of None,
+        as _streamFile() does.
+
+        """
+        jobs = [(f, self._textEncoding) for f in filenames]
+        if processes == 1 or len(jobs) < 2:
+            results = [_parseAimlFile(job) for job in jobs]
+        else:
+            pool = multiprocessing.Pool(processes)
+            try:
+                results = pool.map(_parseAimlFile, jobs, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        for i, (categories, error) in enumerate(results):
+            if error is not None:
+                self._parseError(filenames[i], error)
+                if not partial:
+                    categories = None
+            results[i] = categories
+        return results
+
+    def _streamFile(self, filename, sink):
+        """Parse the AIML file filename, handing each category to
+        sink(key, template) as soon as it is read, without holding the
+        categories of the file in memory.  Returns True if the whole file
+        could be parsed; otherwise only the categories before the error
+        were handed to sink.
+
+        """
+        error = _streamAimlFile(filename, self._textEncoding, sink)
+        if error is not None:
+            self._parseError(filename, error)
+        return error is None
+
+    def _parseError(self, filename, error):
+        """Report that the AIML file filename could not be parsed."""
+        err = "\nFATAL PARSE ERROR in file %s:\n%s\n" % (filename, error)
+        sys.stderr.write(err)
+
+    def match_many(self, queries, processes=None):
+        """Match a sequence of (input, that, topic) string triples against
+        the brain, and return the list of their Matches (or None).
+
+        The strings go through the 'normal' substitutions, as in
+        respond(), but no templates are processed and no session is
+        touched.  This is meant for checking a brain against a large
+        corpus; see PatternMgr.match_many() for the processes argument.
+
+        """
+        normalize = self._brain.normalize
+        sub = self._subbers['normal'].sub
+        prepared = [tuple(normalize(sub(text)) for text in query)
+                    for query in queries]
+        return self._brain.match_many(prepared, processes)
+
     def respond(self, input_, sessionID=_globalSessionID):
         """Return the Kernel's response to the input string."""
         if len(input_) == 0:
@@ -353,33 +794,39 @@ class Kernel:
         except UnicodeError: pass
         except AttributeError: pass
 
-        # prevent other threads from stomping all over us.
-        self._respondLock.acquire()
+        # prevent other threads from stomping all over this session.
+        # Threads serving other sessions go on in parallel.
+        lock = self._sessionLock(sessionID)
+        lock.acquire()
 
         try:
-            # Add the session, if it doesn't already exist
-            self._addSession(sessionID)
+            # Add the session, if it doesn't already exist, and keep it
+            # in memory until we're done
+            self._sessions.checkout(sessionID)
 
             # split the input into discrete sentences
             sentences = Utils.sentences(input_)
             finalResponse = u""
+            self._normalized[sessionID] = {}
             for s in sentences:
                 # Add the input to the history list before fetching the
                 # response, so that <input/> tags work properly.
                 inputHistory = self.getPredicate(self._inputHistory, sessionID)
                 inputHistory.append(s)
-                while len(inputHistory) > self._maxHistorySize:
-                    inputHistory.pop(0)
                 self.setPredicate(self._inputHistory, inputHistory, sessionID)
+                self._sraiMemo[sessionID] = {}
 
                 # Fetch the response
+                stats = self._stats
+                if stats is not None:
+                    start = timer()
                 response = self._respond(s, sessionID)
+                if stats is not None:
+                    stats.response(timer() - start, sessionID)
 
                 # add the data from this exchange to the history lists
                 outputHistory = self.getPredicate(self._outputHistory, sessionID)
                 outputHistory.append(response)
-                while len(outputHistory) > self._maxHistorySize:
-                    outputHistory.pop(0)
                 self.setPredicate(self._outputHistory, outputHistory, sessionID)
 
                 # append this response to the final response.
@@ -393,8 +840,15 @@ class Kernel:
             return self._cod.enc(finalResponse)
 
         finally:
+            self._sessions.checkin(sessionID)
+            self._normalized.pop(sessionID, None)
+            self._sraiMemo.pop(sessionID, None)
             # release the lock
-            self._respondLock.release()
+            lock.release()
+
+    def _sessionLock(self, sessionID):
+        """Return the lock serializing the responses to sessionID."""
+        return self._sessionLocks[hash(sessionID) % len(self._sessionLocks)]
 
 
     # This version of _respond() just fetches the response for some input.
@@ -412,6 +866,9 @@ class Kernel:
             if self._verboseMode:
                 err = u"WARNING: maximum recursion depth exceeded (input='%s')" % self._cod.enc(input_)
                 sys.stderr.write(err)
+            # a truncated response must not be cached by the callers
+            self._impureResponses += 1
+            self._unmemoizableResponses += 1
             return u""
 
         # push the input onto the input stack
@@ -420,31 +877,94 @@ class Kernel:
         self.setPredicate(self._inputStack, inputStack, sessionID)
 
         # run the input through the 'normal' subber
-        subbedInput = self._subbers['normal'].sub(input_)
+        subbedInput = self._normalize(input_, sessionID)
 
         # fetch the bot's previous response, to pass to the match()
         # function as 'that'.
         outputHistory = self.getPredicate(self._outputHistory, sessionID)
         try: that = outputHistory[-1]
         except IndexError: that = ""
-        subbedThat = self._subbers['normal'].sub(that)
+        subbedThat = self._normalize(that, sessionID)
 
         # fetch the current topic
         topic = self.getPredicate("topic", sessionID)
-        subbedTopic = self._subbers['normal'].sub(topic)
-
-        # Determine the final response.
-        response = u""
-        elem = self._brain.match(subbedInput, subbedThat, subbedTopic)
-        if elem is None:
-            if self._verboseMode:
-                err = "WARNING: No match found for input: %s\n" % self._cod.enc(input_)
-                sys.stderr.write(err)
+        subbedTopic = self._normalize(topic, sessionID)
+
+        # Determine the final response.  Within a sentence, inputs
+        # reduced to the same sentence (by nested <sr> and <srai>) get
+        # the same response, as long as the predicates stay the same:
+        # look in the memo first, then in the response cache.
+        cacheKey = (subbedInput.text, subbedThat.text, subbedTopic.text)
+        memo = self._sraiMemo.get(sessionID)
+        memoized = memo.get(cacheKey) if memo is not None else None
+        if memoized is not None:
+            response, pure, record = memoized
+            if not pure:
+                self._impureResponses += 1
+            if self._stats is not None:
+                self._stats.memoized(record, len(inputStack), sessionID)
         else:
-            # Process the element into a response string.
-            response += self._processElement(elem, sessionID).strip()
-            response += u" "
-        response = response.strip()
+            cached = self._responseCache.get(cacheKey)
+            if cached is None:
+                response = u""
+                impureResponses = self._impureResponses
+                unmemoizableResponses = self._unmemoizableResponses
+                # the brain may change while we work; see LRUCache.add()
+                cacheGeneration = self._responseCache.generation
+                brainGeneration = self._brainGeneration
+                stats = self._stats
+                if stats is not None:
+                    mark = stats.mark(sessionID)
+                    start = timer()
+                match = self._brain.match(subbedInput, subbedThat, subbedTopic)
+                if stats is not None:
+                    stats.match(match, (subbedInput, subbedThat, subbedTopic),
+                                len(inputStack), timer() - start, sessionID)
+                    start = timer()
+                if match is None:
+                    if self._verboseMode:
+                        err = "WARNING: No match found for input: %s\n" % self._cod.enc(input_)
+                        sys.stderr.write(err)
+                else:
+                    # Keep the match around for <star>, <thatstar> and <topicstar>
+                    # elements in the template.
+                    matchStack = self.getPredicate(self._matchStack, sessionID)
+                    matchStack.append(match)
+                    # Process the element into a response string.
+                    if self._templateCompiler is None:
+                        response += self._processElement(match.template, sessionID).strip()
+                    else:
+                        response += self._templateCompiler.compiled(match, brainGeneration)(sessionID).strip()
+                    response += u" "
+                    matchStack.pop()
+                    if stats is not None:
+                        stats.template(timer() - start)
+                response = response.strip()
+                # The matches made for the response (including those of
+                # its <srai>) are counted again whenever it is reused.
+                record = None
+                if stats is not None:
+                    record = stats.record(sessionID, mark, len(inputStack))
+                # The response can be cached if neither its template nor those
+                # of any <srai> it made had side effects.
+                if match is not None:
+                    impurities = self._matchImpurities(match, brainGeneration)
+                    if impurities:
+                        self._impureResponses += 1
+                        if not impurities.isdisjoint(self._unmemoizableElements):
+                            self._unmemoizableResponses += 1
+                    elif impureResponses == self._impureResponses:
+                        self._responseCache.add(cacheKey, (response, record), cacheGeneration)
+                # It can be memoized for the rest of the sentence unless it
+                # was random (or the like), or changed a predicate, which
+                # started a new memo.
+                if (memo is not None and memo is self._sraiMemo.get(sessionID)
+                        and unmemoizableResponses == self._unmemoizableResponses):
+                    memo[cacheKey] = (response, impureResponses == self._impureResponses, record)
+            else:
+                response, record = cached
+                if self._stats is not None:
+                    self._stats.cached(record, len(inputStack), sessionID)
 
         # pop the top entry off the input stack.
         inputStack = self.getPredicate(self._inputStack, sessionID)
@@ -453,6 +973,61 @@ class Kernel:
 
         return response
 
+    def _normalize(self, text, sessionID):
+        """Run text through the 'normal' subber and split it into the
+        words seen by the pattern matcher.
+
+        The result is remembered until the end of the current call to
+        respond(), so the 'that' and 'topic' of every <srai> in a reply,
+        and inputs reduced to the same sentence, are normalized only once.
+
+        """
+        cache = self._normalized.get(sessionID)
+        if cache is not None:
+            try: return cache[text]
+            except KeyError: pass
+        normalized = self._brain.normalize(self._subbers['normal'].sub(text))
+        if cache is not None:
+            cache[text] = normalized
+        return normalized
+
+    def _isPureTemplate(self, elem):
+        """Return True if the template elem contains none of the
+        _impureElements, so that its response only depends on the input,
+        that and topic it matched.
+
+        """
+        return not self._templateImpurities(elem)
+
+    def _templateImpurities(self, elem):
+        """Return the set of the names of the _impureElements found in
+        the template elem.
+
+        """
+        impurities = set()
+        stack = [elem]
+        while stack:
+            elem = stack.pop()
+            if elem[0] in self._impureElements:
+                impurities.add(elem[0])
+            stack.extend(e for e in elem[2:] if isinstance(e, list))
+        return impurities
+
+    def _matchImpurities(self, match, brainGeneration):
+        """Return the _templateImpurities() of the template of match,
+        walking each category's template only once.  brainGeneration is
+        the _brainGeneration read before matching.
+
+        """
+        key = (brainGeneration, match.key)
+        template, impurities = self._impurities.get(key, (None, None))
+        # as in TemplateCompiler.compiled(), make sure that the key is
+        # still the one of the same template
+        if template is not match.template and template != match.template:
+            impurities = frozenset(self._templateImpurities(match.template))
+            self._impurities[key] = (match.template, impurities)
+        return impurities
+
     def _processElement(self, elem, sessionID):
         """Process an AIML element.
 
@@ -719,7 +1294,8 @@ class Kernel:
         filename = ""
         for e in elem[2:]:
             filename += self._processElement(e, sessionID)
-        self.learn(filename)
+        # into an overlay, so that the rest of the brain stays as it is
+        self._learn(filename, overlay=True)
         return ""
 
     # <li>
@@ -909,16 +1485,9 @@ class Kernel:
         """
         try: index = int(elem[1]['index'])
         except KeyError: index = 1
-        # fetch the user's last input
-        inputStack = self.getPredicate(self._inputStack, sessionID)
-        input_ = self._subbers['normal'].sub(inputStack[-1])
-        # fetch the Kernel's last response (for 'that' context)
-        outputHistory = self.getPredicate(self._outputHistory, sessionID)
-        try: that = self._subbers['normal'].sub(outputHistory[-1])
-        except: that = ""  # there might not be any output yet
-        topic = self.getPredicate("topic", sessionID)
-        response = self._brain.star("star", input_, that, topic, index)
-        return response
+        # fetch the match of the input being processed
+        matchStack = self.getPredicate(self._matchStack, sessionID)
+        return matchStack[-1].star("star", index)
 
     # <system>
     def _processSystem(self, elem, sessionID):
@@ -1049,16 +1618,9 @@ class Kernel:
         """
         try: index = int(elem[1]['index'])
         except KeyError: index = 1
-        # fetch the user's last input
-        inputStack = self.getPredicate(self._inputStack, sessionID)
-        input_ = self._subbers['normal'].sub(inputStack[-1])
-        # fetch the Kernel's last response (for 'that' context)
-        outputHistory = self.getPredicate(self._outputHistory, sessionID)
-        try: that = self._subbers['normal'].sub(outputHistory[-1])
-        except Exception: that = ""  # there might not be any output yet
-        topic = self.getPredicate("topic", sessionID)
-        response = self._brain.star("thatstar", input_, that, topic, index)
-        return response
+        # fetch the match of the input being processed
+        matchStack = self.getPredicate(self._matchStack, sessionID)
+        return matchStack[-1].star("thatstar", index)
 
     # <think>
     def _processThink(self, elem, sessionID):
@@ -1090,16 +1652,9 @@ class Kernel:
         """
         try: index = int(elem[1]['index'])
         except KeyError: index = 1
-        # fetch the user's last input
-        inputStack = self.getPredicate(self._inputStack, sessionID)
-        input_ = self._subbers['normal'].sub(inputStack[-1])
-        # fetch the Kernel's last response (for 'that' context)
-        outputHistory = self.getPredicate(self._outputHistory, sessionID)
-        try: that = self._subbers['normal'].sub(outputHistory[-1])
-        except Exception: that = ""  # there might not be any output yet
-        topic = self.getPredicate("topic", sessionID)
-        response = self._brain.star("topicstar", input_, that, topic, index)
-        return response
+        # fetch the match of the input being processed
+        matchStack = self.getPredicate(self._matchStack, sessionID)
+        return matchStack[-1].star("topicstar", index)
 
     # <uppercase>
     def _processUppercase(self, elem, sessionID):
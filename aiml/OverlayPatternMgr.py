@@ -0,0 +1,172 @@
+'''
+A PatternMgr layering a small, writable overlay over a read-only base.
+
+Compact brains (see CompactPatternMgr) are mapped into memory, and sharded
+ones (see ShardedPatternMgr) only read what they need; converting either to
+an ordinary PatternMgr so that it can learn a handful of categories throws
+that away.  An OverlayPatternMgr leaves its base untouched and keeps the
+categories learned afterwards in an ordinary PatternMgr of their own, the
+overlay.
+
+Matching walks both tries at once: each node is a pair of the overlay node
+and the base node reached through the same keys (either may be None).  The
+search is thus exactly the one of a single trie holding the categories of
+both, in the usual AIML priority order; where both hold a template for the
+same [pattern/that/topic], the overlay's wins.  A "*" learned in the overlay
+therefore doesn't hide the more specific patterns of the base.
+
+Learning goes through copyWith(), which copies the overlay only and shares
+the base, so the overlay can be saved on its own, and dropped or replaced
+without touching the base.  thaw() and save() merge the overlay into the
+base.
+'''
+
+from __future__ import print_function
+
+import copy
+
+from .PatternMgr import PatternMgr
+
+
+class OverlayPatternMgr(PatternMgr):
+    def __init__(self, base, overlay=None):
+        """base is the PatternMgr to layer the overlay over, and overlay
+        an ordinary PatternMgr holding the categories to add to it (an
+        empty one if None).
+        """
+        PatternMgr.__init__(self)
+        self._base = base
+        self._overlay = PatternMgr() if overlay is None else overlay
+        self._botName = base._botName
+        self._root = (self._overlay._root, base._root)
+        # the number of categories of the overlay that the base holds too
+        self._shadowed = self._countShadowed(
+            data for data, template in self._overlay._categories())
+        self._templateCount = (base.numTemplates() + self._overlay.numTemplates()
+                               - self._shadowed)
+
+    def base(self):
+        """Return the PatternMgr underneath the overlay."""
+        return self._base
+
+    def overlay(self):
+        """Return the PatternMgr holding the categories of the overlay."""
+        return self._overlay
+
+    def _countShadowed(self, keys, overlay=None):
+        """Return the number of distinct [pattern/that/topic] tuples of
+        keys that the base holds, and overlay (if given) doesn't.
+        """
+        seen = set()
+        count = 0
+        try:
+            for data in keys:
+                path = tuple(self._path(data))
+                if path in seen:
+                    continue
+                seen.add(path)
+                if overlay is not None and overlay._hasTemplate(data):
+                    continue
+                if self._base._hasTemplate(data):
+                    count += 1
+        finally:
+            self._base._evict()
+        return count
+
+    def add(self, data, template):
+        """Add a [pattern/that/topic] tuple and its template to the
+        overlay.  The base is never modified.
+        """
+        self._shadowed += self._countShadowed([data], self._overlay)
+        self._overlay.add(data, template)
+        self._templateCount = (self._base.numTemplates()
+                               + self._overlay.numTemplates() - self._shadowed)
+
+    def copyWith(self, categories):
+        """Return a new OverlayPatternMgr holding the patterns of this one
+        plus categories, a sequence of ([pattern/that/topic], template)
+        pairs.  Only the overlay is copied (see PatternMgr.copyWith()); the
+        base is shared.
+        """
+        categories = list(categories)
+        mgr = copy.copy(self)
+        mgr._overlay = self._overlay.copyWith(categories)
+        mgr._root = (mgr._overlay._root, self._base._root)
+        mgr._shadowed += self._countShadowed(
+            (data for data, template in categories), self._overlay)
+        mgr._templateCount = (self._base.numTemplates()
+                              + mgr._overlay.numTemplates() - mgr._shadowed)
+        return mgr
+
+    def thaw(self):
+        """Return an ordinary, writable PatternMgr with the patterns of the
+        base and of the overlay.
+        """
+        mgr = self._base.thaw().copyWith(self._overlay._categories())
+        mgr._botName = self._botName
+        return mgr
+
+    def dump(self):
+        """Print the patterns of the overlay, then those of the base."""
+        self._overlay.dump()
+        self._base.dump()
+
+    def save(self, filename):
+        """Save the patterns of the base and of the overlay together, in
+        the format of the base.  To save the overlay alone, save() the
+        PatternMgr returned by overlay().
+        """
+        mgr = self.thaw()
+        if self._base._readOnly:
+            mgr = type(self._base).fromPatternMgr(mgr)
+        mgr.save(filename)
+
+    def match(self, pattern, that, topic):
+        """Return the Match of the input, like PatternMgr.match().  As with
+        ShardedPatternMgr, the key of the Match counts the parts of the
+        base loaded so far.
+        """
+        try:
+            match = PatternMgr.match(self, pattern, that, topic)
+        finally:
+            self._base._evict()
+        if match is not None:
+            match.key = (self._base._loads, match.key)
+        return match
+
+    def _matchGroup(self, group):
+        try:
+            return PatternMgr._matchGroup(self, group)
+        finally:
+            self._base._evict()
+
+    def _nodeId(self, node):
+        over, base = node
+        return (None if over is None else id(over),
+                None if base is None else self._base._nodeId(base))
+
+    def _child(self, node, key):
+        """Return the pair of the children of the overlay node and the
+        base node reached through key, or None if neither has one.
+        """
+        over, base = node
+        if over is not None:
+            over = over.get(key)
+        if base is not None:
+            base = self._base._child(base, key)
+        if over is None and base is None:
+            return None
+        return (over, base)
+
+    def _nodeTemplate(self, node):
+        """Return the template of the overlay node, or failing that the
+        one of the base node, or None.
+        """
+        over, base = node
+        if over is not None:
+            template = over.get(self._TEMPLATE)
+            if template is not None:
+                return template
+        if base is None:
+            return None
+        return self._base._nodeTemplate(base)
@@ -6,13 +6,81 @@ http://www.alicebot.org/documentation/matching.html
 
 from __future__ import print_function
 
+import gc
 import marshal
+import multiprocessing
 import pprint
 import re
 import string
 import sys
 
 from .constants import *
+from .TemplatePool import TemplatePool
+
+
+# The PatternMgr used by the worker processes of match_many()
+_bulkMgr = None
+
+
+def _matchGroup(group):
+    """Match a group of queries in a match_many() worker process."""
+    return _bulkMgr._matchGroup(group)
+
+
+class NormalizedInput(object):
+    """A piece of input prepared for matching, as returned by
+    PatternMgr.normalize(): the text itself, its words, and the words
+    the matcher sees (upper-cased, with punctuation removed).
+    """
+    __slots__ = ("text", "textWords", "words")
+
+    def __init__(self, text, words):
+        self.text = text
+        self.textWords = text.split()
+        self.words = words
+
+
+class Match(object):
+    """The outcome of PatternMgr.match(): the matched template, and the
+    portions of the input matched by the wildcards of the pattern, that
+    and topic.
+
+    key identifies the matched category for as long as the PatternMgr
+    is not changed.  sections is the number of sections of the input
+    the category covers: 1 for a plain pattern, 2 if it has a that, 3
+    if it also has a topic.
+    """
+    __slots__ = ("template", "key", "sections", "_words", "_spans")
+
+    # index of each section in _words and _spans
+    _sections = {'star': 0, 'thatstar': 1, 'topicstar': 2}
+
+    def __init__(self, template, inputs, spans, key=None, sections=1):
+        self.template = template
+        self.key = key
+        self.sections = sections
+        self._words = [i.textWords for i in inputs]
+        self._spans = spans
+
+    def star(self, starType, index):
+        """Returns a string, the portion of the input that was matched by
+        the index'th wildcard (counting from 1).
+
+        The 'starType' parameter specifies which type of star to find.
+        Legal values are:
+         - 'star': matches a star in the main pattern.
+         - 'thatstar': matches a star in the that pattern.
+         - 'topicstar': matches a star in the topic pattern.
+        """
+        try:
+            section = self._sections[starType]
+        except KeyError:
+            raise ValueError( "starType must be in ['star', 'thatstar', 'topicstar']" )
+        if index < 1 or index > len(self._spans[section]):
+            return u""
+        start, end = self._spans[section][index - 1]
+        return u' '.join(self._words[section][start:end])
+
 
 class PatternMgr:
     # special dictionary keys
@@ -22,14 +90,29 @@ class PatternMgr:
     _THAT       = 3
     _TOPIC      = 4
     _BOT_NAME   = 5
-    
+
+    # actions of the explicit-stack matcher
+    _EXPAND         = 0
+    _TAKE_TEMPLATE  = 1
+    _FAILED         = 2
+
+    # whether add() is unsupported (see thaw()), and the number of parts
+    # of the node tree loaded from disk so far (see ShardedPatternMgr).
+    # Here the node tree is writable and always in memory.
+    _readOnly = False
+    _loads = 0
+
     def __init__(self):
         self._root = {}
         self._templateCount = 0
         self._botName = u"Nameless"
+        # shares the elements of the templates added; see TemplatePool
+        self._templates = TemplatePool()
         punctuation = r"""`~!@#$%^&*()-_=+[{]}\|;:'",<.>/?"""
         self._puncStripRE = re.compile("[" + re.escape(punctuation) + "]")
         self._whitespaceRE = re.compile(r"\s+", re.UNICODE)
+        self._dummyThat = self.normalize(u"ULTRABOGUSDUMMYTHAT")
+        self._dummyTopic = self.normalize(u"ULTRABOGUSDUMMYTOPIC")
 
     def numTemplates(self):
         """Return the number of templates currently stored."""
@@ -46,6 +129,12 @@ class PatternMgr:
         """Print all learned patterns, for debugging purposes."""
         pprint.pprint(self._root)
 
+    def thaw(self):
+        """Return a PatternMgr that supports add().  The dictionary-based
+        store is always writable, so this is the object itself.
+        """
+        return self
+
     def save(self, filename):
         """Dump the current patterns to the file specified by filename.  To
         restore later, use restore().
@@ -76,13 +165,95 @@ class PatternMgr:
         """Add a [pattern/that/topic] tuple and its corresponding template
         to the node tree.
         """
-        pattern,that,topic = data
-        # TODO: make sure words contains only legal characters
-        # (alphanumerics,*,_)
-
         # Navigate through the node tree to the template's location, adding
         # nodes if necessary.
         node = self._root
+        for key in self._path(data):
+            if key not in node:
+                node[key] = {}
+            node = node[key]
+
+        # add the template.
+        if self._TEMPLATE not in node:
+            self._templateCount += 1    
+        node[self._TEMPLATE] = self._internTemplate(template)
+
+    def _internTemplate(self, template):
+        """Return the copy of template stored in the trie, sharing its
+        elements with the other templates (see TemplatePool).
+        """
+        return self._templates.intern(template)
+
+    def copyWith(self, categories):
+        """Return a new PatternMgr holding the patterns of this one plus
+        categories, a sequence of ([pattern/that/topic], template) pairs.
+
+        This one is left untouched, so it can go on serving matches in
+        other threads.  Only the nodes on the paths to the new templates
+        are copied; the rest of the node tree is shared.
+        """
+        mgr = PatternMgr()
+        mgr._templateCount = self._templateCount
+        mgr._botName = self._botName
+        mgr._templates = self._templates
+        mgr._root = dict(self._root)
+        # the nodes created for the copy, which may be written to
+        copied = set([id(mgr._root)])
+        for data, template in categories:
+            node = mgr._root
+            for key in mgr._path(data):
+                child = node.get(key)
+                if child is None:
+                    child = node[key] = {}
+                    copied.add(id(child))
+                elif id(child) not in copied:
+                    child = node[key] = dict(child)
+                    copied.add(id(child))
+                node = child
+            if mgr._TEMPLATE not in node:
+                mgr._templateCount += 1
+            node[mgr._TEMPLATE] = mgr._internTemplate(template)
+        return mgr
+
+    def _categories(self):
+        """Yield the ([pattern/that/topic], template) pairs stored in the
+        node tree, in no particular order.
+        """
+        words = {self._UNDERSCORE: u"_", self._STAR: u"*",
+                 self._BOT_NAME: u"BOT_NAME"}
+        stack = [(self._root, ((), (), ()), 0)]
+        while stack:
+            node, sections, section = stack.pop()
+            for key, child in node.items():
+                if key == self._TEMPLATE:
+                    yield (tuple(u" ".join(s) for s in sections), child)
+                elif key == self._THAT or key == self._TOPIC:
+                    stack.append((child, sections, 1 if key == self._THAT else 2))
+                else:
+                    word = (words.get(key, key),)
+                    stack.append((child, sections[:section]
+                                  + (sections[section] + word,)
+                                  + sections[section+1:], section))
+
+    def _hasTemplate(self, data):
+        """Return True if the node tree holds a template for the
+        [pattern/that/topic] tuple data.
+        """
+        node = self._root
+        for key in self._path(data):
+            node = self._child(node, key)
+            if node is None:
+                return False
+        return self._nodeTemplate(node) is not None
+
+    def _path(self, data):
+        """Return the list of keys leading from the root of the node tree
+        to the template of a [pattern/that/topic] tuple.
+        """
+        pattern,that,topic = data
+        # TODO: make sure words contains only legal characters
+        # (alphanumerics,*,_)
+        path = []
         for word in pattern.split():
             key = word
             if key == u"_":
@@ -91,70 +262,179 @@ class PatternMgr:
                 key = self._STAR
             elif key == u"BOT_NAME":
                 key = self._BOT_NAME
-            if key not in node:
-                node[key] = {}
-            node = node[key]
+            path.append(key)
 
         # navigate further down, if a non-empty "that" pattern was included
         if len(that) > 0:
-            if self._THAT not in node:
-                node[self._THAT] = {}
-            node = node[self._THAT]
+            path.append(self._THAT)
             for word in that.split():
                 key = word
                 if key == u"_":
                     key = self._UNDERSCORE
                 elif key == u"*":
                     key = self._STAR
-                if key not in node:
-                    node[key] = {}
-                node = node[key]
+                path.append(key)
 
         # navigate yet further down, if a non-empty "topic" string was included
         if len(topic) > 0:
-            if self._TOPIC not in node:
-                node[self._TOPIC] = {}
-            node = node[self._TOPIC]
+            path.append(self._TOPIC)
             for word in topic.split():
                 key = word
                 if key == u"_":
                     key = self._UNDERSCORE
                 elif key == u"*":
                     key = self._STAR
-                if key not in node:
-                    node[key] = {}
-                node = node[key]
+                path.append(key)
+        return path
 
+    def normalize(self, text):
+        """Return a NormalizedInput for text.
 
-        # add the template.
-        if self._TEMPLATE not in node:
-            self._templateCount += 1    
-        node[self._TEMPLATE] = template
+        Callers that match the same text several times (such as the 'that'
+        and 'topic' of every <srai> in a reply) should normalize it once
+        and pass the NormalizedInput to match() instead of the string.
+        """
+        # Mutilate the input.  Remove all punctuation and convert the
+        # text to all caps.
+        words = re.sub(self._puncStripRE, " ", text.upper()).split()
+        return NormalizedInput(text, words)
 
     def match(self, pattern, that, topic):
-        """Return the template which is the closest match to pattern. The
-        'that' parameter contains the bot's previous response. The 'topic'
-        parameter contains the current topic of conversation.
+        """Return a Match for the template which is the closest match to
+        pattern. The 'that' parameter contains the bot's previous
+        response. The 'topic' parameter contains the current topic of
+        conversation.  Each of them is either a string or a
+        NormalizedInput.
+
+        Besides the template, the Match records the portions of pattern,
+        that and topic matched by each wildcard; see Match.star().
 
         Returns None if no template is found.
         """
-        if len(pattern) == 0:
+        query = self._prepare(pattern, that, topic)
+        if query is None:
             return None
-        # Mutilate the input.  Remove all punctuation and convert the
-        # text to all caps.
-        input_ = pattern.upper()
-        input_ = re.sub(self._puncStripRE, " ", input_)
-        if that.strip() == u"": that = u"ULTRABOGUSDUMMYTHAT" # 'that' must never be empty
-        thatInput = that.upper()
-        thatInput = re.sub(self._puncStripRE, " ", thatInput)
-        thatInput = re.sub(self._whitespaceRE, " ", thatInput)
-        if topic.strip() == u"": topic = u"ULTRABOGUSDUMMYTOPIC" # 'topic' must never be empty
-        topicInput = topic.upper()
-        topicInput = re.sub(self._puncStripRE, " ", topicInput)
-        
-        # Pass the input off to the recursive call
-        patMatch, template = self._match(input_.split(), thatInput.split(), topicInput.split(), self._root)
-        return template
+        return self._matchQuery(query)
+
+    def match_many(self, queries, processes=None):
+        """Match a sequence of (pattern, that, topic) triples, and return
+        the list of their Matches (or None) in the same order.
+
+        The result is the same as calling match() on every triple, but
+        much faster for large batches such as a regression corpus.
+        Identical queries are matched once.  The others are grouped by
+        their that and topic and sorted by their words, and each group
+        shares one memo of failed searches, keyed by the remaining input
+        rather than by position: the part of the trie that can't match a
+        given tail of input is searched once for the whole group.
+
+        If processes is given, the groups are spread over a pool of that
+        many worker processes.  This needs the 'fork' start method, and
+        falls back to matching in this process where it is unavailable.
+        """
+        unique = {}
+        order = []
+        for pattern, that, topic in queries:
+            query = self._prepare(pattern, that, topic)
+            key = None
+            if query is not None:
+                key = tuple(q.text for q in query)
+                if key not in unique:
+                    unique[key] = query
+            order.append(key)
+
+        groups = {}
+        for key, query in unique.items():
+            groupKey = (tuple(query[1].words), tuple(query[2].words))
+            groups.setdefault(groupKey, []).append(query)
+        groups = [sorted(group, key=lambda q: q[0].words)
+                  for groupKey, group in sorted(groups.items())]
+
+        results = None
+        if processes and len(groups) > 1:
+            try:
+                context = multiprocessing.get_context("fork")
+            except ValueError:
+                context = None
+            if context is not None:
+                global _bulkMgr
+                _bulkMgr = self
+                try:
+                    pool = context.Pool(processes)
+                    try:
+                        results = pool.map(_matchGroup, groups)
+                    finally:
+                        pool.close()
+                        pool.join()
+                finally:
+                    _bulkMgr = None
+        if results is None:
+            # The memos allocate a great many small objects, and every
+            # collection they trigger would scan the whole trie; hold the
+            # collector off for the length of the batch.
+            gcEnabled = gc.isenabled()
+            gc.disable()
+            try:
+                results = [self._matchGroup(group) for group in groups]
+            finally:
+                if gcEnabled:
+                    gc.enable()
+
+        matches = {None: None}
+        for group, groupMatches in zip(groups, results):
+            for query, match in zip(group, groupMatches):
+                matches[tuple(q.text for q in query)] = match
+        return [matches[key] for key in order]
+
+    def _prepare(self, pattern, that, topic):
+        """Normalize a (pattern, that, topic) query for _matchQuery(), or
+        return None if pattern is empty.
+        """
+        inputs = []
+        for text in (pattern, that, topic):
+            if not isinstance(text, NormalizedInput):
+                text = self.normalize(text)
+            inputs.append(text)
+        pattern, that, topic = inputs
+        if len(pattern.text) == 0:
+            return None
+        if that.text.strip() == u"": that = self._dummyThat # 'that' must never be empty
+        if topic.text.strip() == u"": topic = self._dummyTopic # 'topic' must never be empty
+        return (pattern, that, topic)
+
+    def _matchQuery(self, query, failed=None, posKeys=None):
+        """Match a query prepared by _prepare() and return its Match, or
+        None.  See _match() for the failed and posKeys arguments.
+        """
+        pattern, that, topic = query
+        template, spans, key, sections = self._match(
+            pattern.words, that.words, topic.words, self._root, failed, posKeys)
+        if template is None:
+            return None
+        # wildcard spans are extracted from the original, unmutilated input.
+        return Match(template, query, spans, key, sections)
+
+    def _matchGroup(self, group):
+        """Match a list of prepared queries sharing the same that and
+        topic, and return the list of their Matches.
+        """
+        failed = set()
+        suffixIds = {}
+        matches = []
+        for query in group:
+            words = query[0].words
+            # Number every tail of the input, from the end backwards: a
+            # tail is identified by its first word and the number of the
+            # rest.
+            wordKeys = [0] * (len(words) + 1)
+            wordKeys[-1] = suffixIds.setdefault((), len(suffixIds))
+            for i in range(len(words) - 1, -1, -1):
+                wordKeys[i] = suffixIds.setdefault((words[i], wordKeys[i+1]),
+                                                   len(suffixIds))
+            posKeys = (wordKeys, range(len(query[1].words) + 1),
+                       range(len(query[2].words) + 1))
+            matches.append(self._matchQuery(query, failed, posKeys))
+        return matches
 
     def star(self, starType, pattern, that, topic, index):
         """Returns a string, the portion of pattern that was matched by a *.
@@ -164,170 +444,134 @@ class PatternMgr:
          - 'star': matches a star in the main pattern.
          - 'thatstar': matches a star in the that pattern.
          - 'topicstar': matches a star in the topic pattern.
+
+        This matches the input all over again; callers holding the Match
+        returned by match() should use Match.star() instead.
         """
-        # Mutilate the input.  Remove all punctuation and convert the
-        # text to all caps.
-        input_ = pattern.upper()
-        input_ = re.sub(self._puncStripRE, " ", input_)
-        input_ = re.sub(self._whitespaceRE, " ", input_)
-        if that.strip() == u"": that = u"ULTRABOGUSDUMMYTHAT" # 'that' must never be empty
-        thatInput = that.upper()
-        thatInput = re.sub(self._puncStripRE, " ", thatInput)
-        thatInput = re.sub(self._whitespaceRE, " ", thatInput)
-        if topic.strip() == u"": topic = u"ULTRABOGUSDUMMYTOPIC" # 'topic' must never be empty
-        topicInput = topic.upper()
-        topicInput = re.sub(self._puncStripRE, " ", topicInput)
-        topicInput = re.sub(self._whitespaceRE, " ", topicInput)
-
-        # Pass the input off to the recursive pattern-matcher
-        patMatch, template = self._match(input_.split(), thatInput.split(), topicInput.split(), self._root)
-        if template == None:
-            return ""
-
-        # Extract the appropriate portion of the pattern, based on the
-        # starType argument.
-        words = None
-        if starType == 'star':
-            patMatch = patMatch[:patMatch.index(self._THAT)]
-            words = input_.split()
-        elif starType == 'thatstar':
-            patMatch = patMatch[patMatch.index(self._THAT)+1 : patMatch.index(self._TOPIC)]
-            words = thatInput.split()
-        elif starType == 'topicstar':
-            patMatch = patMatch[patMatch.index(self._TOPIC)+1 :]
-            words = topicInput.split()
-        else:
-            # unknown value
-            raise ValueError( "starType must be in ['star', 'thatstar', 'topicstar']" )
-        
-        # compare the input string to the matched pattern, word by word.
-        # At the end of this loop, if foundTheRightStar is true, start and
-        # end will contain the start and end indices (in "words") of
-        # the substring that the desired star matched.
-        foundTheRightStar = False
-        start = end = j = numStars = k = 0
-        for i in range(len(words)):
-            # This condition is true after processing a star
-            # that ISN'T the one we're looking for.
-            if i < k:
+        match = self.match(pattern, that, topic)
+        if match is None:
+            return u""
+        return match.star(starType, index)
+
+    def _match(self, words, thatWords, topicWords, root, failed=None, posKeys=None):
+        """Return a tuple (tem, spans, key, sections) where tem is the matched
+        template and spans is a tuple of three lists, holding the (start,
+        end) index ranges of words, thatWords and topicWords matched by
+        each wildcard in the pattern, that and topic respectively.  end is
+        None for a wildcard that runs to the end of its section.  key is
+        the _nodeId() of the node holding the template, and sections the
+        number of sections matched to reach it.
+
+        The trie is searched depth-first with an explicit stack, trying
+        the alternatives at each node in AIML priority order: "_", the
+        exact word, the bot name and finally "*", with the shortest
+        wildcard match first.  Whether a node can match the rest of the
+        input depends only on the node, the section of the input (pattern,
+        that or topic) and the position within it, so states that failed
+        once are remembered and never searched again.  This keeps wildcard
+        backtracking polynomial and the search independent of Python's
+        recursion limit.
+
+        The failed states are added to the failed set, if given.  To share
+        it between matches, posKeys must give for every section a list
+        mapping each position to a key identifying the input that remains
+        from there on (see _matchGroup()).
+
+        """
+        sections = (words, thatWords, topicWords)
+        sectionKeys = (None, self._THAT, self._TOPIC)
+        if failed is None:
+            failed = set()
+
+        # Stack entries are (action, node, section, pos, path).  path is
+        # the wildcard that led to node, if any, as a linked list of
+        # (section, start, end, parentPath).
+        stack = [(self._EXPAND, root, 0, 0, None)]
+        while stack:
+            action, node, section, pos, path = stack.pop()
+            if action == self._FAILED:
+                # all of the alternatives of this state failed.
+                failed.add(node)
                 continue
-            # If we're reached the end of the pattern, we're done.
-            if j == len(patMatch):
-                break
-            if not foundTheRightStar:
-                if patMatch[j] in [self._STAR, self._UNDERSCORE]: #we got a star
-                    numStars += 1
-                    if numStars == index:
-                        # This is the star we care about.
-                        foundTheRightStar = True
-                    start = i
-                    # Iterate through the rest of the string.
-                    for k in range (i, len(words)):
-                        # If the star is at the end of the pattern,
-                        # we know exactly where it ends.
-                        if j+1  == len (patMatch):
-                            end = len (words)
-                            break
-                        # If the words have started matching the
-                        # pattern again, the star has ended.
-                        if patMatch[j+1] == words[k]:
-                            end = k - 1
-                            i = k
-                            break
-                # If we just finished processing the star we cared
-                # about, we exit the loop early.
-                if foundTheRightStar:
-                    break
-            # Move to the next element of the pattern.
-            j += 1
-            
-        # extract the star words from the original, unmutilated input.
-        if foundTheRightStar:
-            #print( ' '.join(pattern.split()[start:end+1]) )
-            if starType == 'star': return ' '.join(pattern.split()[start:end+1])
-            elif starType == 'thatstar': return ' '.join(that.split()[start:end+1])
-            elif starType == 'topicstar': return ' '.join(topic.split()[start:end+1])
-        else: return u""
-
-    def _match(self, words, thatWords, topicWords, root):
-        """Return a tuple (pat, tem) where pat is a list of nodes, starting
-        at the root and leading to the matching pattern, and tem is the
-        matched template.
-
-        """ 
-        # base-case: if the word list is empty, return the current node's
-        # template.
-        if len(words) == 0:
-            # we're out of words.
-            pattern = []
-            template = None
-            if len(thatWords) > 0:
-                # If thatWords isn't empty, recursively
-                # pattern-match on the _THAT node with thatWords as words.
-                try:
-                    pattern, template = self._match(thatWords, [], topicWords, root[self._THAT])
-                    if pattern != None:
-                        pattern = [self._THAT] + pattern
-                except KeyError:
-                    pattern = []
-                    template = None
-            elif len(topicWords) > 0:
-                # If thatWords is empty and topicWords isn't, recursively pattern
-                # on the _TOPIC node with topicWords as words.
-                try:
-                    pattern, template = self._match(topicWords, [], [], root[self._TOPIC])
-                    if pattern != None:
-                        pattern = [self._TOPIC] + pattern
-                except KeyError:
-                    pattern = []
-                    template = None
-            if template == None:
-                # we're totally out of input.  Grab the template at this node.
-                pattern = []
-                try: template = root[self._TEMPLATE]
-                except KeyError: template = None
-            return (pattern, template)
-
-        first = words[0]
-        suffix = words[1:]
-        
-        # Check underscore.
-        # Note: this is causing problems in the standard AIML set, and is
-        # currently disabled.
-        if self._UNDERSCORE in root:
-            # Must include the case where suf is [] in order to handle the case
-            # where a * or _ is at the end of the pattern.
-            for j in range(len(suffix)+1):
-                suf = suffix[j:]
-                pattern, template = self._match(suf, thatWords, topicWords, root[self._UNDERSCORE])
-                if template is not None:
-                    newPattern = [self._UNDERSCORE] + pattern
-                    return (newPattern, template)
-
-        # Check first
-        if first in root:
-            pattern, template = self._match(suffix, thatWords, topicWords, root[first])
-            if template is not None:
-                newPattern = [first] + pattern
-                return (newPattern, template)
-
-        # check bot name
-        if self._BOT_NAME in root and first == self._botName:
-            pattern, template = self._match(suffix, thatWords, topicWords, root[self._BOT_NAME])
-            if template is not None:
-                newPattern = [first] + pattern
-                return (newPattern, template)
-        
-        # check star
-        if self._STAR in root:
-            # Must include the case where suf is [] in order to handle the case
-            # where a * or _ is at the end of the pattern.
-            for j in range(len(suffix)+1):
-                suf = suffix[j:]
-                pattern, template = self._match(suf, thatWords, topicWords, root[self._STAR])
-                if template is not None:
-                    newPattern = [self._STAR] + pattern
-                    return (newPattern, template)
+            if action == self._TAKE_TEMPLATE:
+                template = self._nodeTemplate(node)
+                if template is None:
+                    continue
+                spans = ([], [], [])
+                while path is not None:
+                    spanSection, spanStart, spanEnd, path = path
+                    if spanEnd == len(sections[spanSection]):
+                        spanEnd = None
+                    spans[spanSection].append((spanStart, spanEnd))
+                for sectionSpans in spans:
+                    sectionSpans.reverse()
+                return (template, spans, self._nodeId(node), section + 1)
+
+            if posKeys is None:
+                state = (self._nodeId(node), section, pos)
+            else:
+                state = (self._nodeId(node), section, posKeys[section][pos])
+            if state in failed:
+                continue
+            alternatives = []
+            sectionWords = sections[section]
+            if pos == len(sectionWords):
+                # we're out of words in this section.  Move on to the next
+                # non-empty section, falling back to the template at this
+                # node.
+                for nextSection in range(section + 1, len(sections)):
+                    if len(sections[nextSection]) > 0:
+                        child = self._child(node, sectionKeys[nextSection])
+                        if child is not None:
+                            alternatives.append((self._EXPAND, child, nextSection, 0, path))
+                        break
+                alternatives.append((self._TAKE_TEMPLATE, node, section, pos, path))
+            else:
+                first = sectionWords[pos]
+                end = len(sectionWords)
+                # Check underscore.  Must include the case where the
+                # wildcard eats every remaining word, in order to handle
+                # a * or _ at the end of the pattern.
+                child = self._child(node, self._UNDERSCORE)
+                if child is not None:
+                    for j in range(pos + 1, end + 1):
+                        alternatives.append((self._EXPAND, child, section, j, (section, pos, j, path)))
+                # Check first
+                child = self._child(node, first)
+                if child is not None:
+                    alternatives.append((self._EXPAND, child, section, pos + 1, path))
+                # check bot name
+                if first == self._botName:
+                    child = self._child(node, self._BOT_NAME)
+                    if child is not None:
+                        alternatives.append((self._EXPAND, child, section, pos + 1, path))
+                # check star
+                child = self._child(node, self._STAR)
+                if child is not None:
+                    for j in range(pos + 1, end + 1):
+                        alternatives.append((self._EXPAND, child, section, j, (section, pos, j, path)))
+            stack.append((self._FAILED, state, section, pos, path))
+            alternatives.reverse()
+            stack.extend(alternatives)
 
         # No matches were found.
-        return (None, None)         
+        return (None, None, None, None)
+
+    def _evict(self):
+        """Drop the parts of the node tree loaded by the last matches that
+        don't fit in memory.  Nothing is ever loaded here.
+        """
+
+    def _nodeId(self, node):
+        """Return a hashable value identifying node during a match."""
+        return id(node)
+
+    def _child(self, node, key):
+        """Return the child of node reached through key (a word or one of
+        the special keys), or None if there is no such child.
+        """
+        return node.get(key)
+
+    def _nodeTemplate(self, node):
+        """Return the template stored at node, or None."""
+        return node.get(self._TEMPLATE)
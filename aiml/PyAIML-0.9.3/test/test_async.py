@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+import os.path
+import sys
+import threading
+import unittest
+
+if sys.version_info >= (3, 7):
+    import asyncio
+    from aiml.AsyncKernel import AsyncKernel
+
+
+@unittest.skipIf(sys.version_info < (3, 7), "asyncio front-end needs Python 3.7")
+class TestAsyncKernel( unittest.TestCase ):
+
+    longMessage = True
+
+    def setUp(self):
+        self.k = AsyncKernel(maxWorkers=4, maxPending=8)
+        self.k.verbose(False)
+        testfile = os.path.join(os.path.dirname(__file__),"self-test.aiml")
+        self.k.learn(testfile)
+
+    def tearDown(self):
+        self.k.close()
+
+    def _history(self, sessionID):
+        return list(self.k.getSessionData(sessionID)[self.k._inputHistory])
+
+    def test01_arespond( self ):
+        response = asyncio.run(self.k.arespond("test srai", "s"))
+        self.assertEqual( "srai test passed", response )
+        self.assertEqual( 0, self.k.pending() )
+
+    def test02_ordering( self ):
+        '''replies to a session come in the order they were asked for'''
+        inputs = ["test input %d" % i for i in range(8)]
+        async def converse():
+            return await asyncio.gather(*[self.k.arespond(text, "s") for text in inputs])
+        asyncio.run(converse())
+        self.assertEqual( inputs, self._history("s") )
+
+    def test03_cancel( self ):
+        '''a cancelled reply that hasn't started is never processed'''
+        release = threading.Event()
+        respond = self.k.respond
+        def blockingRespond(input_, sessionID):
+            release.wait()
+            return respond(input_, sessionID)
+        self.k.respond = blockingRespond
+        async def converse():
+            first = asyncio.ensure_future(self.k.arespond("test input 1", "s"))
+            second = asyncio.ensure_future(self.k.arespond("test input 2", "s"))
+            third = asyncio.ensure_future(self.k.arespond("test input 3", "s"))
+            await asyncio.sleep(0.01)
+            second.cancel()
+            release.set()
+            await asyncio.gather(first, second, third, return_exceptions=True)
+            return second.cancelled()
+        self.assertTrue( asyncio.run(converse()) )
+        self.assertEqual( ["test input 1", "test input 3"], self._history("s") )
+
+    def test04_backpressure( self ):
+        '''callers wait once maxPending replies are queued'''
+        release = threading.Event()
+        respond = self.k.respond
+        def blockingRespond(input_, sessionID):
+            release.wait()
+            return respond(input_, sessionID)
+        self.k.respond = blockingRespond
+        async def converse():
+            replies = [asyncio.ensure_future(self.k.arespond("test srai", "s%d" % i))
+                       for i in range(12)]
+            await asyncio.sleep(0.01)
+            pending = self.k.pending()
+            release.set()
+            await asyncio.gather(*replies)
+            return pending
+        self.assertEqual( 8, asyncio.run(converse()) )
+        self.assertEqual( 0, self.k.pending() )
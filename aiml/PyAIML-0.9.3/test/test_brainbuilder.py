@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+import os.path
+import shutil
+import tempfile
+import unittest
+
+from aiml import Kernel
+from aiml.BrainBuilder import BrainBuilder
+from aiml.CompactPatternMgr import CompactPatternMgr
+
+
+def category(pattern, template):
+    return "<category><pattern>%s</pattern><template>%s</template></category>" % (pattern, template)
+
+
+class TestBrainBuilder( unittest.TestCase ):
+
+    longMessage = True
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.files = [os.path.join(self.dir, name) for name in ("a.aiml", "b.aiml", "c.aiml")]
+        self._write(0, [("HELLO", "hi from a"), ("SHARED", "a")])
+        self._write(1, [("SHARED", "b"), ("BYE", "bye")])
+        self._write(2, [("HELLO *", "hello <star/>")])
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, index, categories):
+        with open(self.files[index], "w") as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?><aiml version="1.0">%s</aiml>'
+                    % "".join(category(p, t) for p, t in categories))
+
+    def _build(self, name, files, full=False, processes=1):
+        builder = BrainBuilder(os.path.join(self.dir, name))
+        builder.verbose(False)
+        return builder.build(files, full, processes)
+
+    def _trie(self, name):
+        brain = CompactPatternMgr()
+        brain.restore(os.path.join(self.dir, name))
+        return brain.thaw()._root
+
+    def _assertSameAsFullBuild(self, files):
+        self._build("full.brn", files, full=True)
+        self.assertEqual( self._trie("full.brn"), self._trie("inc.brn") )
+
+    def test01_unchanged( self ):
+        self.assertEqual( self.files, self._build("inc.brn", self.files) )
+        self.assertEqual( [], self._build("inc.brn", self.files) )
+
+    def test02_edit( self ):
+        self._build("inc.brn", self.files)
+        self._write(2, [("HELLO *", "changed"), ("GOOD NIGHT", "night")])
+        self.assertEqual( [self.files[2]], self._build("inc.brn", self.files) )
+        self._assertSameAsFullBuild(self.files)
+
+    def test03_last_file_wins( self ):
+        self._build("inc.brn", self.files)
+        # b.aiml no longer defines SHARED, so a.aiml's version comes back
+        self._write(1, [("BYE", "bye")])
+        self.assertEqual( self.files[:2], self._build("inc.brn", self.files) )
+        self._assertSameAsFullBuild(self.files)
+        # ... until c.aiml defines it too
+        self._write(2, [("SHARED", "c")])
+        self._build("inc.brn", self.files)
+        self._assertSameAsFullBuild(self.files)
+
+    def test04_removed_file( self ):
+        self._build("inc.brn", self.files)
+        self._build("inc.brn", self.files[:2])
+        self._assertSameAsFullBuild(self.files[:2])
+
+    def test05_processes( self ):
+        self._build("inc.brn", self.files, processes=2)
+        self._write(1, [("BYE", "bye")])
+        self._build("inc.brn", self.files, processes=2)
+        self._assertSameAsFullBuild(self.files)
+
+    def test06_learn_many( self ):
+        learned = Kernel()
+        learned.verbose(False)
+        for f in self.files:
+            learned.learn(f)
+        parallel = Kernel()
+        parallel.verbose(False)
+        parallel.learn_many(self.files, 2)
+        self.assertEqual( learned._brain._root, parallel._brain._root )
+        self.assertEqual( "b", parallel.respond("shared") )
+
+    def test07_saved_state( self ):
+        kernel = Kernel()
+        kernel.verbose(False)
+        kernel.setBotPredicate("master", "a")
+        builder = BrainBuilder(os.path.join(self.dir, "inc.brn"), kernel=kernel)
+        builder.verbose(False)
+        builder.build(self.files)
+        # changing a predicate writes the brain again, without parsing
+        kernel.setBotPredicate("master", "b")
+        self.assertEqual( [], builder.build(self.files) )
+        loaded = Kernel()
+        loaded.verbose(False)
+        loaded.loadBrain(os.path.join(self.dir, "inc.brn"))
+        self.assertEqual( "b", loaded.getBotPredicate("master") )
+        self.assertEqual( "b", loaded.respond("shared") )
+
+    def test08_malformed( self ):
+        # a.aiml breaks off in the middle of a category
+        with open(self.files[0], "a") as f:
+            f.write(category("BROKEN", "x")[:-20])
+        self._build("inc.brn", self.files)
+        brain = Kernel()
+        brain.verbose(False)
+        brain.loadBrain(os.path.join(self.dir, "inc.brn"))
+        self.assertEqual( "hi from a", brain.respond("hello") )
+        self.assertEqual( "", brain.respond("broken") )
+        # the categories before the error are parsed again when needed
+        self._write(1, [("BYE", "bye")])
+        self._build("inc.brn", self.files)
+        self._assertSameAsFullBuild(self.files)
+
+    def test09_stream( self ):
+        kernel = Kernel()
+        kernel.verbose(False)
+        streamed = []
+        self.assertTrue( kernel._streamFile(self.files[1],
+                                            lambda key, tem: streamed.append((key, tem))) )
+        self.assertEqual( list(kernel._parseFile(self.files[1]).items()), streamed )
@@ -0,0 +1,87 @@
+# -*- coding: latin-1 -*-
+
+from __future__ import print_function
+import os.path
+import tempfile
+import unittest
+
+from aiml import Kernel
+from aiml.CompactPatternMgr import CompactPatternMgr, isCompactBrain
+from aiml.PatternMgr import PatternMgr
+
+from . import test_kernel
+
+
+class TestCompactKernel( test_kernel.TestKernel ):
+    '''Run the whole Kernel test suite against a compact brain'''
+
+    def setUp(self):
+        test_kernel.TestKernel.setUp(self)
+        self.k.compactBrain()
+
+
+class TestCompactPatternMgr( unittest.TestCase ):
+
+    longMessage = True
+
+    def setUp(self):
+        self.k = Kernel()
+        self.k.verbose(False)
+        testfile = os.path.join(os.path.dirname(__file__),"self-test.aiml")
+        self.k.learn(testfile)
+        self.mgr = self.k._brain
+        self.compact = CompactPatternMgr.fromPatternMgr(self.mgr)
+
+    def _template(self, mgr, input_):
+        match = mgr.match(input_, "", "")
+        return match.template if match is not None else None
+
+    def test01_match( self ):
+        '''compact and dictionary tries match the same templates'''
+        for input_ in ("test bot", "test star creamy goodness middle",
+                       "You should test star begin", "no such pattern"):
+            self.assertEqual( self._template(self.mgr, input_),
+                              self._template(self.compact, input_),
+                              msg="input=%s" % input_ )
+
+    def test02_star( self ):
+        '''compact and dictionary tries return the same stars'''
+        input_ = "test star having multiple stars in a pattern makes me extremely happy"
+        for index in (1, 2, 3):
+            self.assertEqual( self.mgr.star("star", input_, "", "", index),
+                              self.compact.star("star", input_, "", "", index) )
+
+    def test03_saverestore( self ):
+        '''compact brains survive a save/restore cycle'''
+        fd, filename = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            self.k.saveBrain(filename, compact=True)
+            self.assertTrue( isCompactBrain(filename) )
+            k = Kernel()
+            k.verbose(False)
+            k.loadBrain(filename)
+            self.assertIsInstance( k._brain, CompactPatternMgr )
+            self.assertEqual( self.k.numCategories(), k.numCategories() )
+            self.assertEqual( self._template(self.mgr, "test bot"),
+                              self._template(k._brain, "test bot") )
+            self.assertEqual( self.mgr._root, k._brain.thaw()._root )
+        finally:
+            os.remove(filename)
+
+    def test04_thaw( self ):
+        '''thawing a compact brain gives back the original trie'''
+        self.assertEqual( self.mgr._root, self.compact.thaw()._root )
+        self.assertRaises( TypeError, self.compact.add, ("A", "", ""), ["template", {}] )
+
+    def test05_shared_templates( self ):
+        '''nodes with equal templates share one copy'''
+        mgr = PatternMgr()
+        mgr.add(("HI", "", ""), ["template", {}, ["srai", {}, "HELLO"]])
+        mgr.add(("HOWDY", "", ""), ["template", {}, ["srai", {}, "HELLO"]])
+        compact = CompactPatternMgr.fromPatternMgr(mgr)
+        self.assertEqual( 1, len(compact._templateOffsets) - 1 )
+        compact.patch(added=[(("YO", "", ""), ["template", {}, ["srai", {}, "HELLO"]])])
+        self.assertEqual( 1, len(compact._templateOffsets) - 1 )
+        self.assertEqual( ["template", {}, ["srai", {}, "HELLO"]],
+                          compact.match("yo", "", "").template )
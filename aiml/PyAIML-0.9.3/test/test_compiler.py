@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+import os.path
+import random
+import time
+import unittest
+
+from aiml import Kernel
+from aiml.PatternMgr import PatternMgr
+
+from . import test_kernel
+
+BOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       "..", "..", "..", "bot")
+
+
+class TestCompiledKernel( test_kernel.TestKernel ):
+    """Run the Kernel tests with the template compiler enabled."""
+
+    def setUp(self):
+        test_kernel.TestKernel.setUp(self)
+        self.k.compileTemplates()
+
+
+class TestCompilerCache( unittest.TestCase ):
+
+    def test01_compact( self ):
+        """templates of compact brains, which are new copies on every
+        match, are compiled only once"""
+        k = Kernel()
+        k.verbose(False)
+        k.learn(os.path.join(os.path.dirname(__file__), "self-test.aiml"))
+        k.compactBrain()
+        k.compileTemplates()
+        k.setResponseCacheSize(0)
+        compiled = []
+        compile = k._templateCompiler.compile
+        def countingCompile(elem):
+            compiled.append(elem)
+            return compile(elem)
+        k._templateCompiler.compile = countingCompile
+        for i in range(5):
+            self.assertEqual( "srai test passed", k.respond("test srai", "s%d" % i) )
+        # TEST SRAI and SRAI TARGET
+        self.assertEqual( 2, len(compiled) )
+
+
+def patterns(root, limit):
+    """Return inputs matching up to limit of the patterns in the
+    dictionary trie root, with every wildcard filled in.
+    """
+    inputs = []
+    stack = [(root, [])]
+    while stack and len(inputs) < limit:
+        node, words = stack.pop()
+        for key, child in sorted(node.items(), key=lambda item: str(item[0])):
+            if key == PatternMgr._THAT:
+                inputs.append(" ".join(words))
+            elif key in (PatternMgr._STAR, PatternMgr._UNDERSCORE):
+                stack.append((child, words + ["blue cheese"]))
+            elif key == PatternMgr._BOT_NAME:
+                stack.append((child, words + ["Nameless"]))
+            elif key != PatternMgr._TEMPLATE:
+                stack.append((child, words + [key]))
+    return inputs
+
+
+class TestCompilerDifferential( unittest.TestCase ):
+    """The compiled templates of the shipped brains give exactly the same
+    responses as the interpreted ones.
+    """
+
+    longMessage = True
+
+    def _compare(self, name, limit=1500):
+        brain = os.path.join(BOT_DIR, name + ".brn")
+        if not os.path.exists(brain):
+            self.skipTest("%s not found" % brain)
+        interpreted = Kernel()
+        compiled = Kernel()
+        for k in (interpreted, compiled):
+            k.verbose(False)
+            k.loadBrain(brain)
+            k.setResponseCacheSize(0)
+        compiled.compileTemplates()
+        asctime = time.asctime
+        time.asctime = lambda: "Sat Oct 17 12:00:00 2026"
+        try:
+            for i, input_ in enumerate(patterns(interpreted._brain._root, limit)):
+                random.seed(i)
+                expected = interpreted.respond(input_)
+                random.seed(i)
+                self.assertEqual( expected, compiled.respond(input_), msg="input=%s" % input_ )
+        finally:
+            time.asctime = asctime
+
+    def test_alisochka( self ):
+        self._compare("alisochka")
+
+    def test_sara( self ):
+        self._compare("sara")
@@ -1,8 +1,10 @@
 # -*- coding: latin-1 -*-
 
 from __future__ import print_function
+import json
 import time
 import os.path
+import tempfile
 import unittest
 
 from aiml import Kernel
@@ -141,6 +143,117 @@ class TestKernel( unittest.TestCase ):
     def test18_whitespace( self ):
         self._testTag('whitespace preservation', 'test whitespace', ["Extra   Spaces\n   Rule!   (but not in here!)    But   Here   They   Do!"])
 
+    def test19_response_cache( self ):
+        # responses are cached by input, that and topic; a new session
+        # has no 'that' yet.
+        stats = self.k.getResponseCacheStats()
+        for session in ("one", "two"):
+            self.assertEqual( "srai test passed", self.k.respond("test srai", session) )
+        self.assertEqual( stats["hits"] + 1, self.k.getResponseCacheStats()["hits"] )
+        # templates with side effects are never cached
+        stats = self.k.getResponseCacheStats()
+        for session in ("one", "two"):
+            self.k.respond("test srai infinite", session)
+            self.k.respond("test get and set", session)
+        self.assertEqual( stats["hits"], self.k.getResponseCacheStats()["hits"] )
+        # changing a bot predicate forgets the cached responses
+        self._testTag('bot', 'test bot', ["My name is Nameless"])
+        self.k.setBotPredicate("name", "Arthur")
+        self._testTag('bot', 'test bot', ["My name is Arthur"])
+        self.k.setResponseCacheSize(0)
+        self.assertEqual( 0, self.k.getResponseCacheStats()["size"] )
+
+    def test20_saved_state( self ):
+        # bot predicates and subbers are saved with the brain
+        self.k.setBotPredicate("name", "Arthur")
+        self.k._subbers['gender']['robot'] = 'android'
+        fd, filename = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            self.k.saveBrain(filename)
+            k = Kernel()
+            k.verbose(False)
+            k.loadBrain(filename)
+        finally:
+            os.remove(filename)
+        self.assertEqual( "Arthur", k.getBotPredicate("name") )
+        self.assertEqual( "My name is Arthur", k.respond("test bot") )
+        self.assertEqual( "android", k._subbers['gender'].sub("robot") )
+        self.assertFalse( k._subbers['normal']._tableIsDirty )
+
+    def test21_stats( self ):
+        self.assertEqual( None, self.k.getStats() )
+        self.k.collectStats()
+        self.k.verbose(False)
+        self.k.respond("test srai", "a")
+        self.k.respond("test srai", "b")
+        self.k.respond("test sr test srai", "c")
+        self.k.respond("no such pattern", "d")
+        stats = json.loads(json.dumps(self.k.getStats()))
+        self.assertEqual( 4, stats["responses"] )
+        # "test srai" in session b, and again through the <sr/> of c;
+        # the categories behind a cached response count as hits
+        self.assertEqual( 2, stats["cachedResponses"] )
+        self.assertEqual( {"TEST SRAI/*/*": 3, "SRAI TARGET/*/*": 3, "TEST SR */*/*": 1},
+                          stats["categoryHits"] )
+        self.assertEqual( {"no such pattern": 1}, stats["noMatch"] )
+        self.assertEqual( 3, stats["sraiDepth"]["max"] )
+        self.assertEqual( 4, stats["matchTime"]["count"] )
+        self.k.collectStats(False)
+        self.assertEqual( None, self.k.getStats() )
+
+    def test22_srai_memo( self ):
+        # a reduction made twice in a sentence is matched once, until a
+        # <set> changes a predicate
+        self.k.collectStats()
+        self.k.setPredicate("memo", "same")
+        self._testTag('srai memo', 'test srai memo', ["same same changed"])
+        stats = self.k.getStats()
+        self.assertEqual( 1, stats["memoizedResponses"] )
+        self.assertEqual( 3, stats["matchTime"]["count"] )
+        self.assertEqual( 3, stats["categoryHits"]["MEMO TARGET/*/*"] )
+        # random responses are never memoized
+        self.k.respond("test srai memo random")
+        self.assertEqual( 1, self.k.getStats()["memoizedResponses"] )
+
+    def test23_srai_memo_learn( self ):
+        # a <learn> halfway through a sentence makes the reductions after
+        # it see the new categories
+        tmpdir = tempfile.mkdtemp()
+        a = os.path.join(tmpdir, "a.aiml")
+        b = os.path.join(tmpdir, "b.aiml")
+        aiml = """<?xml version="1.0" encoding="ISO-8859-1"?>
+<aiml version="1.0"><category><pattern>%s</pattern><template>%s</template></category></aiml>
+"""
+        with open(a, "w") as f:
+            f.write(aiml % ("TEST LEARN MEMO", "[<srai>NEW THING</srai>]"
+                            "<think><learn>%s</learn></think>"
+                            "[<srai>NEW THING</srai>]" % b))
+        with open(b, "w") as f:
+            f.write(aiml % ("NEW THING", "learned"))
+        try:
+            self.k.verbose(False)
+            self.k.learn(a)
+            self.assertEqual( "[][learned]", self.k.respond("test learn memo") )
+            self.assertEqual( "learned", self.k.respond("new thing") )
+        finally:
+            os.remove(a)
+            os.remove(b)
+            os.rmdir(tmpdir)
+
+    def test24_impurities( self ):
+        # the template of an impure category is only walked once
+        walked = []
+        templateImpurities = self.k._templateImpurities
+        def countingImpurities(elem):
+            walked.append(elem[0])
+            return templateImpurities(elem)
+        self.k._templateImpurities = countingImpurities
+        for session in ("one", "two", "one"):
+            self.assertEqual( "I like cheese. My favorite food is cheese",
+                              self.k.respond("test get and set", session) )
+        self.assertEqual( 1, len(walked) )
+
         # Run an interactive interpreter
         #print( "\nEntering interactive mode (ctrl-c to exit)" )
         #while True: print( self.k.respond(raw_input("> ")) )
@@ -0,0 +1,151 @@
+# -*- coding: latin-1 -*-
+
+from __future__ import print_function
+import os
+import os.path
+import shutil
+import tempfile
+import unittest
+
+from aiml import Kernel
+from aiml.CompactPatternMgr import CompactPatternMgr
+from aiml.OverlayPatternMgr import OverlayPatternMgr
+from aiml.PatternMgr import PatternMgr
+
+from . import test_kernel
+
+
+AIML = """<?xml version="1.0" encoding="ISO-8859-1"?>
+<aiml version="1.0">
+%s
+</aiml>
+"""
+
+CATEGORY = """<category><pattern>%s</pattern><template>%s</template></category>"""
+
+
+def textTemplate(text):
+    return ["template", {}, ["text", {"xml:space": "default"}, text]]
+
+
+class TestOverlayKernel( test_kernel.TestKernel ):
+    '''Run the whole Kernel test suite against an overlay holding half of
+    the categories, over a compact brain holding the other half'''
+
+    def setUp(self):
+        test_kernel.TestKernel.setUp(self)
+        categories = sorted(self.k._brain._categories())
+        base = PatternMgr()
+        for data, template in categories[::2]:
+            base.add(data, template)
+        brain = OverlayPatternMgr(CompactPatternMgr.fromPatternMgr(base))
+        brain = brain.copyWith(categories[1::2])
+        brain.setBotName(self.k.getBotPredicate("name"))
+        self.k._brain = brain
+        self.k._brainChanged()
+
+
+class TestOverlayPatternMgr( unittest.TestCase ):
+
+    longMessage = True
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        base = PatternMgr()
+        base.add(("HELLO THERE", "*", "*"), textTemplate("base there"))
+        base.add(("HELLO *", "*", "*"), textTemplate("base star"))
+        self.base = CompactPatternMgr.fromPatternMgr(base)
+        self.overlay = OverlayPatternMgr(self.base).copyWith([
+            (("HELLO *", "*", "*"), textTemplate("overlay star")),
+            (("*", "*", "*"), textTemplate("overlay catch-all")),
+            (("BYE", "*", "*"), textTemplate("overlay bye")),
+        ])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _template(self, mgr, input_):
+        match = mgr.match(input_, "", "")
+        return match.template[2][2] if match is not None else None
+
+    def _kernel(self, categories):
+        """Return a Kernel with a compact brain learned from an AIML file
+        holding categories, a list of (pattern, template) pairs."""
+        filename = os.path.join(self.tmpdir, "base.aiml")
+        with open(filename, "w") as f:
+            f.write(AIML % "\n".join(CATEGORY % c for c in categories))
+        k = Kernel()
+        k.verbose(False)
+        k.learn(filename)
+        k.compactBrain()
+        return k
+
+    def test01_priority( self ):
+        '''the overlay and the base match as a single trie'''
+        self.assertEqual( self._template(self.overlay, "hello there"), "base there" )
+        self.assertEqual( self._template(self.overlay, "hello you"), "overlay star" )
+        self.assertEqual( self._template(self.overlay, "bye"), "overlay bye" )
+        self.assertEqual( self._template(self.overlay, "anything"), "overlay catch-all" )
+        self.assertEqual( self.overlay.numTemplates(), 4 )
+        # the base is untouched
+        self.assertEqual( self._template(self.base, "hello you"), "base star" )
+        self.assertEqual( self._template(self.base, "bye"), None )
+        self.assertEqual( self.base.numTemplates(), 2 )
+
+    def test02_learn( self ):
+        '''runtime <learn> and learning into a compact brain go to an
+        overlay, leaving the base as it is'''
+        taught = os.path.join(self.tmpdir, "taught.aiml")
+        with open(taught, "w") as f:
+            f.write(AIML % (CATEGORY % ("WHAT IS NEW", "an overlay")))
+        k = self._kernel([("TEACH ME", "<learn>%s</learn>done" % taught)])
+        base = k._brain
+        self.assertEqual( k.respond("teach me"), "done" )
+        self.assertIsInstance( k._brain, OverlayPatternMgr )
+        self.assertIs( k._brain.base(), base )
+        self.assertEqual( k.respond("what is new"), "an overlay" )
+        self.assertEqual( k.numCategories(), 2 )
+        self.assertEqual( base.numTemplates(), 1 )
+
+        # a dictionary brain gets an overlay too, but only from <learn>
+        k = Kernel()
+        k.verbose(False)
+        k.learn(taught)
+        self.assertIs( type(k._brain), PatternMgr )
+        k.learn(os.path.join(self.tmpdir, "base.aiml"))
+        self.assertIs( type(k._brain), PatternMgr )
+        base = k._brain
+        k.respond("teach me")
+        self.assertIs( k._brain.base(), base )
+
+    def test03_saveload( self ):
+        '''overlays survive a save/load cycle on their own'''
+        k = self._kernel([("HELLO", "hi")])
+        k._learnCategories(self.overlay.overlay()._categories())
+        filename = os.path.join(self.tmpdir, "overlay.brn")
+        k.saveOverlay(filename)
+        k2 = self._kernel([("HELLO", "hi")])
+        base = k2._brain
+        k2.loadOverlay(filename)
+        self.assertIs( k2._brain.base(), base )
+        self.assertEqual( k2.numCategories(), k.numCategories() )
+        self.assertEqual( k2.respond("hello you"), "overlay star" )
+        k2.discardOverlay()
+        self.assertIs( k2._brain, base )
+        self.assertEqual( k2.respond("hello you"), "" )
+
+    def test04_thaw( self ):
+        '''thawing merges the overlay into the base'''
+        mgr = PatternMgr()
+        for data, template in self.base.thaw()._categories():
+            mgr.add(data, template)
+        for data, template in self.overlay.overlay()._categories():
+            mgr.add(data, template)
+        thawed = self.overlay.thaw()
+        self.assertEqual( thawed._root, mgr._root )
+        self.assertEqual( thawed.numTemplates(), self.overlay.numTemplates() )
+        filename = os.path.join(self.tmpdir, "merged.brn")
+        self.overlay.save(filename)
+        compact = CompactPatternMgr()
+        compact.restore(filename)
+        self.assertEqual( compact.thaw()._root, mgr._root )
@@ -0,0 +1,114 @@
+# -*- coding: latin-1 -*-
+
+from __future__ import print_function
+import unittest
+
+from aiml.PatternMgr import PatternMgr
+
+
+class TestPatternMgr( unittest.TestCase ):
+
+    longMessage = True
+
+    def setUp(self):
+        self.mgr = PatternMgr()
+        self.mgr.setBotName("ALICE")
+        for pattern, that, topic in [
+                ("HELLO _", "*", "*"),
+                ("HELLO THERE", "*", "*"),
+                ("HELLO BOT_NAME", "*", "*"),
+                ("HELLO *", "*", "*"),
+                ("* ROBOT *", "*", "*"),
+                ("YES", "DO YOU LIKE *", "*"),
+                ("YES", "*", "*"),
+                ("WHAT", "*", "FRUIT"),
+                ]:
+            self.mgr.add((pattern, that, topic), "%s/%s/%s" % (pattern, that, topic))
+
+    def tearDown(self):
+        del self.mgr
+
+    def _match(self, input_, that="", topic=""):
+        match = self.mgr.match(input_, that, topic)
+        return match.template if match is not None else None
+
+    def test01_priority( self ):
+        '''"_" beats an exact word, which beats the bot name and "*"'''
+        self.assertEqual( "HELLO _/*/*", self._match("hello there") )
+        del self.mgr._root["HELLO"][self.mgr._UNDERSCORE]
+        self.assertEqual( "HELLO THERE/*/*", self._match("hello there") )
+        self.assertEqual( "HELLO BOT_NAME/*/*", self._match("hello alice") )
+        self.assertEqual( "HELLO */*/*", self._match("hello bob") )
+
+    def test02_star( self ):
+        '''wildcards match the shortest span that lets the pattern match'''
+        input_ = "my robot is a robot too"
+        self.assertEqual( "my", self.mgr.star("star", input_, "", "", 1) )
+        self.assertEqual( "is a robot too", self.mgr.star("star", input_, "", "", 2) )
+
+    def test03_match_spans( self ):
+        '''a single match records the spans of every wildcard'''
+        match = self.mgr.match("my robot is a robot too", "Do you like green cheese?", "")
+        self.assertEqual( "my", match.star("star", 1) )
+        self.assertEqual( "is a robot too", match.star("star", 2) )
+        self.assertEqual( "", match.star("star", 3) )
+        match = self.mgr.match("yes", "Do you like green cheese?", "")
+        self.assertEqual( "green cheese?", match.star("thatstar", 1) )
+        self.assertEqual( "ULTRABOGUSDUMMYTOPIC", match.star("topicstar", 1) )
+        self.assertRaises( ValueError, match.star, "nostar", 1 )
+
+    def test04_that_topic( self ):
+        '''that and topic take part in the match'''
+        self.assertEqual( "YES/DO YOU LIKE */*", self._match("yes", "Do you like cheese?") )
+        self.assertEqual( "YES/*/*", self._match("yes", "How are you?") )
+        self.assertEqual( "WHAT/*/FRUIT", self._match("what", "", "fruit") )
+        self.assertEqual( None, self._match("what", "", "vegetables") )
+
+    def test05_long_input( self ):
+        '''long inputs don't hit the recursion limit'''
+        words = " ".join(["A"] * 5000)
+        self.mgr.add((words, "*", "*"), "long")
+        self.assertEqual( "long", self._match(words) )
+        self.assertEqual( None, self._match(words + " B") )
+
+    def test06_normalized( self ):
+        '''match() accepts input normalized once up front'''
+        that = self.mgr.normalize("Do you like green-cheese?")
+        self.assertEqual( ["DO", "YOU", "LIKE", "GREEN", "CHEESE"], that.words )
+        match = self.mgr.match(self.mgr.normalize("yes"), that, self.mgr.normalize(""))
+        self.assertEqual( "YES/DO YOU LIKE */*", match.template )
+        self.assertEqual( "green-cheese?", match.star("thatstar", 1) )
+
+    def test07_match_many( self ):
+        '''bulk matching gives the same results as matching one by one'''
+        queries = [("hello there", "", ""), ("my robot is a robot too", "", ""),
+                   ("yes", "Do you like cheese?", ""), ("yes", "", ""),
+                   ("what", "", "fruit"), ("what", "", ""), ("", "", ""),
+                   ("hello there", "", "")]
+        for processes in (None, 2):
+            matches = self.mgr.match_many(queries, processes)
+            self.assertEqual( len(queries), len(matches) )
+            for query, match in zip(queries, matches):
+                expected = self.mgr.match(*query)
+                if expected is None:
+                    self.assertIsNone( match, msg="query=%s" % (query,) )
+                else:
+                    self.assertEqual( expected.template, match.template )
+                    self.assertEqual( expected.star("star", 2), match.star("star", 2) )
+
+    def test08_shared_templates( self ):
+        '''equal templates, and equal elements in templates, are stored once'''
+        srai = ['srai', {}, ['text', {'xml:space': 'default'}, 'HELLO']]
+        first = ['template', {}, ['text', {'xml:space': 'default'}, '\n  '], srai]
+        second = ['template', {}, ['text', {'xml:space': 'default'}, '\n\t\t'],
+                  ['srai', {}, ['text', {'xml:space': 'default'}, 'HELLO']]]
+        third = ['template', {}, ['think', {}, srai]]
+        self.mgr.add(("HI", "", ""), first)
+        self.mgr.add(("HOWDY", "", ""), second)
+        self.mgr.add(("YO", "", ""), third)
+        template = self._match("hi")
+        self.assertIs( template, self._match("howdy") )
+        self.assertIs( template[3], self._match("yo")[2][2] )
+        # whitespace is collapsed up front; the templates given are untouched
+        self.assertEqual( ['text', {'xml:space': 'preserve'}, ' '], template[2] )
+        self.assertEqual( '\n  ', first[2][2] )
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+import os.path
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from aiml import Kernel
+
+
+class TestSessionStore( unittest.TestCase ):
+
+    longMessage = True
+
+    def setUp(self):
+        self.k = Kernel()
+        self.k.verbose(False)
+        self.testfile = os.path.join(os.path.dirname(__file__),"self-test.aiml")
+        self.k.learn(self.testfile)
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test01_history( self ):
+        '''histories keep the last _maxHistorySize entries'''
+        for i in range(self.k._maxHistorySize + 5):
+            self.k.respond("test input %d" % i, "s")
+        history = self.k.getSessionData("s")[self.k._inputHistory]
+        self.assertEqual( self.k._maxHistorySize, len(history) )
+        self.assertEqual( "test input %d" % (self.k._maxHistorySize + 4), history[-1] )
+
+    def test02_lru( self ):
+        '''least recently used sessions are dropped, but never the global one'''
+        self.k.setSessionLimits(maxSessions=3)
+        for s in ("a", "b", "c", "a", "d"):
+            self.k.setPredicate("name", s, s)
+        self.assertEqual( "", self.k.getPredicate("name", "b") )
+        self.assertEqual( "a", self.k.getPredicate("name", "a") )
+        self.assertEqual( "d", self.k.getPredicate("name", "d") )
+        self.assertEqual( 3, len(self.k._sessions) )
+        self.assertTrue( self.k._globalSessionID in self.k.getSessionData() )
+
+    def test03_ttl( self ):
+        '''idle sessions expire'''
+        self.k.setSessionLimits(ttl=0.05)
+        self.k.setPredicate("name", "old", "old")
+        time.sleep(0.1)
+        self.k.setPredicate("name", "new", "new")
+        self.assertEqual( "", self.k.getPredicate("name", "old") )
+        self.assertEqual( "new", self.k.getPredicate("name", "new") )
+
+    def test04_spill( self ):
+        '''evicted sessions are spilled to disk and restored when used'''
+        self.k.setSessionLimits(maxSessions=2, spillDir=self.dir)
+        self.k.respond("test thatstar", "a")
+        self.k.respond("hello", "b")
+        self.k.respond("hello", "c")
+        data = self.k.getSessionData(memory=True)
+        self.assertEqual( 0, data["a"]["_memory"] )
+        self.assertTrue( data["c"]["_memory"] > 0 )
+        self.assertEqual( ["test thatstar"], list(data["a"][self.k._inputHistory]) )
+        self.assertEqual( 'I just said "beans"', self.k.respond("test thatstar", "a") )
+        self.k._deleteSession("a")
+        self.assertFalse( "a" in self.k.getSessionData() )
+        self.assertFalse( os.path.exists(self.k._sessions._spillFile("a")) )
+        self.assertEqual( 2, len(os.listdir(self.dir)) )
+
+    def test05_threads( self ):
+        '''sessions are served in parallel while the brain is relearned'''
+        errors = []
+        def converse(session):
+            for i in range(20):
+                if self.k.respond("test srai", session) != "srai test passed":
+                    errors.append(session)
+        threads = [threading.Thread(target=converse, args=("t%d" % i,)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for i in range(3):
+            self.k.learn(self.testfile)
+        for t in threads:
+            t.join()
+        self.assertEqual( [], errors )
+        for i in range(4):
+            history = self.k.getSessionData("t%d" % i)[self.k._inputHistory]
+            self.assertEqual( ["test srai"] * self.k._maxHistorySize, list(history) )
+
+    def test06_copy_on_write( self ):
+        '''learning leaves the previous brain untouched'''
+        brain = self.k._brain
+        count = brain.numTemplates()
+        newBrain = brain.copyWith([((u"TEST NEW", u"", u""), ["template", {}, "new"])])
+        self.assertEqual( count, brain.numTemplates() )
+        self.assertEqual( count + 1, newBrain.numTemplates() )
+        self.assertEqual( None, brain.match(u"TEST NEW", u"", u"") )
+        self.assertTrue( brain._root[u"SRAI"] is newBrain._root[u"SRAI"] )
+        self.assertFalse( brain._root[u"TEST"] is newBrain._root[u"TEST"] )
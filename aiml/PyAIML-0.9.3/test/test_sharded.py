@@ -0,0 +1,90 @@
+# -*- coding: latin-1 -*-
+
+from __future__ import print_function
+import os.path
+import tempfile
+import unittest
+
+from aiml import Kernel
+from aiml.ShardedPatternMgr import ShardedPatternMgr, isShardedBrain
+
+from . import test_kernel
+
+
+def shardedBrain(kernel):
+    """Save the brain of kernel in sharded format, and return the name of
+    the file."""
+    fd, filename = tempfile.mkstemp()
+    os.close(fd)
+    ShardedPatternMgr.fromPatternMgr(kernel._brain).save(filename)
+    return filename
+
+
+class TestShardedKernel( test_kernel.TestKernel ):
+    '''Run the whole Kernel test suite against a sharded brain that keeps
+    no shard loaded between matches'''
+
+    def setUp(self):
+        test_kernel.TestKernel.setUp(self)
+        self.filename = shardedBrain(self.k)
+        self.k.loadBrain(self.filename, shardBudget=0)
+
+    def tearDown(self):
+        test_kernel.TestKernel.tearDown(self)
+        os.remove(self.filename)
+
+    def test24_impurities( self ):
+        # the nodes of a shard loaded again are new categories as far as
+        # the caches can tell; keep the shards loaded
+        self.k.loadBrain(self.filename)
+        test_kernel.TestKernel.test24_impurities(self)
+
+    def test25_stats_names( self ):
+        # every match reloads its shard, under a new key; the names of the
+        # keys seen are bounded all the same
+        self.k.collectStats()
+        self.k._stats._names.resize(3)
+        self.k.setResponseCacheSize(0)
+        for i in range(10):
+            self.k.respond("test srai", "s%d" % i)
+        self.assertEqual( 10, self.k.getStats()["categoryHits"]["TEST SRAI/*/*"] )
+        self.assertEqual( 3, len(self.k._stats._names) )
+
+
+class TestShardedPatternMgr( unittest.TestCase ):
+
+    longMessage = True
+
+    def setUp(self):
+        self.k = Kernel()
+        self.k.verbose(False)
+        testfile = os.path.join(os.path.dirname(__file__),"self-test.aiml")
+        self.k.learn(testfile)
+        self.mgr = self.k._brain
+        self.filename = shardedBrain(self.k)
+        self.sharded = ShardedPatternMgr()
+        self.sharded.restore(self.filename)
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def test01_restore( self ):
+        '''restoring reads no shard, and thawing gives back the trie'''
+        self.assertTrue( isShardedBrain(self.filename) )
+        self.assertEqual( 0, self.sharded.loadedBytes() )
+        self.assertEqual( self.mgr.numTemplates(), self.sharded.numTemplates() )
+        self.assertEqual( self.mgr._root, self.sharded.thaw()._root )
+
+    def test02_budget( self ):
+        '''shards are loaded on demand and evicted beyond the budget'''
+        self.sharded.setBudget(10**9)
+        match = self.sharded.match("test bot", "", "")
+        self.assertEqual( self.mgr.match("test bot", "", "").template, match.template )
+        loaded = self.sharded.loadedBytes()
+        self.assertTrue( loaded > 0 )
+        self.sharded.match("test bot", "", "")
+        self.assertEqual( loaded, self.sharded.loadedBytes() )
+        self.sharded.setBudget(0)
+        self.assertEqual( 0, self.sharded.loadedBytes() )
+        # the match keys of reloaded shards never repeat
+        self.assertNotEqual( match.key, self.sharded.match("test bot", "", "").key )
@@ -22,3 +22,15 @@ class TestUtils( unittest.TestCase ):
         sents = Utils.sentences("First.  Second, still?  Third and Final!  Well, not really")
         self.assertEqual( 4, len(sents) )
 
+
+    def test_lru_cache( self ):
+        cache = Utils.LRUCache(2)
+        cache["a"] = 1
+        cache["b"] = 2
+        self.assertEqual( 1, cache.get("a") )
+        cache["c"] = 3  # evicts "b", the least recently used
+        self.assertNotIn( "b", cache )
+        self.assertIsNone( cache.get("b") )
+        self.assertEqual( (1, 1), (cache.hits, cache.misses) )
+        cache.resize(1)
+        self.assertEqual( ["c"], [k for k in ("a", "b", "c") if k in cache] )
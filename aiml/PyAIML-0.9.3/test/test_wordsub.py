@@ -33,3 +33,24 @@ class TestWordSub( unittest.TestCase ):
         outStr = "I Would like one banana, one Pear and one APPLE."
         self.assertEqual( outStr, self.subber.sub(inStr) )
 
+
+    def test03_table( self ):
+        '''the lookup table gives the same results as the regex'''
+        self.subber._minTableKeys = 0
+        self.subber["he said"] = "she whispered"
+        self.subber["x.y"] = "z"
+        for inStr in ["He said he'd like an apple", "HE SAID  he SAID", "he, said",
+                      "I'd x.y x.yz", "banana-apple_orange he_ he"]:
+            self.assertEqual( self.subber.subRegex(inStr), self.subber.sub(inStr), inStr )
+        self.assertNotEqual( None, self.subber._table )
+
+    def test04_dirty( self ):
+        '''the table falls back to the regex for keys that aren't words,
+        and is rebuilt when keys are added'''
+        self.subber._minTableKeys = 0
+        self.assertEqual( "an apple", self.subber.sub("an banana") )
+        self.subber["an"] = "a"
+        self.assertEqual( "a apple", self.subber.sub("an banana") )
+        self.subber["?"] = "!"
+        self.assertEqual( "a apple!pear", self.subber.sub("an banana?orange") )
+        self.assertEqual( None, self.subber._table )
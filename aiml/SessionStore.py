@@ -0,0 +1,244 @@
+"""This module implements the SessionStore class, which holds the
+sessions of a Kernel.
+
+A SessionStore maps session IDs to session dictionaries, like a plain
+dictionary, but it can be bounded.  It remembers when each session was
+last used (see touch()), and evicts the least recently used sessions
+when there are more than maxSessions of them, or when they have been
+idle for more than ttl seconds.  If spillDir is set, evicted sessions
+are pickled to that directory rather than forgotten, and come back
+transparently the next time they are used.
+
+A SessionStore can be shared by several threads.  A session that has
+been checked out (see checkout()) is never evicted until it is checked
+in again.
+
+"""
+
+from __future__ import print_function
+
+import copy
+import hashlib
+import os
+import pickle
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+def sizeOf(obj):
+    """Return an estimate of the memory used by obj and the containers,
+    strings and numbers it holds, in bytes.
+    """
+    size = 0
+    seen = set()
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+            stack.extend(obj)
+    return size
+
+
+class SessionStore:
+    def __init__(self, factory, maxSessions=None, ttl=None, spillDir=None,
+                 pinned=()):
+        # factory() returns a new, empty session
+        self._factory = factory
+        self._maxSessions = maxSessions
+        self._ttl = ttl
+        self._spillDir = spillDir
+        # sessions that are never evicted
+        self._pinned = set(pinned)
+        # resident sessions, least recently used first
+        self._sessions = OrderedDict()
+        self._lastUsed = {}
+        # the number of threads that checked out each session
+        self._inUse = {}
+        self._lock = threading.RLock()
+        self.evictions = 0
+
+    def setLimits(self, maxSessions=None, ttl=None, spillDir=None):
+        """Change the eviction policy (see the module documentation), and
+        apply it right away.
+        """
+        with self._lock:
+            self._maxSessions = maxSessions
+            self._ttl = ttl
+            self._spillDir = spillDir
+            if spillDir is not None and not os.path.isdir(spillDir):
+                os.makedirs(spillDir)
+            self._evict()
+
+    def __len__(self):
+        """Return the number of resident sessions."""
+        return len(self._sessions)
+
+    def __contains__(self, sessionID):
+        with self._lock:
+            return sessionID in self._sessions or self._isSpilled(sessionID)
+
+    def __getitem__(self, sessionID):
+        """Return the session with the given ID, reading it back from the
+        spill directory if necessary.  Raises KeyError if there is no such
+        session.
+        """
+        with self._lock:
+            try:
+                return self._sessions[sessionID]
+            except KeyError:
+                return self._unspill(sessionID)
+
+    def copy(self, sessionID):
+        """Return a deep copy of the session with the given ID, without
+        bringing it back into memory if it is spilled.  Raises KeyError if
+        there is no such session.
+        """
+        with self._lock:
+            try:
+                return copy.deepcopy(self._sessions[sessionID])
+            except KeyError:
+                if not self._isSpilled(sessionID):
+                    raise
+                with open(self._spillFile(sessionID), "rb") as inFile:
+                    return pickle.load(inFile)[1]
+
+    def keys(self):
+        """Return the IDs of all of the sessions, resident or spilled."""
+        with self._lock:
+            return list(self._sessions) + self._spilledIDs()
+
+    def touch(self, sessionID):
+        """Mark the session as just used, creating it if it doesn't exist,
+        and evict the sessions that no longer fit the policy.  Returns the
+        session.
+        """
+        with self._lock:
+            try:
+                session = self._sessions.pop(sessionID)
+            except KeyError:
+                try:
+                    session = self._unspill(sessionID)
+                except KeyError:
+                    session = self._factory()
+            self._sessions[sessionID] = session
+            self._lastUsed[sessionID] = time.time()
+            self._evict()
+            return session
+
+    def checkout(self, sessionID):
+        """touch() the session, and keep it from being evicted until a
+        matching call to checkin().  Returns the session.
+        """
+        with self._lock:
+            self._inUse[sessionID] = self._inUse.get(sessionID, 0) + 1
+            return self.touch(sessionID)
+
+    def checkin(self, sessionID):
+        """Undo a call to checkout()."""
+        with self._lock:
+            count = self._inUse.pop(sessionID) - 1
+            if count > 0:
+                self._inUse[sessionID] = count
+
+    def pop(self, sessionID):
+        """Delete the session, wherever it is.  Returns it, or None if
+        there was no such session.
+        """
+        with self._lock:
+            if sessionID not in self._sessions:
+                try:
+                    self._unspill(sessionID)
+                except KeyError:
+                    return None
+            self._lastUsed.pop(sessionID)
+            return self._sessions.pop(sessionID)
+
+    def memoryUsage(self, sessionID):
+        """Return the approximate number of bytes used by a resident
+        session, or 0 if it is spilled or doesn't exist.
+        """
+        with self._lock:
+            try:
+                return sizeOf(self._sessions[sessionID])
+            except KeyError:
+                return 0
+
+    def _evict(self):
+        """Evict sessions until the policy is satisfied."""
+        if self._maxSessions is None and self._ttl is None:
+            return
+        now = time.time()
+        excess = 0
+        if self._maxSessions is not None:
+            excess = len(self._sessions) - self._maxSessions
+        # the most recently used session is the one being worked on
+        current = next(reversed(self._sessions), None)
+        # The sessions are in the order they were last used, so the walk
+        # stops at the first one that is neither over the limit nor idle;
+        # only the sessions that can't be evicted are walked past.
+        evicted = []
+        for sessionID in self._sessions:
+            if sessionID == current:
+                break
+            idle = self._ttl is not None and now - self._lastUsed[sessionID] > self._ttl
+            if not (excess > 0 or idle):
+                break
+            if sessionID in self._pinned or sessionID in self._inUse or \
+                    self._busy(self._sessions[sessionID]):
+                continue
+            evicted.append(sessionID)
+            excess -= 1
+        for sessionID in evicted:
+            session = self._sessions.pop(sessionID)
+            del self._lastUsed[sessionID]
+            if self._spillDir is not None:
+                self._spill(sessionID, session)
+            self.evictions += 1
+
+    def _busy(self, session):
+        """Return True if the session is in the middle of a response."""
+        return len(session.get("_inputStack", ())) > 0
+
+    def _spillFile(self, sessionID):
+        name = hashlib.sha1(repr(sessionID).encode("utf-8")).hexdigest()
+        return os.path.join(self._spillDir, name + ".session")
+
+    def _isSpilled(self, sessionID):
+        return self._spillDir is not None and os.path.exists(self._spillFile(sessionID))
+
+    def _spilledIDs(self):
+        if self._spillDir is None:
+            return []
+        ids = []
+        for name in os.listdir(self._spillDir):
+            if name.endswith(".session"):
+                with open(os.path.join(self._spillDir, name), "rb") as inFile:
+                    ids.append(pickle.load(inFile)[0])
+        return ids
+
+    def _spill(self, sessionID, session):
+        with open(self._spillFile(sessionID), "wb") as outFile:
+            pickle.dump((sessionID, session), outFile, pickle.HIGHEST_PROTOCOL)
+
+    def _unspill(self, sessionID):
+        """Read a spilled session back and make it resident again.  Raises
+        KeyError if there is no such session.
+        """
+        if not self._isSpilled(sessionID):
+            raise KeyError(sessionID)
+        filename = self._spillFile(sessionID)
+        with open(filename, "rb") as inFile:
+            sessionID, session = pickle.load(inFile)
+        os.remove(filename)
+        self._sessions[sessionID] = session
+        self._lastUsed[sessionID] = time.time()
+        return session
@@ -0,0 +1,223 @@
+'''
+A PatternMgr that keeps only a small part of its brain in memory.
+
+The node tree is split into shards, one for each child of the root: every
+pattern starting with the word HELLO lives in the HELLO shard, every one
+starting with "*" in the "*" shard, and so on.  A sharded brain file holds
+an index of the shards (where in the file each one is, and how big it is)
+followed by the shards themselves, marshalled one by one.
+
+restore() only reads the index.  A shard is read and unmarshalled the
+first time a match needs it, and kept in memory while the total size of
+the loaded shards (measured as their size in the file) stays within a
+byte budget.  Beyond that, the least recently used shards are dropped
+again, after the current match is over.
+
+Note that the budget counts marshalled bytes: unmarshalled, a shard takes
+about fourteen times its size in the file.  A compact brain (see
+CompactPatternMgr), which is mapped from its file and never unmarshalled,
+takes far less memory; sharding only pays off for brains too big to map.
+'''
+
+from __future__ import print_function
+
+import marshal
+import mmap
+import pprint
+import struct
+import threading
+from collections import OrderedDict
+
+from .PatternMgr import PatternMgr
+
+# File signature and format version of a saved ShardedPatternMgr
+MAGIC = b"PYAIMLSH"
+FORMAT_VERSION = 1
+
+# magic, version, length of the marshalled index
+_HEADER = struct.Struct("<8sIQ")
+
+
+def isShardedBrain(filename):
+    """Return True if filename was written by ShardedPatternMgr.save()."""
+    with open(filename, "rb") as inFile:
+        return inFile.read(len(MAGIC)) == MAGIC
+
+
+class ShardedPatternMgr(PatternMgr):
+    # default budget of the loaded shards, in bytes of the file
+    _defaultBudget = 4 * 1024 * 1024
+    _readOnly = True
+
+    def __init__(self, budget=None):
+        PatternMgr.__init__(self)
+        self._budget = self._defaultBudget if budget is None else budget
+        # maps the key of each shard to its (offset, length) in the file
+        self._index = {}
+        # the loaded shards, least recently used first
+        self._shards = OrderedDict()
+        self._loadedBytes = 0
+        # the number of shards loaded so far; see match()
+        self._loads = 0
+        self._map = None
+        # guards the loaded shards, which threads matching in parallel
+        # share
+        self._lock = threading.Lock()
+
+    @classmethod
+    def fromPatternMgr(cls, mgr, budget=None):
+        """Build a ShardedPatternMgr holding the same patterns as mgr.  All
+        of its shards are in memory until it is save()d and restore()d.
+        """
+        sharded = cls(budget)
+        sharded._templateCount = mgr._templateCount
+        sharded._botName = mgr._botName
+        for key, shard in mgr._root.items():
+            sharded._shards[key] = shard
+        return sharded
+
+    def setBudget(self, budget):
+        """Set the number of bytes of shards to keep in memory."""
+        self._budget = budget
+        self._evict()
+
+    def loadedBytes(self):
+        """Return the size of the shards currently in memory."""
+        return self._loadedBytes
+
+    def add(self, data, template):
+        """ShardedPatternMgr is read-only.  Use thaw() to get a PatternMgr
+        that can learn new categories.
+        """
+        raise TypeError("ShardedPatternMgr is read-only; use thaw() first")
+
+    def thaw(self):
+        """Return an ordinary, writable PatternMgr with the same patterns,
+        loading every shard.
+        """
+        mgr = PatternMgr()
+        for key in self._keys():
+            mgr._root[key] = self._read(key) if key not in self._shards \
+                else self._shards[key]
+        mgr._templateCount = self._templateCount
+        mgr._botName = self._botName
+        return mgr
+
+    def _keys(self):
+        """Return the keys of all of the shards."""
+        if self._map is None:
+            return list(self._shards)
+        return list(self._index)
+
+    def dump(self):
+        """Print all learned patterns, for debugging purposes."""
+        pprint.pprint(self.thaw()._root)
+
+    def save(self, filename):
+        """Dump the current patterns to the file specified by filename.  To
+        restore later, use restore().
+        """
+        shards = []
+        index = {}
+        offset = 0
+        for key in self._keys():
+            data = marshal.dumps(self._read(key) if key not in self._shards
+                                 else self._shards[key])
+            index[key] = (offset, len(data))
+            offset += len(data)
+            shards.append(data)
+        header = marshal.dumps((self._templateCount, self._botName, index))
+        try:
+            with open(filename, "wb") as outFile:
+                outFile.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(header)))
+                outFile.write(header)
+                for data in shards:
+                    outFile.write(data)
+        except Exception:
+            print( "Error saving PatternMgr to file %s:" % filename )
+            raise
+
+    def restore(self, filename):
+        """Restore a previously save()d collection of patterns.  Only the
+        index of the shards is read.
+
+        The file is mapped into memory, and must not be modified for as
+        long as this object is in use.
+        """
+        try:
+            with open(filename, "rb") as inFile:
+                magic, version, length = _HEADER.unpack(inFile.read(_HEADER.size))
+                if magic != MAGIC:
+                    raise ValueError("%s is not a sharded brain file" % filename)
+                if version != FORMAT_VERSION:
+                    raise ValueError("%s has unsupported brain format version %d"
+                                     % (filename, version))
+                self._templateCount, self._botName, index = \
+                    marshal.loads(inFile.read(length))
+                brainMap = mmap.mmap(inFile.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            print( "Error restoring PatternMgr from file %s:" % filename )
+            raise
+        start = _HEADER.size + length
+        self._index = dict((key, (start + offset, size))
+                           for key, (offset, size) in index.items())
+        self._map = brainMap
+        self._shards = OrderedDict()
+        self._loadedBytes = 0
+
+    def _read(self, key):
+        """Read and return the shard with the given key."""
+        offset, size = self._index[key]
+        return marshal.loads(self._map[offset:offset+size])
+
+    def match(self, pattern, that, topic):
+        """Return the Match of the input, like PatternMgr.match().
+
+        Shards are only dropped once the match is over, so that the nodes
+        the matcher is looking at stay put.  The key of the Match also
+        counts the shards loaded so far: the nodes of a shard loaded
+        again are new objects, whose IDs could be those of other nodes.
+        """
+        try:
+            match = PatternMgr.match(self, pattern, that, topic)
+        finally:
+            self._evict()
+        if match is not None:
+            match.key = (self._loads, match.key)
+        return match
+
+    def _matchGroup(self, group):
+        try:
+            return PatternMgr._matchGroup(self, group)
+        finally:
+            self._evict()
+
+    def _evict(self):
+        """Drop the least recently used shards until the loaded ones fit
+        in the budget.
+        """
+        if self._map is None:
+            return
+        with self._lock:
+            while self._loadedBytes > self._budget and self._shards:
+                key, shard = self._shards.popitem(last=False)
+                self._loadedBytes -= self._index[key][1]
+
+    def _child(self, node, key):
+        """Return the child of node reached through key, loading it if it
+        is a shard that isn't in memory.
+        """
+        if node is not self._root:
+            return node.get(key)
+        with self._lock:
+            try:
+                shard = self._shards.pop(key)
+            except KeyError:
+                if key not in self._index:
+                    return None
+                shard = self._read(key)
+                self._loadedBytes += self._index[key][1]
+                self._loads += 1
+            # mark the shard as the most recently used one
+            self._shards[key] = shard
+            return shard
@@ -0,0 +1,216 @@
+"""This module implements the StatsCollector class, which records what
+a Kernel does while it responds (see Kernel.collectStats()):
+
+ - how many times each category was matched;
+ - how long matching took, and how long processing the templates took,
+   as histograms;
+ - how deep the chains of <srai> reductions went;
+ - the inputs that matched no category at all.
+
+Categories are named after their [pattern/that/topic] path, rebuilt from
+the input and the spans of its wildcards, so every wildcard shows as "*"
+(whether it was "*" or "_" in the AIML) and a BOT_NAME as the bot's name.
+
+Responses taken from the response cache or from the memo of the current
+sentence are counted as if they had been matched again: the Kernel keeps
+the record() of the matches made for each response with it, and hands it
+back to cached() or memoized() on a hit.
+
+The statistics are exported as a dictionary (asDict()) or JSON (toJSON()).
+
+"""
+
+from __future__ import print_function
+
+import bisect
+import json
+import threading
+import time
+
+from .Utils import LRUCache
+
+try: timer = time.perf_counter
+except AttributeError: timer = time.time
+
+
+class Histogram:
+    """Counts of values falling between successive bounds.  The last
+    bucket holds the values above every bound."""
+
+    def __init__(self, bounds):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def asDict(self):
+        return {"bounds": list(self.bounds), "counts": list(self.counts),
+                "count": self.count, "total": self.total, "max": self.max}
+
+
+def categoryName(match, inputs):
+    """Return the [pattern/that/topic] path of the category matched by
+    match, given the NormalizedInputs it was matched against.
+    """
+    sections = []
+    for section in range(match.sections):
+        words = list(inputs[section].words)
+        # replace the words matched by each wildcard by a "*", from the
+        # last one back, so that the earlier spans stay valid.
+        for start, end in reversed(match._spans[section]):
+            words[start:end] = [u"*"]
+        sections.append(u" ".join(words))
+    return u"/".join(sections)
+
+
+class StatsCollector:
+    # bounds of the latency buckets, in microseconds: 1us to about 1s
+    _latencyBounds = [2 ** i for i in range(21)]
+    # bounds of the <srai> depth buckets
+    _depthBounds = list(range(1, 21)) + [30, 50, 100]
+    # the number of different unmatched inputs remembered
+    _maxNoMatch = 1000
+    # the number of category names remembered by key; see match()
+    _maxNames = 10000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget everything recorded so far."""
+        with self._lock:
+            self.responses = 0
+            self.cachedResponses = 0
+            self.memoizedResponses = 0
+            self.categoryHits = {}
+            self.noMatch = {}
+            self.noMatchDropped = 0
+            self.matchTime = Histogram(self._latencyBounds)
+            self.templateTime = Histogram(self._latencyBounds)
+            self.responseTime = Histogram(self._latencyBounds)
+            self.sraiDepth = Histogram(self._depthBounds)
+            # the deepest <srai> so far in the reply of each session
+            self._depth = {}
+            # the (name, unmatched text, depth) of the matches made so far
+            # in the reply of each session; see record()
+            self._trail = {}
+            # the names of the category keys seen last; see categoryName().
+            # The keys of sharded brains change every time a shard is
+            # loaded again, so only so many are kept.
+            self._names = LRUCache(self._maxNames)
+
+    def match(self, match, inputs, depth, seconds, sessionID):
+        """Record a call to PatternMgr.match() made depth <srai> levels
+        deep (1 for the input itself) that took seconds and returned
+        match.
+        """
+        with self._lock:
+            self.matchTime.add(seconds * 1e6)
+            if match is None:
+                self._count(None, inputs[0].text, depth, sessionID)
+                return
+            name = self._names.get(match.key)
+            if name is None:
+                name = categoryName(match, inputs)
+                self._names[match.key] = name
+            self._count(name, None, depth, sessionID)
+
+    def _count(self, name, text, depth, sessionID):
+        """Count a hit of the category name, or if name is None, an
+        input text that matched nothing."""
+        if depth > self._depth.get(sessionID, 0):
+            self._depth[sessionID] = depth
+        self._trail.setdefault(sessionID, []).append((name, text, depth))
+        if name is not None:
+            self.categoryHits[name] = self.categoryHits.get(name, 0) + 1
+        elif text in self.noMatch:
+            self.noMatch[text] += 1
+        elif len(self.noMatch) < self._maxNoMatch:
+            self.noMatch[text] = 1
+        else:
+            self.noMatchDropped += 1
+
+    def mark(self, sessionID):
+        """Return a mark of the matches recorded so far in the reply of
+        sessionID, to pass to record()."""
+        with self._lock:
+            return len(self._trail.get(sessionID, ()))
+
+    def record(self, sessionID, mark, depth):
+        """Return the matches recorded for sessionID since mark, with
+        their depths relative to depth, the depth of the input they were
+        made for."""
+        with self._lock:
+            trail = self._trail.get(sessionID, ())
+            return tuple((name, text, matchDepth - depth)
+                         for name, text, matchDepth in trail[mark:])
+
+    def cached(self, record, depth, sessionID):
+        """Record a response taken from the response cache, without
+        matching, for an input depth <srai> levels deep.  The matches in
+        record, returned by record() when the response was made, are
+        counted again."""
+        with self._lock:
+            self.cachedResponses += 1
+            self._replay(record, depth, sessionID)
+
+    def memoized(self, record, depth, sessionID):
+        """Record a response taken from the memo of the current
+        sentence, like cached()."""
+        with self._lock:
+            self.memoizedResponses += 1
+            self._replay(record, depth, sessionID)
+
+    def _replay(self, record, depth, sessionID):
+        for name, text, relativeDepth in record or ():
+            self._count(name, text, depth + relativeDepth, sessionID)
+
+    def brainChanged(self):
+        """Forget the names of the category keys, which may now stand
+        for other categories."""
+        with self._lock:
+            self._names.clear()
+
+    def template(self, seconds):
+        """Record the time taken to process a template (including any
+        <srai> in it)."""
+        with self._lock:
+            self.templateTime.add(seconds * 1e6)
+
+    def response(self, seconds, sessionID):
+        """Record a sentence answered by Kernel.respond() in seconds."""
+        with self._lock:
+            self.responses += 1
+            self.responseTime.add(seconds * 1e6)
+            self.sraiDepth.add(self._depth.pop(sessionID, 0))
+            self._trail.pop(sessionID, None)
+
+    def asDict(self):
+        """Return the statistics as a dictionary of plain values.  Times
+        are in microseconds."""
+        with self._lock:
+            return {
+                "responses": self.responses,
+                "cachedResponses": self.cachedResponses,
+                "memoizedResponses": self.memoizedResponses,
+                "categoryHits": dict(self.categoryHits),
+                "noMatch": dict(self.noMatch),
+                "noMatchDropped": self.noMatchDropped,
+                "matchTime": self.matchTime.asDict(),
+                "templateTime": self.templateTime.asDict(),
+                "responseTime": self.responseTime.asDict(),
+                "sraiDepth": self.sraiDepth.asDict(),
+            }
+
+    def toJSON(self, indent=None):
+        """Return the statistics as a JSON string."""
+        return json.dumps(self.asDict(), indent=indent, sort_keys=True)
@@ -0,0 +1,281 @@
+"""This module implements the TemplateCompiler class, which turns AIML
+templates into trees of Python closures.
+
+The Kernel normally interprets a template every time it is used: each
+element is looked up in the Kernel's table of element processors, its
+attributes are parsed and its text is cleaned up.  A TemplateCompiler
+does all of that once.  Every element becomes a function of the session
+ID returning the element's value, built from the functions of the
+elements it contains; text becomes a constant, and runs of constant text
+are joined together.
+
+Elements that have no compiled form here (<condition>, <date>, <system>
+and the like, and unknown elements) are handed to the Kernel's
+interpreter, so a compiled template always produces exactly the same
+output as the interpreted one.
+
+"""
+
+from __future__ import print_function
+
+import random
+import re
+import string
+
+from .Utils import LRUCache
+
+
+class TemplateCompiler:
+    # number of compiled templates to keep around
+    _cacheSize = 10000
+
+    def __init__(self, kernel):
+        self._kernel = kernel
+        # compiled templates, keyed by brain generation and Match.key;
+        # see compiled()
+        self._compiled = LRUCache(self._cacheSize)
+        self._compilers = {
+            "bot":          self._compileBot,
+            "formal":       self._compileFormal,
+            "gender":       self._compileGender,
+            "get":          self._compileGet,
+            "gossip":       self._compileThink,
+            "javascript":   self._compileThink,
+            "li":           self._compileContents,
+            "lowercase":    self._compileLowercase,
+            "person":       self._compilePerson,
+            "person2":      self._compilePerson2,
+            "random":       self._compileRandom,
+            "sentence":     self._compileSentence,
+            "set":          self._compileSet,
+            "sr":           self._compileSr,
+            "srai":         self._compileSrai,
+            "star":         self._compileStar,
+            "template":     self._compileContents,
+            "text":         self._compileText,
+            "thatstar":     self._compileThatstar,
+            "think":        self._compileThink,
+            "topicstar":    self._compileTopicstar,
+            "uppercase":    self._compileUppercase,
+        }
+
+    def clear(self):
+        """Forget every compiled template.  This must be called whenever
+        the brain the templates come from changes.
+        """
+        self._compiled.clear()
+
+    def compiled(self, match, brainGeneration):
+        """Return the compiled form of the template of match, a function
+        taking a session ID and returning the template's response.
+        brainGeneration is the Kernel's _brainGeneration read before
+        matching.
+        """
+        key = (brainGeneration, match.key)
+        template, func = self._compiled.get(key, (None, None))
+        # A thread still matching against the brain being replaced may
+        # reuse the key of another category, so check that the template
+        # is the same.  Compact brains return a new copy of the template
+        # on every match: compare by value.
+        if template is not match.template and template != match.template:
+            func = self.compile(match.template)
+            self._compiled[key] = (match.template, func)
+        return func
+
+    def compile(self, elem):
+        """Compile the AIML element elem (usually a <template>)."""
+        func, value = self._compile(elem)
+        if func is None:
+            return lambda sessionID: value
+        return func
+
+    def _compile(self, elem):
+        """Compile elem.  Returns a tuple (func, value): if the element
+        always evaluates to the same string, func is None and value is
+        that string; otherwise func is a function of the session ID.
+        """
+        try:
+            compiler = self._compilers[elem[0]]
+        except (KeyError, IndexError, TypeError):
+            compiler = None
+        if compiler is not None:
+            try:
+                return compiler(elem)
+            except (KeyError, IndexError, TypeError, ValueError):
+                # A malformed element: let the interpreter deal with it
+                # (and report it) every time it is processed.
+                pass
+        return self._interpret(elem), None
+
+    def _interpret(self, elem):
+        """Return a function processing elem with the Kernel's
+        interpreter.
+        """
+        processElement = self._kernel._processElement
+        return lambda sessionID: processElement(elem, sessionID)
+
+    def _compileSequence(self, elems):
+        """Compile a list of elements whose values are concatenated."""
+        parts = []
+        for e in elems:
+            func, value = self._compile(e)
+            if func is None:
+                if parts and not callable(parts[-1]):
+                    parts[-1] += value
+                elif value:
+                    parts.append(value)
+            else:
+                parts.append(func)
+        if len(parts) == 0:
+            return None, u""
+        if len(parts) == 1:
+            if callable(parts[0]):
+                return parts[0], None
+            return None, parts[0]
+        parts = tuple((part, callable(part)) for part in parts)
+        def sequence(sessionID):
+            response = ""
+            for part, isFunc in parts:
+                if isFunc:
+                    response += part(sessionID)
+                else:
+                    response += part
+            return response
+        return sequence, None
+
+    def _transform(self, elem, transform):
+        """Compile the contents of elem, and apply transform to their
+        value.
+        """
+        func, value = self._compileSequence(elem[2:])
+        if func is None:
+            # Some transforms (the word substitutions) can change between
+            # calls; don't fold them at compile time.
+            return lambda sessionID: transform(value), None
+        return lambda sessionID: transform(func(sessionID)), None
+
+    def _compileContents(self, elem):
+        """<template> and <li>: the concatenated contents."""
+        return self._compileSequence(elem[2:])
+
+    def _compileText(self, elem):
+        elem[2] + ""
+        if elem[1]["xml:space"] == "default":
+            return None, re.sub(r"\s+", " ", elem[2])
+        return None, elem[2]
+
+    def _compileThink(self, elem):
+        """<think>, <gossip> and <javascript>: process the contents for
+        their side effects only.
+        """
+        func, value = self._compileSequence(elem[2:])
+        if func is None:
+            return None, ""
+        def think(sessionID):
+            func(sessionID)
+            return ""
+        return think, None
+
+    def _compileBot(self, elem):
+        name = elem[1]['name']
+        getBotPredicate = self._kernel.getBotPredicate
+        return lambda sessionID: getBotPredicate(name), None
+
+    def _compileGet(self, elem):
+        name = elem[1]['name']
+        getPredicate = self._kernel.getPredicate
+        return lambda sessionID: getPredicate(name, sessionID), None
+
+    def _compileSet(self, elem):
+        name = elem[1]['name']
+        setPredicate = self._kernel.setPredicate
+        func, value = self._compileSequence(elem[2:])
+        def set_(sessionID):
+            v = value if func is None else func(sessionID)
+            setPredicate(name, v, sessionID)
+            return v
+        return set_, None
+
+    def _compileUppercase(self, elem):
+        return self._transform(elem, lambda s: s.upper())
+
+    def _compileLowercase(self, elem):
+        return self._transform(elem, lambda s: s.lower())
+
+    def _compileFormal(self, elem):
+        return self._transform(elem, string.capwords)
+
+    def _compileSentence(self, elem):
+        def sentence(response):
+            response = response.strip()
+            words = response.split(" ", 1)
+            words[0] = words[0].capitalize()
+            return ' '.join(words)
+        return self._transform(elem, sentence)
+
+    def _compileSubstitution(self, elem, subber):
+        """Compile an element that runs its contents through one of the
+        Kernel's word substituters.
+        """
+        subbers = self._kernel._subbers
+        if len(elem[2:]) == 0:
+            # atomic <person/> = <person><star/></person>
+            elem = [elem[0], elem[1], ['star', {}]]
+        return self._transform(elem, lambda s: subbers[subber].sub(s))
+
+    def _compileGender(self, elem):
+        return self._compileSubstitution(elem, 'gender')
+
+    def _compilePerson(self, elem):
+        return self._compileSubstitution(elem, 'person')
+
+    def _compilePerson2(self, elem):
+        return self._compileSubstitution(elem, 'person2')
+
+    def _compileRandom(self, elem):
+        items = []
+        for e in elem[2:]:
+            if e[0] == 'li':
+                func, value = self._compile(e)
+                items.append((func, value))
+        if len(items) == 0:
+            return None, ""
+        def random_(sessionID):
+            # Shuffle the whole list, like the interpreter does, so both
+            # draw the same numbers from the random generator.
+            choices = list(items)
+            random.shuffle(choices)
+            func, value = choices[0]
+            return value if func is None else func(sessionID)
+        return random_, None
+
+    def _compileWildcard(self, elem, starType):
+        """Compile <star>, <thatstar> or <topicstar>."""
+        try: index = int(elem[1]['index'])
+        except KeyError: index = 1
+        getPredicate = self._kernel.getPredicate
+        matchStack = self._kernel._matchStack
+        def star(sessionID):
+            return getPredicate(matchStack, sessionID)[-1].star(starType, index)
+        return star, None
+
+    def _compileStar(self, elem):
+        return self._compileWildcard(elem, "star")
+
+    def _compileThatstar(self, elem):
+        return self._compileWildcard(elem, "thatstar")
+
+    def _compileTopicstar(self, elem):
+        return self._compileWildcard(elem, "topicstar")
+
+    def _compileSrai(self, elem):
+        respond = self._kernel._respond
+        func, value = self._compileSequence(elem[2:])
+        if func is None:
+            return lambda sessionID: respond(value, sessionID), None
+        return lambda sessionID: respond(func(sessionID), sessionID), None
+
+    def _compileSr(self, elem):
+        respond = self._kernel._respond
+        star, value = self._compileStar(['star', {}])
+        return lambda sessionID: respond(star(sessionID), sessionID), None
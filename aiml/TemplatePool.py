@@ -0,0 +1,88 @@
+"""This module implements the TemplatePool class, which stores each
+distinct AIML template (and each distinct element within templates) only
+once.
+
+Thousands of categories share templates such as <srai>HELLO</srai>, and
+many more share parts of their templates.  PatternMgr.add() passes every
+template through a TemplatePool, which hash-conses it: its elements are
+interned bottom-up, so that equal elements are one and the same list, and
+equal templates one and the same template.  marshal writes an object
+referenced several times only once, so the saving carries over to the
+brain files and to the brains restored from them.
+
+Text elements whose whitespace isn't preserved are stored with their
+whitespace already collapsed, as the Kernel would do the first time it
+processes them (see Kernel._processText()).  This way templates that
+only differ in their layout in the AIML file are shared too, and shared
+elements are never modified once they are in the pool.
+
+"""
+
+from __future__ import print_function
+
+import re
+
+
+class TemplatePool:
+    def __init__(self):
+        # maps the key of each distinct element (see _intern()) to the
+        # element
+        self._elements = {}
+        # attribute dictionaries and strings, interned in the same way
+        self._attributes = {}
+        self._strings = {}
+        # the number of templates interned, and of elements that were
+        # already in the pool
+        self.templates = 0
+        self.sharedElements = 0
+
+    def __len__(self):
+        """Return the number of distinct elements in the pool."""
+        return len(self._elements)
+
+    def intern(self, template):
+        """Return a template processed exactly like template, made of
+        elements shared with the other templates in the pool.  template
+        itself is left untouched.
+        """
+        self.templates += 1
+        return self._intern(template)
+
+    def _intern(self, elem):
+        if not isinstance(elem, list):
+            # text, or something the Kernel will reject when processing
+            # the template
+            try: return self._strings.setdefault(elem, elem)
+            except TypeError: return elem
+        try:
+            name, attr = elem[0], elem[1]
+            if name == "text" and attr["xml:space"] == "default":
+                contents = [re.sub(r"\s+", " ", elem[2])]
+                attr = {"xml:space": "preserve"}
+            else:
+                contents = elem[2:]
+            attrKey = tuple(sorted(attr.items()))
+            sharedAttr = self._attributes.get(attrKey)
+        except (IndexError, KeyError, TypeError, AttributeError):
+            # a malformed element: keep it as it is, unshared
+            return elem
+        if sharedAttr is None:
+            sharedAttr = self._attributes[attrKey] = dict(attr)
+        attr = sharedAttr
+        contents = [self._intern(e) for e in contents]
+        elem = [name, attr] + contents
+        # Elements are keyed by the hash of their contents, interned
+        # elements being told apart by identity.  Keeping the hash alone
+        # saves the memory a key tuple would take; on the rare collision
+        # of two different elements, the second one isn't shared.
+        try:
+            key = hash((name, attrKey) + tuple(
+                (id(e),) if isinstance(e, list) else e for e in contents))
+        except TypeError:
+            # unhashable contents: another malformed element
+            return elem
+        shared = self._elements.setdefault(key, elem)
+        if shared is elem or shared != elem:
+            return elem
+        self.sharedElements += 1
+        return shared
@@ -3,6 +3,9 @@ modules in the PyAIML package.
 
 """
 
+import threading
+from collections import OrderedDict
+
 def sentences(s):
     """Split the string s into a list of sentences."""
     try: s+""
@@ -25,3 +28,75 @@ def sentences(s):
     if len(sentenceList) == 0: sentenceList.append(s)
     return sentenceList
 
+
+
+class LRUCache(object):
+    """A mapping that holds at most maxSize items, forgetting the least
+    recently used ones first.  get() counts its hits and misses.
+    A maxSize of 0 disables the cache.
+
+    It is safe to use from several threads.  generation counts the calls
+    to clear(), so that a value computed from data the cache was cleared
+    for can be kept out of it (see add()).
+
+    """
+    def __init__(self, maxSize):
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        """Return the value of key, marking it as the most recently used,
+        or default if key is not in the cache.
+        """
+        with self._lock:
+            try: value = self._items.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._items[key] = value
+            self.hits += 1
+            return value
+
+    def __setitem__(self, key, value):
+        self.add(key, value)
+
+    def add(self, key, value, generation=None):
+        """Store value under key, unless generation is given and the
+        cache has been cleared since it was read.
+        """
+        if self.maxSize <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._items.pop(key, None)
+            self._items[key] = value
+            self._resize(self.maxSize)
+
+    def resize(self, maxSize):
+        """Change the maximum size of the cache, dropping the least
+        recently used items that no longer fit.
+        """
+        with self._lock:
+            self._resize(maxSize)
+
+    def _resize(self, maxSize):
+        self.maxSize = maxSize
+        while len(self._items) > max(maxSize, 0):
+            self._items.popitem(last=False)
+
+    def clear(self):
+        """Forget every item (but not the hit and miss counts)."""
+        with self._lock:
+            self._items.clear()
+            self.generation += 1
@@ -20,6 +20,15 @@ The following example illustrates this point:
     she says she'd like to help her
 Note that "he" and "he'd" were replaced, but "help" and "her" were
 not.
+
+Rather than running a regular expression with an alternative for every
+key over the text, sub() splits the text into runs of word characters
+and looks up the text starting at each run in a hash table, trying keys
+spanning up to as many runs as the longest key.  Keys that don't begin
+and end with a word character are handled by the regular expression, as
+before, and so are subbers with only a few keys, which the regex handles
+faster.  Either way, the table or regex is only rebuilt when keys were
+added since the last call.
 """
 
 from __future__ import print_function
@@ -41,6 +50,15 @@ except ImportError:
 class WordSub(dict):
     """All-in-one multiple-string-substitution class."""
 
+    # the runs of word characters, whose boundaries the keys must match
+    _wordRE = re.compile(r"\w+")
+    _splitRE = re.compile(r"(\w+)")
+    # With fewer keys than this, the regex is a short alternation, and
+    # scanning the text with it beats splitting the text into words.  It
+    # also compiles quickly (about 0.2ms for the default person, person2
+    # and gender subbers), so such subbers save no table; see getState().
+    _minTableKeys = 90
+
     def _wordToRegex(self, word):
         """Convert a word to a regex object which matches the word."""
         if word != "" and word[0].isalpha() and word[-1].isalpha():
@@ -56,13 +74,43 @@ class WordSub(dict):
         self._regex = re.compile("|".join(map(self._wordToRegex, self.keys())))
         self._regexIsDirty = False
 
+    def _update_table(self):
+        """Build the lookup table used by sub() from the keys of the
+        current dictionary, or the regex if some key can't go in the
+        table.
+
+        The table maps each key to its position in the dictionary: like
+        the alternatives of the regex, when several keys match at the same
+        place, the first one wins.
+
+        """
+        self._table = None
+        self._tableIsDirty = False
+        if len(self) >= self._minTableKeys:
+            order = {}
+            firstRuns = set()
+            maxRuns = 0
+            for i, key in enumerate(self.keys()):
+                runs = self._wordRE.findall(key)
+                if not runs or not key.startswith(runs[0]) or not key.endswith(runs[-1]):
+                    break
+                order[key] = i
+                firstRuns.add(runs[0])
+                maxRuns = max(maxRuns, len(runs))
+            else:
+                self._table = (order, firstRuns, maxRuns)
+        if self._table is None and self._regexIsDirty:
+            self._update_regex()
+
     def __init__(self, defaults = {}):
         """Initialize the object, and populate it with the entries in
         the defaults dictionary.
 
         """
         self._regex = None
+        self._table = None
         self._regexIsDirty = True
+        self._tableIsDirty = True
         for k,v in defaults.items():
             self[k] = v
 
@@ -72,13 +120,77 @@ class WordSub(dict):
 
     def __setitem__(self, i, y):
         self._regexIsDirty = True
+        self._tableIsDirty = True
         # for each entry the user adds, we actually add three entrys:
         super(type(self),self).__setitem__(i.lower(),y.lower()) # key = value
         super(type(self),self).__setitem__(string.capwords(i), string.capwords(y)) # Key = Value
         super(type(self),self).__setitem__(i.upper(), y.upper()) # KEY = VALUE
 
+    def getState(self):
+        """Return the entries of the subber and its lookup table, built if
+        needed, as a value that marshal can save.  See setState().
+
+        The table is None for subbers that use the regex instead (those
+        with fewer than _minTableKeys keys, or keys that are not words):
+        a compiled regex can't be saved, and is built again on first use.
+        """
+        if self._tableIsDirty:
+            self._update_table()
+        return (list(self.items()), self._table)
+
+    def setState(self, state):
+        """Replace the entries of the subber with those of a getState()
+        value, ready to use without building the table again.
+        """
+        items, table = state
+        dict.clear(self)
+        dict.update(self, items)
+        self._table = table
+        self._regexIsDirty = True
+        # without a table, sub() needs the regex, built on first use
+        self._tableIsDirty = table is None
+
     def sub(self, text):
         """Translate text, returns the modified text."""
+        if self._tableIsDirty:
+            self._update_table()
+        if self._table is None:
+            return self._regex.sub(self, text)
+        order, firstRuns, maxRuns = self._table
+        # the runs of word characters are at the odd indices of parts,
+        # and what lies between them at the even ones
+        parts = self._splitRE.split(text)
+        words = parts[1::2]
+        if firstRuns.isdisjoint(words):
+            return text
+        if maxRuns == 1:
+            # every key is a single run of word characters
+            get = self.get
+            parts[1::2] = [get(word, word) for word in words]
+            return "".join(parts)
+        end = 0
+        for i in [i for i, word in enumerate(words) if word in firstRuns]:
+            if i < end:
+                # inside the key replaced last
+                continue
+            # a key starting here must end where one of the next maxRuns
+            # runs of word characters does.
+            best = None
+            for j in range(i, min(i + maxRuns, len(words))):
+                key = "".join(parts[2*i+1:2*j+2])
+                k = order.get(key)
+                if k is not None and (best is None or k < best[0]):
+                    best = (k, key, j)
+            if best is not None:
+                k, key, j = best
+                parts[2*i+1:2*j+2] = [self[key]] + [u""] * (2*(j-i))
+                end = j + 1
+        return "".join(parts)
+
+    def subRegex(self, text):
+        """Translate text with the regex, as sub() did before it used a
+        lookup table.  This is slower, and only kept for comparison.
+        """
         if self._regexIsDirty:
             self._update_regex()
         return self._regex.sub(self, text)
@@ -1,5 +1,5 @@
 """
-Python AIML Validator, v1.1
+Python AIML Validator, v1.2
 Author: Cort Stratton (cort@cortstratton.org)
 
 Usage:
@@ -8,6 +8,8 @@ Usage:
 
 # Revision history:
 #
+# 1.2: Categories are counted as they are parsed, instead of being kept
+#      in memory until the end of the file
 # 1.0.1: Redirected stderr to stdout
 # 1.0: Initial release
 
@@ -68,6 +70,12 @@ def main():
         for f in glob.glob(arg):
             parser = xml.sax.make_parser(["aiml.AimlParser"])
             handler = parser.getContentHandler()
+            # Nothing but the number of categories is needed, so hand each
+            # one to a counter instead of collecting them.
+            categoryCount = [0]
+            def countCategory(key, template):
+                categoryCount[0] += 1
+            handler.setCategorySink(countCategory)
             docCount += 1
             print( "Validating %s:" % f, end=' ' )
             try:
@@ -81,9 +89,9 @@ def main():
                 # Check the number of parse errors.
                 if handler.getNumErrors() == 0:    
                     validCount += 1
-                    print( "PASSED\n" )
+                    print( "PASSED (%d categories)\n" % categoryCount[0] )
                 else:
-                    print( "FAILED\n" )
+                    print( "FAILED (%d categories)\n" % categoryCount[0] )
             except xml.sax.SAXParseException as err:
                 # These errors occur if the document does not contain
                 # well-formed XML (e.g. open or unbalanced tags).  If
@@ -37,6 +37,8 @@ def read_args():
     g2 = parser.add_argument_group( 'Options' )
     g2.add_argument( '--chdir', metavar='DIRECTORY',
                      help='Directory to change to before loading AIML files' )
+    g2.add_argument( '--processes', '-p', metavar='N', type=int,
+                     help='Parse the AIML files given with --aiml in N processes' )
     g2.add_argument( '--commands', '-c', metavar='COMMAND', nargs='+',  
                      default=[],
                      help='Optional command(s) to send to kernel after data loading' )
@@ -74,7 +76,7 @@ def main():
                        chdir=chdir)
     elif args.aiml:
         kern.bootstrap(learnFiles=args.aiml, commands=args.commands,
-                       chdir=args.chdir)
+                       chdir=args.chdir, processes=args.processes)
     elif args.brain:
         kern.bootstrap(brainFile=args.brain)
 
@@ -0,0 +1,69 @@
+"""
+Convert a brain file dumped by Kernel.saveBrain() into the compact,
+array-backed format read by CompactPatternMgr, or with --sharded into the
+demand-loaded format read by ShardedPatternMgr.
+
+Usage:
+    brainconvert.py [--sharded] input.brn output.brn
+"""
+
+from __future__ import print_function
+
+import os.path
+import sys
+import time
+
+from aiml.CompactPatternMgr import CompactPatternMgr
+from aiml.PatternMgr import PatternMgr
+from aiml.ShardedPatternMgr import ShardedPatternMgr
+
+
+def convert(inFile, outFile):
+    '''
+    Read the brain in inFile and write it to outFile in compact format.
+    Return the compact PatternMgr.
+    '''
+    mgr = PatternMgr()
+    mgr.restore(inFile)
+    compact = CompactPatternMgr.fromPatternMgr(mgr)
+    compact.save(outFile)
+    return compact
+
+
+def shard(inFile, outFile):
+    '''
+    Read the brain in inFile and write it to outFile in sharded format.
+    '''
+    mgr = PatternMgr()
+    mgr.restore(inFile)
+    ShardedPatternMgr.fromPatternMgr(mgr).save(outFile)
+
+
+def main():
+    '''Entry point'''
+    args = sys.argv[1:]
+    sharded = "--sharded" in args
+    if sharded:
+        args.remove("--sharded")
+    if len(args) != 2:
+        print( __doc__ )
+        sys.exit(2)
+    inFile, outFile = args
+    start = time.time()
+    if sharded:
+        shard(inFile, outFile)
+        print( "%d -> %d bytes in %.2f seconds" % (
+            os.path.getsize(inFile), os.path.getsize(outFile),
+            time.time() - start) )
+        return
+    compact = convert(inFile, outFile)
+    print( "%s: %d categories, %d nodes, %d words" % (
+        outFile, compact.numTemplates(), compact.numNodes(),
+        compact.numWords()) )
+    print( "%d -> %d bytes in %.2f seconds" % (
+        os.path.getsize(inFile), os.path.getsize(outFile),
+        time.time() - start) )
+
+
+if __name__ == '__main__':
+    main()
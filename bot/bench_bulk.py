@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+# Check a brain against a question corpus: time matching the corpus one
+# input at a time, with Kernel.match_many() in this process, and with
+# Kernel.match_many() spread over a process pool.  All three must agree.
+#
+# Usage: python bench_bulk.py [brain] [processes]
+#
+# The brain defaults to alice.  The corpus is made from the brain's own
+# patterns, with every wildcard filled in, each asked after a few
+# different bot replies ('that').
+
+from __future__ import print_function
+
+import glob
+import multiprocessing
+import os
+import random
+import re
+import sys
+import time
+
+BOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BOT_DIR))
+
+from aiml.Kernel import Kernel
+
+from bench_memory import brain_file
+
+FILLERS = ["cats", "the big dog", "my friend Tom", "blue", "robots", "pizza"]
+THATS = ["", "Do you like cats?", "What is your name?", "Why?"]
+
+
+def make_corpus(name, size=5000):
+    random.seed(0)
+    patterns = []
+    for f in sorted(glob.glob(os.path.join(BOT_DIR, name, "*.aiml"))):
+        with open(f, "rb") as aiml:
+            text = aiml.read().decode("utf-8", "replace")
+        patterns += re.findall(r"<pattern>([^<]*)</pattern>", text)
+    corpus = []
+    for i in range(size):
+        words = random.choice(patterns).split()
+        input_ = " ".join(random.choice(FILLERS) if w in ("*", "_") else w
+                          for w in words).lower()
+        corpus.append((input_, random.choice(THATS), ""))
+    return corpus
+
+
+def templates(matches):
+    return [m.template if m is not None else None for m in matches]
+
+
+def timed(func, repeat=3):
+    """Return the result of func() and its best time over repeat runs."""
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        result = func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def main():
+    name = sys.argv[1] if len(sys.argv) > 1 else "alice"
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else multiprocessing.cpu_count()
+    kernel = Kernel()
+    kernel.verbose(False)
+    kernel.loadBrain(brain_file(name))
+    corpus = make_corpus(name)
+    sub = kernel._subbers['normal'].sub
+    brain = kernel._brain
+
+    single, singleTime = timed(lambda: [brain.match(sub(i), sub(t), sub(c))
+                                        for i, t, c in corpus])
+    bulk, bulkTime = timed(lambda: kernel.match_many(corpus))
+    pooled, pooledTime = timed(lambda: kernel.match_many(corpus, processes))
+    if not templates(single) == templates(bulk) == templates(pooled):
+        raise AssertionError("match_many() disagrees with match()")
+
+    print("%-10s %8s %12s %12s %16s" % ("brain", "inputs", "match (s)",
+                                        "bulk (s)", "%d processes (s)" % processes))
+    print("%-10s %8d %12.3f %12.3f %16.3f" % (name, len(corpus), singleTime,
+                                              bulkTime, pooledTime))
+
+
+if __name__ == "__main__":
+    main()
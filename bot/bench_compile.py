@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+# Micro-benchmark of the template compiler: CPU time per turn of
+# Kernel.respond with interpreted and with compiled templates, with the
+# response cache disabled.  The replies must be the same.
+#
+# Usage: python bench_compile.py [brain] [turns]
+#
+# The brain defaults to alice, the number of turns to 2000.
+
+from __future__ import print_function
+
+import os
+import random
+import sys
+import time
+
+BOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BOT_DIR))
+
+from aiml.Kernel import Kernel
+
+from bench_memory import brain_file
+from bench_respond import QUESTIONS
+
+
+def run(kernel, turns):
+    random.seed(0)
+    replies = []
+    start = time.process_time()
+    for i in range(turns):
+        replies.append(kernel.respond(QUESTIONS[i % len(QUESTIONS)]))
+    return (time.process_time() - start) / turns, replies
+
+
+def main():
+    name = sys.argv[1] if len(sys.argv) > 1 else "alice"
+    turns = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    filename = brain_file(name)
+    # <date> must give the same reply in both runs
+    time.asctime = lambda: "Sat Oct 17 12:00:00 2026"
+    results = []
+    for compiled in (False, True):
+        kernel = Kernel()
+        kernel.verbose(False)
+        kernel.loadBrain(filename)
+        kernel.setResponseCacheSize(0)
+        kernel.compileTemplates(compiled)
+        results.append(run(kernel, turns))
+    if results[0][1] != results[1][1]:
+        raise AssertionError("compiled templates gave different replies")
+    print("%-10s %8s %16s %16s %9s" % ("brain", "turns", "interpreted (ms)",
+                                       "compiled (ms)", "speedup"))
+    print("%-10s %8d %16.3f %16.3f %8.2fx" % (
+        name, turns, results[0][0] * 1000, results[1][0] * 1000,
+        results[0][0] / results[1][0]))
+
+
+if __name__ == "__main__":
+    main()
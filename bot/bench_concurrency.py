@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+# Benchmark of Kernel.respond serving several sessions from a thread pool:
+# replies per second with 1, 2, 4 and 8 threads, each thread talking in its
+# own session, for a Kernel serializing every reply behind one lock (as
+# before per-session locking) and for the current Kernel.
+#
+# Pure Python matching holds the GIL, so CPU-bound replies can't run in
+# parallel either way.  What per-session locking buys is that a reply
+# waiting on I/O (a <system> command, say) no longer stalls every other
+# conversation; --delay simulates that wait, in milliseconds per reply.
+#
+# Usage: python bench_concurrency.py [brain] [turns] [--delay ms]
+#
+# The brain defaults to alice, the number of turns to 400, the delay to 0.
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BOT_DIR))
+
+from aiml.Kernel import Kernel
+
+from bench_memory import brain_file
+from bench_respond import QUESTIONS
+
+
+class SlowKernel(Kernel):
+    """Kernel whose replies wait for delay seconds, as if a template was
+    waiting on I/O."""
+
+    delay = 0
+
+    def _respond(self, input_, sessionID):
+        if self.delay and len(self.getPredicate(self._inputStack, sessionID)) == 0:
+            time.sleep(self.delay)
+        return Kernel._respond(self, input_, sessionID)
+
+
+class GlobalLockKernel(SlowKernel):
+    """Kernel answering one session at a time."""
+
+    def __init__(self):
+        SlowKernel.__init__(self)
+        self._globalLock = threading.RLock()
+
+    def respond(self, input_, sessionID=Kernel._globalSessionID):
+        with self._globalLock:
+            return SlowKernel.respond(self, input_, sessionID)
+
+
+def run(kernel, threads, turns):
+    def converse(session):
+        for i in range(turns // threads):
+            kernel.respond(QUESTIONS[i % len(QUESTIONS)], "session%d" % session)
+    start = time.time()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(converse, range(threads)))
+    return (turns // threads * threads) / (time.time() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("brain", nargs="?", default="alice")
+    parser.add_argument("turns", nargs="?", type=int, default=400)
+    parser.add_argument("--delay", type=float, default=0,
+                        help="simulated I/O wait per reply, in milliseconds")
+    args = parser.parse_args()
+    filename = brain_file(args.brain)
+    kernels = []
+    for cls in (GlobalLockKernel, SlowKernel):
+        kernel = cls()
+        kernel.verbose(False)
+        kernel.loadBrain(filename)
+        # measure the replies, not the response cache
+        kernel.setResponseCacheSize(0)
+        kernel.delay = args.delay / 1000.0
+        kernels.append(kernel)
+    print("%-10s %8s %8s %20s %20s %9s" % ("brain", "turns", "threads",
+                                           "global lock (rps)",
+                                           "per session (rps)", "speedup"))
+    for threads in (1, 2, 4, 8):
+        results = [run(kernel, threads, args.turns) for kernel in kernels]
+        print("%-10s %8d %8d %20.1f %20.1f %8.2fx" % (
+            args.brain, args.turns, threads, results[0], results[1],
+            results[1] / results[0]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+# Worst-case matching benchmark: compare the explicit-stack matcher of
+# PatternMgr with the recursive matcher it replaced, on long inputs that
+# make the recursive matcher backtrack through every wildcard split.
+# Both matchers must pick the same template.
+#
+# Usage: python bench_match.py [brain] [words ...]
+#
+# The brain defaults to alice; the input lengths to 12, 16 and 20 words.
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+BOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BOT_DIR))
+
+from aiml.PatternMgr import PatternMgr
+
+from bench_memory import brain_file, load_dict
+
+
+class RecursivePatternMgr(PatternMgr):
+    """PatternMgr with the original, recursive matcher."""
+
+    def _match(self, words, thatWords, topicWords, root):
+        if len(words) == 0:
+            pattern = []
+            template = None
+            if len(thatWords) > 0:
+                child = self._child(root, self._THAT)
+                if child is not None:
+                    pattern, template = self._match(thatWords, [], topicWords, child)
+                    if pattern is not None:
+                        pattern = [self._THAT] + pattern
+            elif len(topicWords) > 0:
+                child = self._child(root, self._TOPIC)
+                if child is not None:
+                    pattern, template = self._match(topicWords, [], [], child)
+                    if pattern is not None:
+                        pattern = [self._TOPIC] + pattern
+            if template is None:
+                pattern = []
+                template = self._nodeTemplate(root)
+            return (pattern, template)
+
+        first = words[0]
+        suffix = words[1:]
+        child = self._child(root, self._UNDERSCORE)
+        if child is not None:
+            for j in range(len(suffix)+1):
+                pattern, template = self._match(suffix[j:], thatWords, topicWords, child)
+                if template is not None:
+                    return ([self._UNDERSCORE] + pattern, template)
+        child = self._child(root, first)
+        if child is not None:
+            pattern, template = self._match(suffix, thatWords, topicWords, child)
+            if template is not None:
+                return ([first] + pattern, template)
+        child = self._child(root, self._BOT_NAME)
+        if child is not None and first == self._botName:
+            pattern, template = self._match(suffix, thatWords, topicWords, child)
+            if template is not None:
+                return ([first] + pattern, template)
+        child = self._child(root, self._STAR)
+        if child is not None:
+            for j in range(len(suffix)+1):
+                pattern, template = self._match(suffix[j:], thatWords, topicWords, child)
+                if template is not None:
+                    return ([self._STAR] + pattern, template)
+        return (None, None)
+
+
+# Inputs built from words that follow wildcards in many alice patterns, so
+# that every split of every "_" and "*" leads somewhere before failing.
+FILLER = ("LOEBNER SEX A PERSON ELIZA TURING WHAT KRAFTWERK S COMMENT A NAME "
+          "YOU KRAFTWERK A ABOUT")
+
+
+def make_input(length):
+    words = FILLER.split()
+    return " ".join(words[i % len(words)] for i in range(length))
+
+
+def timed(mgr, input_):
+    start = time.time()
+    try:
+        result = mgr._match(input_.split(), ["ULTRABOGUSDUMMYTHAT"],
+                            ["ULTRABOGUSDUMMYTOPIC"], mgr._root)
+    except RecursionError:
+        return None, time.time() - start
+    return result, time.time() - start
+
+
+def main():
+    name = sys.argv[1] if len(sys.argv) > 1 else "alice"
+    lengths = [int(n) for n in sys.argv[2:]] or [12, 16, 20]
+    filename = brain_file(name)
+    stack = load_dict(filename)
+    recursive = load_dict(filename, RecursivePatternMgr)
+
+    print("%-8s %14s %14s %9s" % ("words", "recursive (s)", "stack (s)", "speedup"))
+    for length in lengths:
+        input_ = make_input(length)
+        old, oldTime = timed(recursive, input_)
+        new, newTime = timed(stack, input_)
+        if old is not None and old[1] != new[0]:
+            raise AssertionError("matchers disagree on %r" % input_)
+        print("%-8d %14s %14.4f %8.1fx" % (
+            length, "%.4f" % oldTime if old is not None else "overflow",
+            newTime, oldTime / max(newTime, 1e-6)))
+
+
+if __name__ == "__main__":
+    main()
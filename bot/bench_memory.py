@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+# Compare the memory used by the dictionary trie (PatternMgr) and the
+# array-backed trie (CompactPatternMgr) for the shipped brains, and the
+# time it takes to restore each of them from disk.
+#
+# Usage: python bench_memory.py [brain ...]
+#
+# Brains are given by name (alice, alisochka, sara).  A missing .brn file
+# is built from the bot's AIML files first.  A compact .brn file (such as
+# the shipped alice.brn) is thawed into a dictionary trie, so its load
+# time includes thawing.
+
+from __future__ import print_function
+
+import gc
+import glob
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BOT_DIR))
+
+from aiml.Kernel import Kernel
+from aiml.PatternMgr import PatternMgr
+from aiml.CompactPatternMgr import CompactPatternMgr, isCompactBrain
+
+
+def brain_file(name):
+    filename = os.path.join(BOT_DIR, name + ".brn")
+    if not os.path.exists(filename):
+        k = Kernel()
+        k.verbose(False)
+        for f in sorted(glob.glob(os.path.join(BOT_DIR, name, "*.aiml"))):
+            k.learn(f)
+        k.saveBrain(filename)
+    return filename
+
+
+def measure(load):
+    gc.collect()
+    tracemalloc.start()
+    start = time.time()
+    obj = load()
+    elapsed = time.time() - start
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, size, elapsed
+
+
+def load_dict(filename, cls=PatternMgr):
+    """Return a cls holding the brain in filename as a dictionary trie.
+    A compact brain (the shipped alice.brn) is thawed."""
+    mgr = cls()
+    if not isCompactBrain(filename):
+        mgr.restore(filename)
+        return mgr
+    thawed = load_compact(filename).thaw()
+    mgr._root = thawed._root
+    mgr._templateCount = thawed._templateCount
+    mgr._botName = thawed._botName
+    return mgr
+
+
+def load_compact(filename):
+    mgr = CompactPatternMgr()
+    mgr.restore(filename)
+    return mgr
+
+
+def main():
+    names = sys.argv[1:] or ["alice", "alisochka", "sara"]
+    print("%-10s %10s %12s %12s %8s %10s %10s" % (
+        "brain", "categories", "dict (KiB)", "compact (KiB)", "saved",
+        "load (s)", "mmap (s)"))
+    for name in names:
+        filename = brain_file(name)
+        start = time.time()
+        load_dict(filename)
+        dictTime = time.time() - start
+        mgr, dictSize, _ = measure(lambda: load_dict(filename))
+        compact, compactSize, _ = measure(
+            lambda: CompactPatternMgr.fromPatternMgr(mgr))
+        # free the dictionary trie before going on
+        mgr = None
+
+        fd, compactFile = tempfile.mkstemp(suffix=".brn")
+        os.close(fd)
+        try:
+            compact.save(compactFile)
+            start = time.time()
+            load_compact(compactFile)
+            mapTime = time.time() - start
+        finally:
+            os.remove(compactFile)
+
+        print("%-10s %10d %12d %12d %7.1f%% %10.3f %10.4f" % (
+            name, compact.numTemplates(), dictSize // 1024,
+            compactSize // 1024, 100.0 * (dictSize - compactSize) / dictSize,
+            dictTime, mapTime))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+# Micro-benchmark of Kernel.respond: CPU time per turn with the per-turn
+# normalization cache, and with every <srai> normalizing its input, 'that'
+# and 'topic' from scratch as before.
+#
+# Usage: python bench_respond.py [brain] [turns]
+#
+# The brain defaults to alice, the number of turns to 2000.
+
+from __future__ import print_function
+
+import os
+import random
+import sys
+import time
+
+BOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BOT_DIR))
+
+from aiml.Kernel import Kernel
+
+from bench_memory import brain_file
+
+QUESTIONS = [
+    "Hello", "What is your name?", "My name is Tom", "How old are you?",
+    "I am 8 years old", "Do you like cats?", "What is a robot?",
+    "Tell me a joke", "Why is the sky blue?", "Where do you live?",
+    "What is my name?", "Are you a girl or a boy?", "I like pizza",
+    "What can you do?", "Who made you?", "Yes", "No", "Why?",
+    "What time is it?", "Do you have any brothers or sisters?",
+]
+
+
+class UncachedKernel(Kernel):
+    """Kernel normalizing every input from scratch."""
+
+    def _normalize(self, text, sessionID):
+        return self._brain.normalize(self._subbers['normal'].sub(text))
+
+
+def run(kernel, turns):
+    random.seed(0)
+    start = time.process_time()
+    for i in range(turns):
+        kernel.respond(QUESTIONS[i % len(QUESTIONS)])
+    return (time.process_time() - start) / turns
+
+
+def main():
+    name = sys.argv[1] if len(sys.argv) > 1 else "alice"
+    turns = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    filename = brain_file(name)
+    results = []
+    for cls in (UncachedKernel, Kernel):
+        kernel = cls()
+        kernel.verbose(False)
+        kernel.loadBrain(filename)
+        results.append(run(kernel, turns))
+    print("%-10s %8s %16s %16s %9s" % ("brain", "turns", "uncached (ms)",
+                                       "cached (ms)", "speedup"))
+    print("%-10s %8d %16.3f %16.3f %8.2fx" % (
+        name, turns, results[0] * 1000, results[1] * 1000,
+        results[0] / results[1]))
+
+
+if __name__ == "__main__":
+    main()
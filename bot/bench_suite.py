@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+
+# Throughput and latency benchmark of the shipped brains, for comparing
+# commits.  For each brain, in a fresh process of its own:
+#
+#  - the time taken to load the brain;
+#  - a fixed question corpus (made from the brain's own patterns, see
+#    bench_bulk.py) replayed for the given number of turns;
+#  - a bot-to-bot dialogue like the one in PyAIML's stress.py, two
+#    sessions answering each other for the given number of turns, and
+#    breaking the ice with the next corpus question whenever a reply is
+#    empty.  Each bot answers the last sentence of the other's reply;
+#    answering all of them, as stress.py does, makes the replies grow
+#    without end;
+#  - replies per second and the p50/p95/p99 latency of each run, and the
+#    peak RSS of the process.
+#
+# Everything is seeded and <date> is frozen, so two runs on the same
+# commit ask the same questions and get the same replies; a digest of the
+# replies of each run tells whether two commits answered alike.  The
+# results are written as JSON, with sorted keys, to be diffed or compared
+# between commits.
+#
+# Usage: python bench_suite.py [brain ...] [--turns N] [--output FILE]
+#                              [--compare FILE]
+#
+# The brains default to sara, alice and alisochka, the number of turns to
+# 1000, the output to bench_suite.json.  --compare prints the change of
+# each figure against the results of an earlier run.
+
+from __future__ import print_function
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+
+BOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BOT_DIR))
+
+from aiml.Kernel import Kernel
+from aiml.Utils import sentences
+
+from bench_bulk import make_corpus
+from bench_memory import brain_file
+
+BRAINS = ["sara", "alice", "alisochka"]
+
+try: timer = time.perf_counter
+except AttributeError: timer = time.time
+
+
+def percentile(values, p):
+    """Return the p-th percentile of the sorted values (nearest rank)."""
+    rank = max(int(round(p / 100.0 * len(values))), 1)
+    return values[min(rank, len(values)) - 1]
+
+
+def summary(replies, latencies, elapsed):
+    digest = hashlib.md5()
+    for reply in replies:
+        digest.update(reply.encode("utf-8") + b"\n")
+    latencies = sorted(latencies)
+    return {
+        "replies": len(latencies),
+        "digest": digest.hexdigest(),
+        "replies_per_sec": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def replay(kernel, questions):
+    random.seed(0)
+    replies = []
+    latencies = []
+    start = timer()
+    for question in questions:
+        before = timer()
+        replies.append(kernel.respond(question, "corpus"))
+        latencies.append(timer() - before)
+    return summary(replies, latencies, timer() - start)
+
+
+def dialogue(kernel, questions, turns):
+    random.seed(0)
+    replies = []
+    latencies = []
+    icebreakers = itertools.cycle(questions)
+    response = next(icebreakers)
+    start = timer()
+    for i in range(turns):
+        before = timer()
+        response = kernel.respond(response, "bot%d" % (i % 2 + 1)).strip()
+        latencies.append(timer() - before)
+        replies.append(response)
+        # If the bots have run out of things to say, one of them breaks
+        # the ice.
+        response = sentences(response)[-1] if response else next(icebreakers)
+    return summary(replies, latencies, timer() - start)
+
+
+def peak_rss():
+    """Return the peak resident set size of this process, in kilobytes."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def bench(name, turns):
+    """Benchmark the brain name in this process."""
+    # <date> must give the same reply in every run
+    time.asctime = lambda: "Sat Oct 17 12:00:00 2026"
+    questions = [q for q, that, topic in make_corpus(name, turns)]
+    start = timer()
+    kernel = Kernel()
+    kernel.verbose(False)
+    kernel.loadBrain(brain_file(name))
+    load = timer() - start
+    return {
+        "load_ms": round(load * 1000, 1),
+        "corpus": replay(kernel, questions),
+        "dialogue": dialogue(kernel, questions, turns),
+        "peak_rss_kb": peak_rss(),
+    }
+
+
+def commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BOT_DIR,
+            stderr=subprocess.STDOUT).decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def figures(results):
+    """Yield (brain, figure, value) for each figure of results."""
+    for name, brain in sorted(results["brains"].items()):
+        for key, value in sorted(brain.items()):
+            if isinstance(value, dict):
+                for figure, v in sorted(value.items()):
+                    yield name, key + "." + figure, v
+            else:
+                yield name, key, value
+
+
+def compare(old, new):
+    oldFigures = dict(((name, figure), value)
+                      for name, figure, value in figures(old))
+    print("\n%-10s %-26s %12s %12s %9s" % ("brain", "figure", old["commit"],
+                                           new["commit"], "change"))
+    for name, figure, value in figures(new):
+        before = oldFigures.get((name, figure))
+        if before is None:
+            continue
+        if not isinstance(value, (int, float)):
+            change = "" if value == before else "differs"
+            before, value = before[:8], value[:8]
+        elif before:
+            change = "%+8.1f%%" % ((value - before) * 100.0 / before)
+        else:
+            change = ""
+        print("%-10s %-26s %12s %12s %9s" % (name, figure, before, value, change))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("brains", nargs="*", default=BRAINS)
+    parser.add_argument("--turns", type=int, default=1000)
+    parser.add_argument("--output", default="bench_suite.json")
+    parser.add_argument("--compare", metavar="FILE",
+                        help="results of an earlier run to compare with")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        json.dump(bench(args.brains[0], args.turns), sys.stdout)
+        return
+
+    results = {
+        "commit": commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "turns": args.turns,
+        "brains": {},
+    }
+    print("%-10s %9s %11s %11s %9s %9s %9s %11s" % (
+        "brain", "load (ms)", "run", "replies/s", "p50 (ms)", "p95 (ms)",
+        "p99 (ms)", "peak RSS MB"))
+    for name in args.brains:
+        # built beforehand, so that building doesn't count in the figures
+        brain_file(name)
+        # one process per brain, for a clean load and peak RSS
+        output = subprocess.check_output(
+            [sys.executable, os.path.abspath(__file__), name,
+             "--turns", str(args.turns), "--child"])
+        brain = results["brains"][name] = json.loads(output.decode("utf-8"))
+        for run in ("corpus", "dialogue"):
+            print("%-10s %9.1f %11s %11.1f %9.3f %9.3f %9.3f %11.1f" % (
+                name, brain["load_ms"], run, brain[run]["replies_per_sec"],
+                brain[run]["p50_ms"], brain[run]["p95_ms"],
+                brain[run]["p99_ms"], brain["peak_rss_kb"] / 1024.0))
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print("\nResults written to", args.output)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+# Report what sharing templates (see aiml/TemplatePool.py) saves for the
+# shipped brains: the memory taken by a brain learned from its AIML files
+# and by the same brain restored from a .brn file, and the size of the
+# .brn file, with every template stored separately as before and with
+# the templates interned.  For compact brains, the size of the templates
+# stored once each against the size of one copy per category.
+#
+# Usage: python bench_templates.py [brain ...]
+#
+# Brains are given by name (alice, alisochka, sara), all three by default.
+
+from __future__ import print_function
+
+import gc
+import glob
+import os
+import sys
+import tempfile
+import tracemalloc
+
+BOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BOT_DIR))
+
+from aiml.Kernel import Kernel
+from aiml.PatternMgr import PatternMgr
+from aiml.CompactPatternMgr import CompactPatternMgr
+
+from bench_memory import load_dict
+
+
+class PlainPatternMgr(PatternMgr):
+    """PatternMgr storing every template as it is given."""
+
+    def _internTemplate(self, template):
+        return template
+
+
+def learn(cls, filenames):
+    """Return a cls holding the categories of the AIML files, and the
+    memory it takes (pool included)."""
+    kernel = Kernel()
+    kernel.verbose(False)
+    gc.collect()
+    tracemalloc.start()
+    mgr = cls()
+    for categories in kernel._parseFiles(filenames):
+        for key, template in (categories or {}).items():
+            mgr.add(key, template)
+    categories = None
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return mgr, size
+
+
+def restored(filename):
+    """Return the memory taken by the dictionary brain in filename."""
+    gc.collect()
+    tracemalloc.start()
+    # Keep the brain alive until it has been measured.
+    mgr = load_dict(filename)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del mgr
+    return size
+
+
+def compact_templates(mgr):
+    """Return the size of the templates of a compact brain built from
+    mgr, and their size with one copy per category."""
+    compact = CompactPatternMgr.fromPatternMgr(mgr)
+    offsets = compact._templateOffsets
+    perCategory = sum(offsets[i + 1] - offsets[i]
+                      for i in compact._templateIndex
+                      if i != compact._NO_TEMPLATE)
+    return len(compact._templateData), perCategory, len(offsets) - 1
+
+
+def main():
+    names = sys.argv[1:] or ["alice", "alisochka", "sara"]
+    MB = 1024.0 * 1024
+    print("%-10s %-7s %10s %12s %13s %9s" % ("brain", "", "templates",
+                                             "learned (MB)", "restored (MB)",
+                                             ".brn (MB)"))
+    tmpdir = tempfile.mkdtemp()
+    for name in names:
+        filenames = sorted(glob.glob(os.path.join(BOT_DIR, name, "*.aiml")))
+        for label, cls in (("plain", PlainPatternMgr), ("pooled", PatternMgr)):
+            mgr, learned = learn(cls, filenames)
+            filename = os.path.join(tmpdir, "%s-%s.brn" % (name, label))
+            mgr.save(filename)
+            print("%-10s %-7s %10d %12.1f %13.1f %9.2f" % (
+                name, label, mgr.numTemplates(), learned / MB,
+                restored(filename) / MB, os.path.getsize(filename) / MB))
+            os.remove(filename)
+        stored, perCategory, distinct = compact_templates(mgr)
+        print("%-10s %-7s %10d %12s %13s %9.2f  (%.2f MB with a copy per category)" % (
+            name, "compact", distinct, "", "", stored / MB, perCategory / MB))
+    os.rmdir(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+# Micro-benchmark of WordSub: time per substitution with the lookup table
+# used by sub() and with the regex alternation it replaced, for each of the
+# default subbers, over the benchmark questions and the bot's answers to
+# them.  The two must give the same results.
+#
+# Usage: python bench_wordsub.py [brain] [rounds]
+#
+# The brain defaults to alice, the number of rounds to 20.
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+BOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BOT_DIR))
+
+from aiml.Kernel import Kernel
+
+from bench_memory import brain_file
+from bench_respond import QUESTIONS
+
+
+def timed(sub, texts, rounds):
+    """Return the best time per call of sub over texts, in seconds."""
+    best = None
+    for i in range(3):
+        start = time.process_time()
+        for r in range(rounds):
+            for text in texts:
+                sub(text)
+        elapsed = (time.process_time() - start) / (rounds * len(texts))
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    name = sys.argv[1] if len(sys.argv) > 1 else "alice"
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    kernel = Kernel()
+    kernel.verbose(False)
+    kernel.loadBrain(brain_file(name))
+    texts = list(QUESTIONS) + [kernel.respond(q) for q in QUESTIONS]
+    print("%-10s %8s %14s %14s %9s" % ("subber", "keys", "regex (us)",
+                                       "table (us)", "speedup"))
+    for subName in ("normal", "person", "person2", "gender"):
+        subber = kernel._subbers[subName]
+        for text in texts:
+            assert subber.sub(text) == subber.subRegex(text), text
+        regex = timed(subber.subRegex, texts, rounds)
+        table = timed(subber.sub, texts, rounds)
+        print("%-10s %8d %14.2f %14.2f %8.2fx" % (
+            subName, len(subber), regex * 1e6, table * 1e6, regex / table))
+
+
+if __name__ == "__main__":
+    main()
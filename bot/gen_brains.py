@@ -18,23 +18,30 @@
 # A simple hack to attach a chatterbot to speak activity
 #coding=utf-8
 
+# Only the AIML files that changed since the last run are parsed again; see
+# aiml.BrainBuilder.  Pass --full to build every brain from scratch.
+
+from aiml.BrainBuilder import BrainBuilder
 from aiml.Kernel import Kernel
 import glob
+import sys
 
-k = Kernel()
-laiml = glob.glob("sara/*.aiml") #devuelve lista con ficheros *.aiml
-for fichero in laiml:
-    k.learn(str(fichero))
-k.saveBrain("sara.brn")
-
-k = Kernel()
-laiml = glob.glob("alice/*.aiml") #devuelve lista con ficheros *.aiml
-for fichero in laiml:
-    k.learn(str(fichero))
-k.saveBrain("alice.brn")
+# Bot predicates saved in each brain, so that a Kernel is ready to answer
+# as soon as brain.py loads it.
+PREDICATES = {
+    "sara": {"nombre_bot": "Sara", "botmaster": "La comunidad Azucar"},
+    "alice": {"name": "Alice", "master": "The Sugar Community"},
+    "alisochka": {},
+}
 
-k = Kernel()
-laiml = glob.glob("alisochka/*.aiml")
-for fichero in laiml:
-    k.learn(str(fichero))
-k.saveBrain("alisochka.brn")
+full = "--full" in sys.argv[1:]
+for name in ("sara", "alice", "alisochka"):
+    k = Kernel()
+    k.verbose(False)
+    for predicate, value in PREDICATES[name].items():
+        k.setBotPredicate(predicate, value)
+    laiml = sorted(glob.glob(name + "/*.aiml")) #devuelve lista con ficheros *.aiml
+    # A full build streams every file into the trie, one category at a
+    # time; the files patched into an existing brain are parsed in a pool
+    # of one process per CPU.
+    BrainBuilder(name + ".brn", kernel=k).build(laiml, full=full, processes=None)
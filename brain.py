@@ -19,7 +19,11 @@
 #     License along with HablarConSara.activity.  If not, see
 #     <http://www.gnu.org/licenses/>.
 
+import os
 import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from gettext import gettext as _
 
 from gi.repository import Gdk
@@ -28,6 +32,7 @@ from gi.repository import Gio
 
 from sugar3 import profile
 
+from aiml.CompactPatternMgr import isCompactBrain
 from aiml.Kernel import Kernel
 import voice
 
@@ -50,17 +55,33 @@ def get_mem_info(tag):
     return int([i for i in meminfo if i.startswith(tag)][0].split()[1])
 
 
-# load Standard AIML set for restricted systems
-if get_mem_info('MemTotal:') < 524288:
-    mem_free = get_mem_info('MemFree:') + get_mem_info('Cached:')
-    if mem_free < 102400:
-        BOTS[_('English')]['brain'] = None
-    else:
-        BOTS[_('English')]['brain'] = 'bot/alisochka.brn'
+# The kernels of recently used brains stay loaded, with their sessions,
+# while their estimated memory (see _brain_cost()) fits in this many
+# bytes, so that switching languages back and forth doesn't load the
+# brains again.  The current kernel is always kept.
+KERNEL_BUDGET = 16 * 1024 * 1024
+
+# The memory taken by a loaded brain, against the size of its file, as
+# measured for the brains in bot/: about 1/16 for the compact alice.brn,
+# 15 times for the marshalled sara.brn and alisochka.brn.
+COMPACT_RATIO = 16
+MARSHAL_RATIO = 15
 
 
 _kernel = None
-_kernel_voice = None
+# brain file -> (Kernel, estimated bytes), least recently used first.
+# Only the loader thread touches it.
+_kernels = OrderedDict()
+# Brains are loaded one at a time in this thread, away from the GTK main
+# loop; everything else here runs on the main loop.
+_loader = ThreadPoolExecutor(max_workers=1)
+# the load the user is waiting for, if any, and the questions asked
+# meanwhile, as (text, callback) pairs
+_loading = None
+_pending = []
+_old_cursor = None
+# the kernels that were told the child's name and age
+_introduced = weakref.WeakSet()
 
 
 def _get_age():
@@ -76,6 +97,94 @@ def _get_age():
         return int(age)
 
 
+def _brain_cost(filename):
+    """Estimate the memory taken by a Kernel holding the brain in
+    filename.  A compact brain is mapped from its file, whose pages the
+    system can drop again, and only takes a little memory of its own; any
+    other brain is unmarshalled, and takes many times its size in the
+    file."""
+    size = os.path.getsize(filename)
+    if isCompactBrain(filename):
+        return size // COMPACT_RATIO
+    return size * MARSHAL_RATIO
+
+
+def _fits_in_memory(filename):
+    """Return True if there is enough free memory to load the brain in
+    filename.  The English brain is compact (see aiml.CompactPatternMgr):
+    it is mapped from the file rather than read into memory, so even
+    machines with little memory get the full set."""
+    mem_free = get_mem_info('MemFree:') + get_mem_info('Cached:')
+    return _brain_cost(filename) <= mem_free * 1024
+
+
+def _load_kernel(brain):
+    """Return a new Kernel holding brain."""
+    kernel = Kernel()
+    kernel.loadBrain(brain['brain'])
+    # brains built by bot/gen_brains.py already hold their
+    # bot predicates
+    for name, value in list(brain['predicates'].items()):
+        if kernel.getBotPredicate(name) != value:
+            kernel.setBotPredicate(name, value)
+    return kernel
+
+
+def _get_kernel(brain):
+    """Return the Kernel of brain, loading it unless it is in the pool,
+    or None if there is no memory for it.  Runs in the loader thread."""
+    filename = brain['brain']
+    kernel, cost = _kernels.pop(filename, (None, 0))
+    if kernel is None:
+        if not _fits_in_memory(filename):
+            return None
+        kernel = _load_kernel(brain)
+        cost = _brain_cost(filename)
+    # most recently used
+    _kernels[filename] = (kernel, cost)
+
+    # Drop the least recently used kernels beyond the budget.  They are
+    # freed as their references go; no collection is forced on the UI
+    # thread.
+    total = sum(size for k, size in _kernels.values())
+    while total > KERNEL_BUDGET and len(_kernels) > 1:
+        old, (k, size) = _kernels.popitem(last=False)
+        logger.debug('Unload bot: %s' % old)
+        total -= size
+    return kernel
+
+
+def _prefetch(brain):
+    """Load brain into the pool, as the least recently used kernel, if it
+    fits in the budget beside the kernels there.  Runs in the loader
+    thread."""
+    filename = brain['brain']
+    if filename in _kernels:
+        return
+    cost = _brain_cost(filename)
+    if sum(size for k, size in _kernels.values()) + cost > KERNEL_BUDGET:
+        return
+    if not _fits_in_memory(filename):
+        return
+    logger.debug('Prefetch bot: %s' % filename)
+    _kernels[filename] = (_load_kernel(brain), cost)
+    _kernels.move_to_end(filename, last=False)
+
+
+def _get_brain(voice):
+    """Return the brain speaking voice, or the English one."""
+    return BOTS.get(voice.friendlyname, BOTS[_('English')])
+
+
+def preload(voice=None):
+    """Start loading the brain of voice (by default, the default voice) in
+    the background, so that it is ready by the time the robot mode is
+    chosen.  Call it when the activity starts."""
+    if voice is None:
+        voice = get_default_voice()
+    _loader.submit(_get_kernel, _get_brain(voice))
+
+
 def get_default_voice():
     default_voice = voice.defaultVoice()
     if default_voice.friendlyname not in BOTS:
@@ -84,7 +193,7 @@ def get_default_voice():
         return default_voice
 
 
-def respond(text):
+def _answer(text):
     if _kernel is not None:
         text = _kernel.respond(text)
     if _kernel is None or not text:
@@ -92,62 +201,99 @@ def respond(text):
     return text
 
 
+def respond(text, callback=None):
+    """Return the answer of the current brain to text.
+
+    If callback is given, callback(answer) is called instead, on the main
+    loop; a question asked while a brain is loading is queued until the
+    brain is ready, and answered by it."""
+    if callback is not None and _loading is not None:
+        _pending.append((text, callback))
+        return None
+    answer = _answer(text)
+    if callback is not None:
+        callback(answer)
+    return answer
+
+
 def load(activity, voice, sorry=None):
-    old_cursor = activity.get_window().get_cursor()
-    activity.get_window().set_cursor(Gdk.Cursor(Gdk.CursorType.WATCH))
-
-    def load_brain():
-        global _kernel
-        global _kernel_voice
-
-        is_first_session = _kernel is None
-
-        try:
-            if voice.friendlyname in BOTS:
-                brain = BOTS[voice.friendlyname]
-                brain_name = BOTS[voice.friendlyname]['name']
-            else:
-                brain = BOTS[_('English')]
-                brain_name = BOTS[_('English')]['name']
-            logger.debug('Load bot: %s' % brain)
-
-            if voice != _kernel_voice or _kernel is None:
-                kernel = Kernel()
-
-                if brain['brain'] is None:
-                    warning = _("Sorry, there is no free memory to load my "
-                                "brain. Close other activities and try once more.")
-                    activity.face.say_notification(warning)
-                    return
-
-                kernel.loadBrain(brain['brain'])
-                for name, value in list(brain['predicates'].items()):
-                    kernel.setBotPredicate(name, value)
-
-                if _kernel is not None:
-                    del _kernel
-                    _kernel = None
-                    import gc
-                    gc.collect()
-
-                _kernel = kernel
-                _kernel_voice = voice
-        finally:
-            activity.get_window().set_cursor(old_cursor)
-
-        if is_first_session:
+    """Switch to the brain speaking voice.  It is loaded in the loader
+    thread, unless it is in the pool already, and the robot greets the
+    child once it is ready."""
+    global _loading
+    global _old_cursor
+
+    brain = _get_brain(voice)
+    logger.debug('Load bot: %s' % brain)
+    if _loading is None:
+        _old_cursor = activity.get_window().get_cursor()
+        activity.get_window().set_cursor(Gdk.Cursor(Gdk.CursorType.WATCH))
+    future = _loader.submit(_get_kernel, brain)
+    _loading = future
+
+    def loaded(future):
+        GLib.idle_add(_loaded, activity, brain, future, sorry)
+
+    future.add_done_callback(loaded)
+    return True
+
+
+def _flush_pending():
+    """Answer the questions asked while loading."""
+    pending = list(_pending)
+    del _pending[:]
+    for text, callback in pending:
+        callback(_answer(text))
+
+
+def _loaded(activity, brain, future, sorry):
+    """Make the brain loaded by load() the current one, on the main loop,
+    and answer the questions asked meanwhile."""
+    global _kernel
+    global _loading
+
+    if future is not _loading:
+        # the child chose another voice meanwhile
+        return False
+    _loading = None
+    activity.get_window().set_cursor(_old_cursor)
+
+    is_first_session = _kernel is None
+    try:
+        kernel = future.result()
+    except Exception:
+        logger.exception('Could not load bot: %s' % brain)
+    else:
+        if kernel is None:
+            warning = _("Sorry, there is no free memory to load my "
+                        "brain. Close other activities and try once more.")
+            activity.face.say_notification(warning)
+            _flush_pending()
+            return False
+        _kernel = kernel
+        if _kernel not in _introduced:
+            # each brain keeps its own session
             _kernel.respond(_('my name is %s') % (profile.get_nick_name()))
             _kernel.respond(_('I am %d years old') % (_get_age()))
-            hello = \
-                _("Hello, I'm a robot \"%s\". Please ask me any question.") \
-                % brain_name
-            if sorry:
-                hello += ' ' + sorry
-            activity.face.say_notification(hello)
-        elif sorry:
-            activity.face.say_notification(sorry)
-        else:
-            activity.face.say_notification("Hi again!")
-
-    GLib.idle_add(load_brain)
-    return True
+            _introduced.add(_kernel)
+
+    if is_first_session and _kernel is not None:
+        hello = \
+            _("Hello, I'm a robot \"%s\". Please ask me any question.") \
+            % brain['name']
+        if sorry:
+            hello += ' ' + sorry
+        activity.face.say_notification(hello)
+    elif sorry:
+        activity.face.say_notification(sorry)
+    elif _kernel is not None:
+        activity.face.say_notification("Hi again!")
+
+    _flush_pending()
+
+    # The child is likely to come back to the language of the default
+    # voice; have its brain in the pool by then.
+    default = _get_brain(get_default_voice())
+    if default is not brain:
+        _loader.submit(_prefetch, default)
+    return False
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+# Run LLM.ask_llm_prompted against a stub of the server on localhost.
+#
+# Usage: python3 -m unittest test_llm
+
+import json
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import LLM
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server.requests.append((self.client_address, self.headers["X-API-Key"], body))
+        if server.status >= 500:
+            reply = b"down"
+        else:
+            reply = json.dumps({"answer": "You asked: " + body["question"]}).encode()
+        self.send_response(server.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestLLM(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.server.daemon_threads = True
+        self.server.requests = []
+        self.server.status = 200
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        patches = [
+            mock.patch.object(LLM, "API_URL", "http://127.0.0.1:%d/ask-llm-prompted"
+                              % self.server.server_address[1]),
+            mock.patch.object(LLM, "API_KEY", "secret"),
+            mock.patch.object(LLM, "is_connected", lambda: True),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        LLM.close()
+
+    def tearDown(self):
+        LLM.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test01_answer(self):
+        '''questions get the answer of the server, with the API key'''
+        self.assertEqual(LLM.ask_llm_prompted("hello"), "You asked: hello")
+        client, key, body = self.server.requests[0]
+        self.assertEqual(key, "secret")
+        self.assertEqual(body["custom_prompt"], LLM.DEFAULT_PROMPT)
+
+    def test02_keep_alive(self):
+        '''questions share one connection, and the log tells connecting
+        apart from waiting for the server'''
+        with self.assertLogs(level="INFO") as logs:
+            for i in range(3):
+                self.assertEqual(LLM.ask_llm_prompted("q%d" % i), "You asked: q%d" % i)
+        clients = set(client for client, key, body in self.server.requests)
+        self.assertEqual(len(clients), 1)
+        self.assertNotIn("kept alive", logs.output[0])
+        self.assertIn("kept alive", logs.output[1])
+        self.assertIn("kept alive", logs.output[2])
+
+    def test03_server_error(self):
+        '''server errors make it return False'''
+        self.server.status = 503
+        with self.assertLogs(level="ERROR"):
+            self.assertIs(LLM.ask_llm_prompted("hello"), False)
+
+    def test04_api_key(self):
+        '''the API key is read on the first question; without it nothing
+        is sent'''
+        directory = tempfile.mkdtemp()
+        filename = os.path.join(directory, "API_KEY.txt")
+        with mock.patch.object(LLM, "API_KEY", None), \
+                mock.patch.object(LLM, "API_KEY_FILE", filename):
+            with self.assertLogs(level="ERROR"):
+                self.assertIs(LLM.ask_llm_prompted("hello"), False)
+            self.assertEqual(self.server.requests, [])
+            with open(filename, "w") as f:
+                f.write("from file\n")
+            self.assertEqual(LLM.ask_llm_prompted("hello"), "You asked: hello")
+            self.assertEqual(self.server.requests[0][1], "from file")
+        os.remove(filename)
+        os.rmdir(directory)
+
+
+if __name__ == "__main__":
+    unittest.main()